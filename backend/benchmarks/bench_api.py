@@ -0,0 +1,267 @@
+"""
+End-to-end API benchmark for /index-pdf, /find and /generate-response, runnable fully offline.
+
+By default it starts its own server with PROVIDER_MODE=fake (deterministic stand-ins
+for Gemini, Mistral and the chat model) and VECTOR_BACKEND=numpy, against a local
+MongoDB in a throwaway database. Start one with e.g. `docker run -p 27017:27017 mongo:7`,
+then run from the backend directory:
+
+    python -m benchmarks.bench_api --label after --output bench_after.json
+
+Or point it at a server you started yourself:
+
+    python -m benchmarks.bench_api --url http://localhost:8080 --output bench.json
+
+Each endpoint is driven at every --concurrency level. The JSON output records the
+commit, settings and, per level, throughput and p50/p95/p99 latency, so runs can be
+diffed between commits.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+import PyPDF2
+from pymongo import MongoClient
+
+from benchmarks.load_find import percentile, DEFAULT_QUERIES
+from core.config import FAKE_EMBEDDING_LATENCY_MS, FAKE_OCR_PAGE_LATENCY_MS, \
+                        FAKE_LLM_TTFT_MS, FAKE_LLM_TOKEN_LATENCY_MS
+
+
+def make_pdf(pages: int) -> bytes:
+    """
+    Blank PDF with a unique title, so every upload is new and goes through OCR
+    """
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    writer.add_metadata({"/Title": uuid.uuid4().hex})
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def summarize(name, concurrency, latencies, errors, elapsed, **extra):
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+        **extra,
+    }
+
+
+async def run_level(name, concurrency, count, request):
+    """
+    Run count calls of request(i) with at most concurrency in flight; request returns True on success
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await request(i)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return summarize(name, concurrency, latencies, errors, time.perf_counter() - start)
+
+
+async def bench_index(client, url, concurrency, count, pages, poll_interval):
+    """
+    Upload PDFs and wait for their ingestion jobs; latency is upload to job done
+    """
+    async def request(i):
+        pdf = make_pdf(pages)
+        response = await client.post(f"{url}/index-pdf", files={"file": (f"bench-{i}.pdf", pdf, "application/pdf")})
+        if response.status_code not in (200, 202):
+            return False
+        job_id = response.json().get("job_id")
+        while job_id:
+            job = (await client.get(f"{url}/jobs/{job_id}")).json()
+            if job["status"] == "done":
+                return True
+            if job["status"] == "failed":
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+
+    result = await run_level("index_pdf", concurrency, count, request)
+    result["pages_per_pdf"] = pages
+    result["pages_per_second"] = result["throughput_rps"] * pages
+    return result
+
+
+async def bench_find(client, url, concurrency, count, top_searches):
+    async def request(i):
+        response = await client.get(f"{url}/find", params={
+            "query": DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)],
+            "top_searches": top_searches,
+        })
+        return response.status_code == 200
+
+    return await run_level("find", concurrency, count, request)
+
+
+async def bench_generate(client, url, concurrency, count, top_searches):
+    async def request(i):
+        # A unique suffix keeps the answer cache from serving repeated questions
+        question = f"{DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)]} ({uuid.uuid4().hex[:8]})"
+        response = await client.post(f"{url}/generate-response", json={
+            "messages": [{"role": "user", "content": question}],
+            "top_searches": top_searches,
+        })
+        return response.status_code == 200
+
+    return await run_level("generate_response", concurrency, count, request)
+
+
+def git_commit(cwd=None):
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(port, mongo_uri, work_dir):
+    """
+    Start uvicorn with the offline providers and a throwaway database
+
+    The server runs in work_dir with an empty static directory, so no frontend build is needed.
+    """
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.makedirs(os.path.join(work_dir, "static"), exist_ok=True)
+    env = dict(os.environ)
+    env.update({
+        "PROVIDER_MODE": "fake",
+        "VECTOR_BACKEND": "numpy",
+        "VECTOR_INDEX_PATH": os.path.join(work_dir, "vector_index"),
+        "MONGODB_CONNECTION_STRING": mongo_uri,
+        "MONGODB_DATABASE": f"bench_{uuid.uuid4().hex[:8]}",
+        "MONGODB_COLLECTION": env.get("MONGODB_COLLECTION") or "chunks",
+        "EMBEDDING_MODEL": env.get("EMBEDDING_MODEL") or "fake-embedding",
+        "GEMINI_API_KEY": env.get("GEMINI_API_KEY") or "benchmark",
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", backend_dir,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir,
+        env=env,
+    ), env["MONGODB_DATABASE"]
+
+
+async def wait_ready(client, url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{url}/cache/stats")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout}s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--pdfs", type=int, default=8, help="PDFs uploaded per concurrency level")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per uploaded PDF")
+    parser.add_argument("--requests", type=int, default=100, help="/find and /generate-response calls per level")
+    parser.add_argument("--top-searches", type=int, default=5)
+    parser.add_argument("--endpoints", nargs="+", default=["index_pdf", "find", "generate_response"])
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    server = database = work_dir = None
+    url = args.url
+    if url is None:
+        work_dir = tempfile.mkdtemp(prefix="bench_api_")
+        server, database = start_server(args.port, args.mongo_uri, work_dir)
+        url = f"http://127.0.0.1:{args.port}"
+
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+            await wait_ready(client, url, timeout=60)
+            print(f"{'endpoint':>18}{'concurrency':>12}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    if endpoint == "index_pdf":
+                        result = await bench_index(client, url, concurrency, args.pdfs, args.pages, poll_interval=0.1)
+                    elif endpoint == "find":
+                        result = await bench_find(client, url, concurrency, args.requests, args.top_searches)
+                    elif endpoint == "generate_response":
+                        result = await bench_generate(client, url, concurrency, args.requests, args.top_searches)
+                    else:
+                        raise ValueError(f"Unknown endpoint: {endpoint}")
+                    results.append(result)
+                    print(f"{endpoint:>18}{concurrency:>12}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.1f}"
+                          f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+            with MongoClient(args.mongo_uri) as mongo:
+                mongo.drop_database(database)
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "label": args.label,
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "url": url,
+                "offline": server is not None,
+                "settings": {
+                    "concurrency": args.concurrency,
+                    "pdfs": args.pdfs,
+                    "pages": args.pages,
+                    "requests": args.requests,
+                    "top_searches": args.top_searches,
+                    "fake_latency_ms": {
+                        "embedding": FAKE_EMBEDDING_LATENCY_MS,
+                        "ocr_page": FAKE_OCR_PAGE_LATENCY_MS,
+                        "llm_ttft": FAKE_LLM_TTFT_MS,
+                        "llm_token": FAKE_LLM_TOKEN_LATENCY_MS,
+                    } if server is not None else None,
+                },
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Compare answering N queries with N /find calls against one POST /find/batch request.
+
+Start the server (e.g. PROVIDER_MODE=fake uvicorn main:app --workers 1) with some documents indexed,
+and run from the backend directory:
+
+    python -m benchmarks.bench_find_batch --url http://localhost:8080 --queries 10 100 1000 --output find_batch.json
+
+Queries are distinct variations of a few questions, so neither path is helped by the embedding cache
+unless --repeat is given. Both paths must return the same chunks for each query; mismatches are reported.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.load_find import DEFAULT_QUERIES
+
+
+def make_queries(count, run):
+    return [f"{DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)]} (variant {run}-{i})" for i in range(count)]
+
+
+async def find_each(client, url, queries, concurrency, top_searches):
+    """
+    One GET /find per query, at most `concurrency` in flight
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            response = await client.get(f"{url}/find", params={"query": query, "top_searches": top_searches})
+            response.raise_for_status()
+            return [result.get("chunk_id") for result in response.json()["results"]]
+
+    return await asyncio.gather(*(one(query) for query in queries))
+
+
+async def find_batch(client, url, queries, top_searches):
+    response = await client.post(f"{url}/find/batch", json={"queries": queries, "top_searches": top_searches})
+    response.raise_for_status()
+    body = response.json()
+    return [[result.get("chunk_id") for result in entry["results"]] for entry in body["results"]], body["timings_ms"]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--queries", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--concurrency", type=int, default=16, help="In-flight /find calls for the per-query path")
+    parser.add_argument("--top-searches", type=int, default=5)
+    parser.add_argument("--repeat", action="store_true", help="Reuse the same queries for both paths")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        print(f"{'queries':>8}{'/find ms':>12}{'batch ms':>12}{'speedup':>9}{'embed ms':>10}{'search ms':>11}{'mismatch':>10}")
+        for count in args.queries:
+            single_queries = make_queries(count, "find")
+            batch_queries = single_queries if args.repeat else make_queries(count, "batch")
+
+            start = time.perf_counter()
+            single = await find_each(client, args.url, single_queries, args.concurrency, args.top_searches)
+            single_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            batched, timings = await find_batch(client, args.url, batch_queries, args.top_searches)
+            batch_ms = (time.perf_counter() - start) * 1000
+
+            # Compare rankings on the same texts, now served from the embedding cache
+            check, _ = await find_batch(client, args.url, single_queries, args.top_searches)
+            mismatches = sum(1 for a, b in zip(single, check) if a != b)
+
+            result = {
+                "queries": count,
+                "find_ms": single_ms,
+                "batch_ms": batch_ms,
+                "speedup": single_ms / batch_ms,
+                "batch_timings_ms": timings,
+                "mismatches": mismatches,
+            }
+            results.append(result)
+            print(f"{count:>8}{single_ms:>12.0f}{batch_ms:>12.0f}{result['speedup']:>9.1f}"
+                  f"{timings['embedding']:>10.0f}{timings['search']:>11.0f}{mismatches:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": args.url, "concurrency": args.concurrency, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
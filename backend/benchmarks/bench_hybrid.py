@@ -0,0 +1,189 @@
+"""
+Compare vector-only and hybrid (BM25 + vector, reciprocal rank fusion) retrieval on a fixed query set.
+
+Offline, on a synthetic verse corpus embedded with the deterministic fake embeddings
+(no credentials or database needed). Run from the backend directory:
+
+    python -m benchmarks.bench_hybrid --chunks 20000 --output hybrid.json
+
+Against a live deployment, with a query file and the configured VectorDB (SEARCH_MODE=hybrid
+so the full-text backend is built):
+
+    SEARCH_MODE=hybrid python -m benchmarks.bench_hybrid --queries queries.json --output hybrid.json
+
+The query file is a list of {"query": "...", "expected": ["2:255", ...], "kind": "reference"},
+where expected lists the references of the relevant chunks. Both modes report recall@k and
+p50/p99 latency per query kind for vector-only and hybrid retrieval.
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.load_find import percentile
+from services.fakes import fake_embedding
+from services.lexical_index import BM25Index, reciprocal_rank_fusion, lexical_text
+from services.vector_index import NumpyVectorIndex
+
+NAMES = ["Zaynab", "Methuselah", "Habakkuk", "Ishmael", "Zerubbabel", "Nebuchadnezzar", "Jethro", "Barnabas"]
+STOPWORDS = ["what", "does", "the", "text", "say", "about", "and", "of"]
+
+
+def make_vocabulary(size, rng):
+    syllables = ["ka", "lo", "mi", "ra", "te", "su", "na", "vi", "do", "he", "ba", "qu", "zo", "fe", "ni", "ar"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_corpus(size, rng, chapters=114, vocabulary_size=5000):
+    """
+    Verse-like chunks with a chapter:verse reference and Zipf-distributed words; a few mention a rare proper name
+    """
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    corpus = []
+    verses_per_chapter = max(1, size // chapters)
+    for i in range(size):
+        text = " ".join(rng.choices(vocabulary, weights, k=rng.randint(15, 40))) + "."
+        if rng.random() < 0.02:
+            text = f"{text} {rng.choice(NAMES)} spoke to the people."
+        corpus.append({
+            "id": str(i),
+            "reference": f"{i // verses_per_chapter + 1}:{i % verses_per_chapter + 1}",
+            "text": text,
+        })
+    return corpus
+
+
+def make_queries(corpus, rng, per_kind):
+    """
+    Exact references, rare names and loose paraphrases, each with its relevant references
+    """
+    queries = []
+    for chunk in rng.sample(corpus, per_kind):
+        queries.append({"kind": "reference", "query": chunk["reference"], "expected": [chunk["reference"]]})
+    for name in NAMES[:per_kind]:
+        expected = [chunk["reference"] for chunk in corpus if name in chunk["text"]]
+        if expected:
+            queries.append({"kind": "name", "query": f"Who is {name}?", "expected": expected})
+    for chunk in rng.sample(corpus, per_kind):
+        words = [word.strip(".").lower() for word in chunk["text"].split()]
+        picked = rng.sample(words, min(5, len(words))) + rng.sample(STOPWORDS, 3)
+        rng.shuffle(picked)
+        queries.append({"kind": "paraphrase", "query": " ".join(picked), "expected": [chunk["reference"]]})
+    return queries
+
+
+def recall(found_references, expected, k):
+    """
+    Share of the relevant chunks found, out of at most k that could be returned
+    """
+    expected = set(expected)
+    return len(expected & set(found_references)) / min(len(expected), k)
+
+
+def report(samples):
+    """
+    Mean recall and latency percentiles per query kind and mode
+    """
+    summary = {}
+    for (kind, mode), rows in sorted(samples.items()):
+        latencies = [latency for latency, _ in rows]
+        summary.setdefault(kind, {})[mode] = {
+            "queries": len(rows),
+            "recall": statistics.mean(value for _, value in rows),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    return summary
+
+
+def run_offline(args):
+    rng = random.Random(args.seed)
+    corpus = make_corpus(args.chunks, rng)
+    queries = make_queries(corpus, rng, args.queries_per_kind)
+    reference_of = {chunk["id"]: chunk["reference"] for chunk in corpus}
+
+    work_dir = tempfile.mkdtemp(prefix="bench_hybrid_")
+    try:
+        vectors = NumpyVectorIndex(f"{work_dir}/vectors")
+        lexical = BM25Index(f"{work_dir}/bm25")
+        start = time.perf_counter()
+        ids = [chunk["id"] for chunk in corpus]
+        # Like ingestion, only the chunk text is embedded; the reference is only in the full-text index
+        vectors.add(ids, [fake_embedding(chunk["text"], args.dimensions) for chunk in corpus], [None] * len(ids))
+        lexical.add(ids, [lexical_text(chunk) for chunk in corpus], [None] * len(ids))
+        print(f"Indexed {len(corpus)} chunks in {time.perf_counter() - start:.1f}s")
+
+        samples = {}
+        candidates = args.top_k * args.candidates_factor
+        for query in queries:
+            embedding = fake_embedding(query["query"], args.dimensions)
+
+            start = time.perf_counter()
+            vector_ids = [chunk_id for chunk_id, _ in vectors.search(embedding, args.top_k)]
+            samples.setdefault((query["kind"], "vector"), []).append(
+                (time.perf_counter() - start, recall([reference_of[i] for i in vector_ids], query["expected"], args.top_k)))
+
+            start = time.perf_counter()
+            fused = reciprocal_rank_fusion([
+                [chunk_id for chunk_id, _ in vectors.search(embedding, candidates)],
+                [chunk_id for chunk_id, _ in lexical.search(query["query"], candidates)],
+            ], k=args.rrf_k)[:args.top_k]
+            samples.setdefault((query["kind"], "hybrid"), []).append(
+                (time.perf_counter() - start, recall([reference_of[i] for i, _ in fused], query["expected"], args.top_k)))
+        return report(samples)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def run_live(args):
+    from services.vector_db import VectorDB
+
+    with open(args.queries) as f:
+        queries = json.load(f)
+    vector_db = VectorDB()
+    samples = {}
+    for query in queries:
+        for mode in ("vector", "hybrid"):
+            start = time.perf_counter()
+            results = await vector_db.find(query["query"], args.top_k, mode=mode)
+            elapsed = time.perf_counter() - start
+            samples.setdefault((query.get("kind", "all"), mode), []).append(
+                (elapsed, recall([result.get("reference") for result in results], query["expected"], args.top_k)))
+    return report(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="Query file for a live run; omit for the offline synthetic run")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries-per-kind", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--candidates-factor", type=int, default=4)
+    parser.add_argument("--rrf-k", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_live(args)) if args.queries else run_offline(args)
+
+    print(f"{'kind':>12}{'mode':>8}{'recall@' + str(args.top_k):>11}{'p50 ms':>10}{'p99 ms':>10}")
+    for kind, modes in summary.items():
+        for mode, row in modes.items():
+            print(f"{kind:>12}{mode:>8}{row['recall']:>11.3f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark per-document inserts against bulk insert_many for indexed pages.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_insert --uri mongodb://localhost:27017
+    python -m benchmarks.bench_insert --mongomock
+
+Reports round trips and wall time per 1,000 pages for VectorDB.insert and
+VectorDB.insert_many at a few batch sizes.
+"""
+import argparse
+import os
+import random
+import time
+
+from pymongo import MongoClient, monitoring
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from services.vector_db import VectorDB
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """
+    Count the insert commands sent to the server
+    """
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name == "insert":
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class CountingCollection:
+    """
+    Wrap a mongomock collection and count insert calls, since mongomock sends no commands
+    """
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def insert_one(self, *args, **kwargs):
+        self._counter.count += 1
+        return self._collection.insert_one(*args, **kwargs)
+
+    def insert_many(self, *args, **kwargs):
+        self._counter.count += 1
+        return self._collection.insert_many(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def make_pages(count, dimensions):
+    """
+    Build synthetic OCR pages with random embeddings
+    """
+    return [
+        {
+            "content": f"Synthetic page {i} " * 50,
+            "reference": f"Page {i + 1}",
+            "document_embedding": [random.random() for _ in range(dimensions)],
+        }
+        for i in range(count)
+    ]
+
+
+def run(vector_db, counter, pages, batch_size):
+    """
+    Insert pages one at a time (batch_size=None) or in bulk and measure the cost
+    """
+    vector_db.collection.delete_many({})
+    counter.count = 0
+    start = time.perf_counter()
+    if batch_size is None:
+        for page in pages:
+            vector_db.insert(page)
+    else:
+        vector_db.insert_many(pages, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    scale = 1000 / len(pages)
+    return counter.count * scale, elapsed * scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory mongomock client")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[50, 200, 500, 1000])
+    args = parser.parse_args()
+
+    counter = RoundTripCounter()
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.uri, event_listeners=[counter])
+
+    vector_db = VectorDB(database="benchmark", collection="insert_benchmark", mongodb_client=client)
+    if args.mongomock:
+        vector_db.collection = CountingCollection(vector_db.collection, counter)
+
+    pages = make_pages(args.pages, args.dimensions)
+
+    print(f"{'mode':<22}{'round trips/1k':>16}{'seconds/1k':>14}")
+    round_trips, seconds = run(vector_db, counter, pages, None)
+    print(f"{'insert (one by one)':<22}{round_trips:>16.0f}{seconds:>14.3f}")
+    for batch_size in args.batch_sizes:
+        round_trips, seconds = run(vector_db, counter, pages, batch_size)
+        print(f"{f'insert_many({batch_size})':<22}{round_trips:>16.0f}{seconds:>14.3f}")
+
+    vector_db.collection.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare stored embedding formats: bytes per chunk in BSON and recall@k against full-precision search.
+
+Each configuration (storage format x kept dimensions) is encoded with the same code ingestion
+uses, decoded back, and searched exhaustively; recall is measured against an exact float64
+search over the full vectors. Run from the backend directory:
+
+    python -m benchmarks.bench_quantization --output quantization.json
+
+The default corpus is synthetic: clustered vectors whose variance decays with the dimension
+index, which mimics how Matryoshka-trained models front-load information. For real numbers,
+sample the configured collection (it must still hold array or float32 embeddings):
+
+    python -m benchmarks.bench_quantization --from-collection --size 20000 --output quantization.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_vector_index import exact_top_k
+from services.migrate_embeddings import encoded_size
+from utils.vectors import encode_embedding, decode_embedding, embedding_storage_of
+
+
+def make_corpus(size, dimensions, clusters, rng):
+    """
+    Clustered unit vectors with a decaying per-dimension scale, so leading dimensions carry the most signal
+    """
+    scale = (np.arange(1, dimensions + 1) ** -0.5).astype(np.float64)
+    centers = rng.standard_normal((clusters, dimensions)) * scale
+    assignment = rng.integers(0, clusters, size)
+    vectors = centers[assignment] + 0.6 * rng.standard_normal((size, dimensions)) * scale
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_collection(size, rng):
+    """
+    Sample up to size stored embeddings from the configured collection
+    """
+    from core.config import MONGODB_CONNECTION_STRING, MONGODB_DATABASE, MONGODB_COLLECTION
+    from services.mongo import get_mongo_client
+
+    collection = get_mongo_client(MONGODB_CONNECTION_STRING)[MONGODB_DATABASE][MONGODB_COLLECTION]
+    cursor = collection.aggregate([{"$sample": {"size": size}}, {"$project": {"_id": 0, "document_embedding": 1}}])
+    vectors = []
+    for doc in cursor:
+        value = doc.get("document_embedding")
+        if value is not None and embedding_storage_of(value) != "int8":
+            vectors.append(decode_embedding(value))
+    vectors = np.asarray(vectors, dtype=np.float64)
+    rng.shuffle(vectors)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure(vectors, queries, truth, storage, dimensions, k):
+    """
+    Encode every vector as ingestion would and search the decoded copies
+    """
+    stored = [encode_embedding(vector.tolist(), storage, dimensions) for vector in vectors]
+    bytes_per_chunk = sum(encoded_size(value) for value in stored) / len(stored)
+
+    decoded = np.asarray([decode_embedding(value) for value in stored], dtype=np.float32)
+    decoded /= np.linalg.norm(decoded, axis=1, keepdims=True)
+    kept = decoded.shape[1]
+    query_vectors = np.asarray([decode_embedding(encode_embedding(query.tolist(), "array", dimensions))
+                                for query in queries], dtype=np.float32)
+
+    start = time.perf_counter()
+    found = exact_top_k(decoded, query_vectors, k)
+    elapsed = time.perf_counter() - start
+    hits = sum(len(a & b) for a, b in zip(found, truth))
+    return {
+        "storage": storage,
+        "dimensions": kept,
+        "bytes_per_chunk": bytes_per_chunk,
+        "recall": hits / (len(queries) * k),
+        "search_ms_per_query": elapsed / len(queries) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-collection", action="store_true", help="Sample the configured MongoDB collection")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=768, help="Synthetic corpus dimensions")
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--storage", nargs="+", default=["array", "float32", "int8"])
+    parser.add_argument("--truncate", type=int, nargs="+", default=[0, 512, 256, 128],
+                        help="Kept dimensions to try; 0 keeps them all")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.from_collection:
+        corpus = load_collection(args.size + args.queries, rng)
+    else:
+        corpus = make_corpus(args.size + args.queries, args.dimensions, args.clusters, rng)
+    # Held-out chunks serve as queries, the rest as the searched corpus
+    queries, vectors = corpus[:args.queries], corpus[args.queries:]
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(vectors)} chunks x {vectors.shape[1]} dimensions, {len(queries)} queries")
+
+    results = []
+    print(f"{'storage':>8}{'dims':>6}{'bytes/chunk':>13}{'recall@' + str(args.k):>11}{'ms/query':>10}")
+    for dimensions in args.truncate:
+        if dimensions and dimensions >= vectors.shape[1]:
+            continue
+        for storage in args.storage:
+            result = measure(vectors, queries, truth, storage, dimensions, args.k)
+            results.append(result)
+            print(f"{storage:>8}{result['dimensions']:>6}{result['bytes_per_chunk']:>13.0f}"
+                  f"{result['recall']:>11.3f}{result['search_ms_per_query']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "chunks": len(vectors), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
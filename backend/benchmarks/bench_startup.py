@@ -0,0 +1,135 @@
+"""
+Measure cold-start cost: the time to import the app and the time from process start to the first response.
+
+Every sample runs in a fresh Python process, like a new Cloud Run instance. Run from
+the backend directory:
+
+    python -m benchmarks.bench_startup --runs 10 --label after --output startup_after.json
+
+To compare against an earlier commit, check it out in a worktree and point --app-dir at it:
+
+    git worktree add /tmp/baseline HEAD~1
+    python -m benchmarks.bench_startup --app-dir /tmp/baseline/backend --label before --output startup_before.json
+
+Startup should not touch MongoDB or any model API, so no server is needed. The
+connection string defaults to an unroutable address that fails fast, which
+exposes any startup path that still blocks on the database.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_api import git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(app_dir, work_dir, env):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", f"import sys; sys.path.insert(0, {app_dir!r}); import main"],
+        cwd=work_dir, env=env, check=True, capture_output=True,
+    )
+    return time.perf_counter() - start
+
+
+def measure_first_request(app_dir, work_dir, env, path, timeout):
+    """
+    Seconds from spawning uvicorn until path first answers with a non-5xx status
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", app_dir, "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+                    if response.status < 500:
+                        return time.perf_counter() - start
+            except urllib.error.HTTPError as e:
+                if e.code < 500:
+                    return time.perf_counter() - start
+            except OSError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode} before answering")
+            time.sleep(0.01)
+        raise RuntimeError(f"No response from {path} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def describe(samples):
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "samples_ms": [sample * 1000 for sample in samples],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="Backend directory holding main.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/metrics", help="Endpoint requested as the first request")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    app_dir = os.path.abspath(args.app_dir)
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    os.makedirs(os.path.join(work_dir, "static"), exist_ok=True)
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    env.setdefault("MISTRAL_API_KEY", "benchmark")
+    env.setdefault("MONGODB_CONNECTION_STRING", "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=2000")
+    env.setdefault("MONGODB_DATABASE", "bench_startup")
+    env.setdefault("MONGODB_COLLECTION", "chunks")
+    env.setdefault("EMBEDDING_MODEL", "text-embedding-004")
+
+    try:
+        imports = [measure_import(app_dir, work_dir, env) for _ in range(args.runs)]
+        first_requests = [measure_first_request(app_dir, work_dir, env, args.path, args.timeout)
+                          for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {"import": describe(imports), "first_request": describe(first_requests)}
+    for name, result in results.items():
+        print(f"{name:>14}: median {result['median_ms']:.0f} ms (min {result['min_ms']:.0f}, max {result['max_ms']:.0f})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "label": args.label,
+                "commit": git_commit(cwd=app_dir),
+                "app_dir": app_dir,
+                "path": args.path,
+                "runs": args.runs,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
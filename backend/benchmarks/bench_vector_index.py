@@ -0,0 +1,103 @@
+"""
+Compare local vector indexes against an exact float32 scan on synthetic embeddings.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_vector_index --sizes 10000 100000 1000000 --dimensions 768
+
+For each corpus size this reports recall@k against the exact scan, queries per
+second, and the time to save and reload the index from disk.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from services.vector_index import NumpyVectorIndex, HNSWVectorIndex
+
+
+def make_corpus(size, dimensions, clusters, rng):
+    """
+    Clustered unit vectors, which behave more like real embeddings than uniform noise
+    """
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    assignment = rng.integers(0, clusters, size)
+    vectors = centers[assignment] + 0.5 * rng.standard_normal((size, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def measure(index, ids, queries, truth, k):
+    """
+    Recall@k and queries per second for one index
+    """
+    lookup = {chunk_id: i for i, chunk_id in enumerate(ids)}
+    hits = 0
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        found = {lookup[chunk_id] for chunk_id, _ in index.search(query, k)}
+        hits += len(found & expected)
+    elapsed = time.perf_counter() - start
+    return hits / (len(queries) * k), len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--skip-hnsw", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>9}  {'index':<14}{'recall@k':>10}{'qps':>10}{'build s':>10}{'save s':>9}{'load s':>9}")
+    for size in args.sizes:
+        vectors = make_corpus(size, args.dimensions, args.clusters, rng)
+        queries = make_corpus(args.queries, args.dimensions, args.clusters, rng)
+        ids = [str(i) for i in range(size)]
+        doc_ids = ["benchmark"] * size
+
+        start = time.perf_counter()
+        truth = exact_top_k(vectors, queries, args.k)
+        exact_qps = args.queries / (time.perf_counter() - start)
+        print(f"{size:>9}  {'exact scan':<14}{1.0:>10.3f}{exact_qps:>10.0f}")
+
+        candidates = [("numpy float32", lambda path: NumpyVectorIndex(path, dtype="float32")),
+                      ("numpy int8", lambda path: NumpyVectorIndex(path, dtype="int8"))]
+        if not args.skip_hnsw:
+            candidates.append(("hnsw", lambda path: HNSWVectorIndex(path, args.dimensions)))
+
+        for name, factory in candidates:
+            path = tempfile.mkdtemp(prefix="vector_index_")
+            try:
+                index = factory(path)
+                start = time.perf_counter()
+                for offset in range(0, size, 50000):
+                    index.add(ids[offset:offset + 50000], vectors[offset:offset + 50000], doc_ids[offset:offset + 50000])
+                build = time.perf_counter() - start
+
+                start = time.perf_counter()
+                index.save()
+                save = time.perf_counter() - start
+
+                start = time.perf_counter()
+                index = factory(path)
+                load = time.perf_counter() - start
+
+                recall, qps = measure(index, ids, queries, truth, args.k)
+                print(f"{size:>9}  {name:<14}{recall:>10.3f}{qps:>10.0f}{build:>10.2f}{save:>9.2f}{load:>9.3f}")
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Load test /find at increasing concurrency and report latency percentiles.
+
+Start the server (e.g. uvicorn main:app --workers 1) and run from the backend directory:
+
+    python -m benchmarks.load_find --url http://localhost:8080 --label after --output find_after.json
+
+Run it once against the previous commit with --label before to compare how
+p50/p99 scale with concurrency.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+DEFAULT_QUERIES = [
+    "What is said about patience?",
+    "Who are the people of the cave?",
+    "What does the text say about charity?",
+    "Describe the story of the flood",
+]
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of samples
+    """
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(client, url, queries, concurrency, requests_per_level, top_searches):
+    """
+    Fire requests_per_level /find calls with at most `concurrency` in flight
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(f"{url}/find", params={
+                "query": queries[i % len(queries)],
+                "top_searches": top_searches,
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests_per_level)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests_per_level,
+        "errors": errors,
+        "throughput_rps": requests_per_level / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--top-searches", type=int, default=5)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        print(f"{'concurrency':>12}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for concurrency in args.concurrency:
+            result = await run_level(client, args.url, DEFAULT_QUERIES, concurrency, args.requests, args.top_searches)
+            results.append(result)
+            print(f"{concurrency:>12}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.1f}"
+                  f"{result['p99_ms']:>10.1f}{result['errors']:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"label": args.label, "url": args.url, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,10 @@
-from google import genai
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from services.clients import get_genai_client
 
 path = 'quran.pdf'
 
 
-
-
-
-
+def __getattr__(name):
+    # The client is built on first access, so importing this module does no network I/O
+    if name == "client":
+        return get_genai_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -14,6 +14,8 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 GEMINI_MODEL = "gemini-2.0-flash"
 
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+
 
 SYSTEM_PROMPT = """
 Read the content of the document and put each meaningful content that builds a story in a separate line. 
@@ -23,3 +25,142 @@ I want the output to be of a json format. Do not put any additional words just t
 """
 
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+
+# Batched embedding pipeline used while indexing
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "1.0"))
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "500"))
+
+# MongoDB connection pool, shared by the sync and async clients
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
+# Query embedding cache; EMBEDDING_CACHE_BACKEND may be sqlite:///path/to/file.db or redis://host:port/db
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+EMBEDDING_CACHE_BACKEND = os.getenv("EMBEDDING_CACHE_BACKEND", "")
+
+# Semantic cache for /generate-response answers; RESPONSE_CACHE_SIZE=0 disables it
+# The cache is per process: with several workers an upload or delete only invalidates answers in the worker
+# that handled it, and the others serve stale answers for up to RESPONSE_CACHE_TTL seconds
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+# Uploads are streamed into GridFS in UPLOAD_CHUNK_SIZE pieces. At most UPLOAD_MAX_CONCURRENCY stream at once,
+# files over UPLOAD_MAX_BYTES are refused (413), and new uploads get a 503 while RSS is over UPLOAD_MAX_RSS_MB (0: no limit)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+UPLOAD_MAX_RSS_MB = int(os.getenv("UPLOAD_MAX_RSS_MB", "0"))
+
+# Provider rate limits in requests per minute (0: no limit), one token bucket per provider and model.
+# RATE_LIMIT_BACKEND "mongo" shares each bucket across workers and instances; "local" keeps one per process.
+# Calls queue for a token up to RATE_LIMIT_MAX_WAIT seconds, then fail with a 429.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_COLLECTION = os.getenv("RATE_LIMIT_COLLECTION", "rate_limits")
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "5"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+EMBEDDING_RATE_LIMIT_RPM = float(os.getenv("EMBEDDING_RATE_LIMIT_RPM", "0"))
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+OCR_RATE_LIMIT_RPM = float(os.getenv("OCR_RATE_LIMIT_RPM", "0"))
+
+# Background ingestion jobs
+MONGODB_JOBS_COLLECTION = os.getenv("MONGODB_JOBS_COLLECTION", "ingestion_jobs")
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Vector search backend: "atlas" ($vectorSearch), "numpy" (brute force) or "hnsw" (approximate, needs hnswlib)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas").lower()
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "data/vector_index")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# Local (numpy, hnsw, bm25) indexes live in each worker process. They are checked against the collection on
+# startup and every LOCAL_INDEX_SYNC_INTERVAL seconds (0: startup only), so writes made through another worker
+# show up in this one's searches after at most that delay; use atlas for immediate consistency across workers
+LOCAL_INDEX_SYNC_INTERVAL = float(os.getenv("LOCAL_INDEX_SYNC_INTERVAL", "30"))
+# Dimensions kept from each embedding; below the model's size, embeddings are truncated Matryoshka-style
+EMBEDDINGS_SIZE = int(os.getenv("EMBEDDINGS_SIZE") or 0)
+# Native output size of known embedding models. Vector indexes are built with EMBEDDING_DIMENSIONS, which is
+# EMBEDDINGS_SIZE when set and the model's native size otherwise; 0 means it is unknown, and startup fails
+# with a local VECTOR_BACKEND
+NATIVE_EMBEDDING_DIMENSIONS = {
+    "text-embedding-004": 768,
+    "text-embedding-005": 768,
+    "text-multilingual-embedding-002": 768,
+    "gemini-embedding-001": 3072,
+}
+EMBEDDING_DIMENSIONS = EMBEDDINGS_SIZE or NATIVE_EMBEDDING_DIMENSIONS.get(EMBEDDING_MODEL or "", 0)
+# How document_embedding is stored: "array" (BSON doubles), "float32" or "int8" (BSON binary vectors)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32").lower()
+
+# Retrieval mode: "vector" or "hybrid" (full-text and vector rankings merged with reciprocal rank fusion).
+# LEXICAL_BACKEND is "atlas" ($search index) or "bm25" (local inverted index); it defaults to match VECTOR_BACKEND.
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector").lower()
+LEXICAL_BACKEND = (os.getenv("LEXICAL_BACKEND") or ("atlas" if VECTOR_BACKEND == "atlas" else "bm25")).lower()
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "data/lexical_index")
+MONGODB_TEXT_SEARCH_INDEX_NAME = os.getenv("MONGODB_TEXT_SEARCH_INDEX_NAME", "text_search")
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("HYBRID_CANDIDATES_FACTOR", "4"))
+
+# POST /find/batch: most queries per request, and searches run at once when they cannot be vectorized
+FIND_BATCH_MAX_QUERIES = int(os.getenv("FIND_BATCH_MAX_QUERIES", "1000"))
+FIND_BATCH_CONCURRENCY = int(os.getenv("FIND_BATCH_CONCURRENCY", "16"))
+
+# Chunking during indexing and context assembly for generation
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+# Tokens are counted with tiktoken's cl100k_base, whose BPE file is read from TIKTOKEN_CACHE_DIR (the Docker image
+# ships it) or downloaded; while it cannot be loaded, counts are estimated and loading is retried after this many seconds
+TOKENIZER_RETRY_INTERVAL = float(os.getenv("TOKENIZER_RETRY_INTERVAL", "300"))
+
+# Prompt assembly for /generate-response: input token budget, latest messages always sent verbatim, and older
+# messages folded into a summary remembered per conversation_id (PROMPT_SUMMARY_TOKENS=0 drops them instead)
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+PROMPT_RECENT_MESSAGES = int(os.getenv("PROMPT_RECENT_MESSAGES", "4"))
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "256"))
+PROMPT_SUMMARY_MODEL = os.getenv("PROMPT_SUMMARY_MODEL", GEMINI_MODEL)
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "1024"))
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "86400"))
+
+# Per-page PDF splitting and structured page reads
+PDF_SPLIT_WORKERS = int(os.getenv("PDF_SPLIT_WORKERS") or os.cpu_count() or 1)
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_READ_CONCURRENCY = int(os.getenv("PDF_READ_CONCURRENCY", "8"))
+
+# OCR provider: "hybrid" (local text layer, Mistral for image-only pages), "mistral" or "text_layer"
+OCR_PROVIDER = os.getenv("OCR_PROVIDER", "hybrid").lower()
+OCR_TEXT_LAYER_MIN_CHARS = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "50"))
+
+# Ingestion mode for /index-pdf: "chunks" (OCR text split into token-sized chunks) or "verses" (one record per
+# chapter:verse, extracted by VERSE_MODEL with SYSTEM_PROMPT). Verse hits are returned with VERSE_NEIGHBORS
+# verses on each side, read with range scans on the (chapter, verse) index
+INGESTION_MODE = os.getenv("INGESTION_MODE", "chunks").lower()
+VERSE_MODEL = os.getenv("VERSE_MODEL", GEMINI_MODEL)
+VERSE_NEIGHBORS = int(os.getenv("VERSE_NEIGHBORS", "1"))
+# Each page sent to VERSE_MODEL takes an LLM_RATE_LIMIT_RPM token and is retried VERSE_MAX_RETRIES times on rate
+# limits and server errors; extracted pages are checkpointed every VERSE_CHECKPOINT_PAGES so a retried job skips them
+VERSE_MAX_RETRIES = int(os.getenv("VERSE_MAX_RETRIES", "5"))
+VERSE_RETRY_BASE_DELAY = float(os.getenv("VERSE_RETRY_BASE_DELAY", "1.0"))
+VERSE_CHECKPOINT_PAGES = int(os.getenv("VERSE_CHECKPOINT_PAGES", "10"))
+
+# Per-page PDF slices and thumbnails stored at indexing time (thumbnails need pypdfium2)
+PAGE_PREVIEWS = os.getenv("PAGE_PREVIEWS", "true").lower() in ("1", "true", "yes")
+PAGE_THUMBNAIL_WIDTH = int(os.getenv("PAGE_THUMBNAIL_WIDTH", "320"))
+PAGE_THUMBNAIL_FORMAT = os.getenv("PAGE_THUMBNAIL_FORMAT", "webp").lower()
+
+# Browser cache lifetime for /preview-pdf responses; stored files never change under the same id
+PREVIEW_CACHE_MAX_AGE = int(os.getenv("PREVIEW_CACHE_MAX_AGE", "86400"))
+
+# PROVIDER_MODE=fake swaps Gemini, Mistral and the chat model for deterministic offline stand-ins (services/fakes.py)
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live").lower()
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "50"))
+FAKE_OCR_PAGE_LATENCY_MS = float(os.getenv("FAKE_OCR_PAGE_LATENCY_MS", "200"))
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "300"))
+FAKE_LLM_TOKEN_LATENCY_MS = float(os.getenv("FAKE_LLM_TOKEN_LATENCY_MS", "10"))
@@ -1,19 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from utils.format_request import format_context_list
-from services.embeddings import embeddings_function
-from mistralai import Mistral
-from gridfs import GridFS
+from utils.ranges import RangeNotSatisfiable, parse_range_header, file_etag, etag_matches
+from services.embeddings import embedding_cache, embeddings_function, STORED_EMBEDDING_MODEL
+from services.cache import ResponseCache
+from services.prompt import PromptAssembler, make_llm_summarizer
+from services.metrics import timed, record_cache_lookup, render_metrics, process_rss_bytes, \
+                            UPLOADS_REJECTED, PROMPT_TOKENS
+from services.ingestion import IngestionPipeline
+from services.ocr import make_ocr_provider
+from services.jobs import JobStore, IngestionWorkerPool, serialize_job, DONE
+from services.uploads import store_upload, UploadTooLarge
+from gridfs import GridFS, AsyncGridFSBucket
 from services.vector_db import VectorDB
-from core.config import GEMINI_MODEL, EMBEDDING_MODEL
+from core.config import GEMINI_MODEL, EMBEDDING_MODEL, MONGODB_JOBS_COLLECTION, \
+                        INGESTION_WORKERS, JOB_POLL_INTERVAL, JOB_STALE_AFTER, JOB_MAX_ATTEMPTS, \
+                        CHUNK_MAX_TOKENS, CONTEXT_MAX_TOKENS, OCR_PROVIDER, OCR_TEXT_LAYER_MIN_CHARS, \
+                        RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_THRESHOLD, \
+                        PROVIDER_MODE, PREVIEW_CACHE_MAX_AGE, \
+                        UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES, UPLOAD_MAX_CONCURRENCY, UPLOAD_MAX_RSS_MB, \
+                        PROMPT_MAX_TOKENS, PROMPT_RECENT_MESSAGES, PROMPT_SUMMARY_TOKENS, PROMPT_SUMMARY_MODEL, \
+                        CONVERSATION_CACHE_SIZE, CONVERSATION_CACHE_TTL, FIND_BATCH_MAX_QUERIES, \
+                        INGESTION_MODE, VERSE_NEIGHBORS, LOCAL_INDEX_SYNC_INTERVAL, EMBEDDING_DIMENSIONS, \
+                        VECTOR_BACKEND
 from services.llm_service import LLMService
-from typing import List, Dict
+from utils.tokens import count_tokens, load_tokenizer
+from utils.verses import parse_reference
+from services.rate_limit import RateLimitExceeded
+from typing import Any, List, Dict, Optional, Literal
 from pydantic import BaseModel
-import os
+import asyncio
+import json
+import math
 import time
-from io import BytesIO
+from datetime import datetime
+from contextlib import asynccontextmanager
 from bson.objectid import ObjectId
 from gridfs.errors import NoFile
 from urllib.parse import quote
@@ -22,19 +44,127 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-vector_db = VectorDB()
-fs = GridFS(vector_db.db)
-mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+# Opened by the lifespan, so importing the app neither connects to MongoDB nor loads a local index
+vector_db: VectorDB = None
+fs: GridFS = None
+fs_bucket: AsyncGridFSBucket = None
+job_store: JobStore = None
+ingestion_workers: IngestionWorkerPool = None
 
-llm_service = LLMService(provider="gemini")
+# API clients are created on first use, so startup does no network I/O before serving
+ocr_provider = make_ocr_provider(OCR_PROVIDER, min_chars=OCR_TEXT_LAYER_MIN_CHARS)
+
+llm_service = LLMService(provider="fake" if PROVIDER_MODE == "fake" else "gemini")
+
+# Answers are reused for near-duplicate questions over the same chunks, and dropped when those chunks change
+response_cache = ResponseCache(max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, threshold=RESPONSE_CACHE_THRESHOLD)
+
+# Fits each turn into PROMPT_MAX_TOKENS, summarizing older messages once per conversation
+prompt_assembler = PromptAssembler(
+    summarize=make_llm_summarizer(llm_service, PROMPT_SUMMARY_MODEL, PROMPT_SUMMARY_TOKENS),
+    recent_messages=PROMPT_RECENT_MESSAGES,
+    summary_tokens=PROMPT_SUMMARY_TOKENS,
+    max_conversations=CONVERSATION_CACHE_SIZE,
+    ttl=CONVERSATION_CACHE_TTL,
+)
+
+# Each streaming upload holds about one UPLOAD_CHUNK_SIZE buffer; this bounds how many do at once
+upload_slots = asyncio.Semaphore(UPLOAD_MAX_CONCURRENCY)
+
+class FindBatchRequest(BaseModel):
+    queries: List[str]
+    top_searches: int = 5
+    doc_ids: Optional[List[str]] = None
+    mode: Optional[Literal["vector", "hybrid"]] = None
+
+class FindBatchResult(BaseModel):
+    query: str
+    results: List[Dict[str, Any]]
+    # Milliseconds spent searching for this query alone, in hybrid mode and for vector searches on Atlas.
+    # None for vector searches on a local index (numpy, hnsw), which scores the whole batch in one matrix product;
+    # timings_ms["search"] covers the batch there
+    search_ms: Optional[float] = None
+
+class FindBatchResponse(BaseModel):
+    results: List[FindBatchResult]
+    # embedding, search (including verse expansion) and total milliseconds for the whole batch
+    timings_ms: Dict[str, float]
 
 class GenerateRequest(BaseModel):
     messages: List[Dict[str, str]]
     top_searches: int = 5
     model: str = GEMINI_MODEL
     max_tokens: int = 300
+    doc_ids: Optional[List[str]] = None
+    stream: bool = False
+    context_tokens: int = CONTEXT_MAX_TOKENS
+    prompt_tokens: int = PROMPT_MAX_TOKENS
+    conversation_id: Optional[str] = None
+    search_mode: Optional[Literal["vector", "hybrid"]] = None
+
+def open_stores():
+    """
+    Connect to MongoDB and build the job store and worker pool. Blocking: with a local index backend the
+    VectorDB loads, rebuilds or syncs its index here, so the lifespan runs it in a thread.
+    """
+    global vector_db, fs, fs_bucket, job_store, ingestion_workers
+    vector_db = VectorDB()
+    vector_db.add_change_listener(response_cache.invalidate_documents)
+    fs = GridFS(vector_db.db)
+    fs_bucket = AsyncGridFSBucket(vector_db.async_db)
+    job_store = JobStore(vector_db.async_db[MONGODB_JOBS_COLLECTION])
+    ingestion_workers = IngestionWorkerPool(
+        job_store,
+        IngestionPipeline(vector_db, fs, ocr_provider, job_store),
+        concurrency=INGESTION_WORKERS,
+        poll_interval=JOB_POLL_INTERVAL,
+        stale_after=JOB_STALE_AFTER,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+
+async def ensure_indexes():
+    """
+    Create the secondary indexes in the background; they speed lookups up but requests do not wait for them.
+    """
+    try:
+        await asyncio.to_thread(vector_db.ensure_indexes)
+        await job_store.ensure_indexes()
+    except Exception as e:
+        logger.error(f"Failed to ensure indexes: {e}")
 
-app = FastAPI()
+async def sync_local_index():
+    """
+    Pick up chunks other workers inserted or deleted, when this worker searches a local index.
+    """
+    while True:
+        await asyncio.sleep(LOCAL_INDEX_SYNC_INTERVAL)
+        try:
+            await asyncio.to_thread(vector_db.sync_local_index)
+        except Exception as e:
+            logger.warning(f"Failed to sync the local index with the collection: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A local index is sized from EMBEDDING_DIMENSIONS; the fake embedding client has a fixed default size,
+    # and an Atlas index declares its own in the search index definition
+    if not EMBEDDING_DIMENSIONS and PROVIDER_MODE != "fake" and VECTOR_BACKEND != "atlas":
+        raise RuntimeError(f"Set EMBEDDINGS_SIZE: the embedding size of {EMBEDDING_MODEL!r} is not known")
+    await asyncio.to_thread(open_stores)
+    # Loaded in the background so a missing encoding is logged at startup; /metrics reports rag_tokenizer_approximate
+    tokenizer_task = asyncio.create_task(asyncio.to_thread(load_tokenizer))
+    indexes_task = asyncio.create_task(ensure_indexes())
+    sync_task = asyncio.create_task(sync_local_index()) if LOCAL_INDEX_SYNC_INTERVAL > 0 else None
+    # Workers also pick up jobs left unfinished by a crashed or restarted instance
+    ingestion_workers.start()
+    yield
+    tokenizer_task.cancel()
+    indexes_task.cancel()
+    if sync_task is not None:
+        sync_task.cancel()
+    await ingestion_workers.stop()
+    await asyncio.to_thread(vector_db.save_index)
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
@@ -48,6 +178,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    """
+    Tell clients to back off when a provider's rate limit queue is full, rather than failing with a 500.
+    """
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
 @app.get("/")
 async def read_root():
     return FileResponse("static/index.html")
@@ -56,41 +194,153 @@ async def read_root():
 async def serve_favicon():
     return FileResponse("static/favicon.ico")
 
+def sse_event(event: str, data) -> str:
+    """
+    Format one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/generate-response")
+@timed("http.generate_response")
 async def generate_response(req: GenerateRequest):
+    start = time.perf_counter()
     try:
         # Extract the latest user message
         user_message = next((msg["content"] for msg in reversed(req.messages) if msg["role"] == "user"), None)
         if not user_message:
             raise HTTPException(status_code=400, detail="No user message found in the input")
+        try:
+            vector_db.check_search_mode(req.search_mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Retrieve enough chunks to fill the context budget from the vector database;
+        # a bare verse reference is read from the verse index instead, when verse records exist for it
+        reference = parse_reference(user_message)
+        query_embedding = None
+        search_results = None
+        if reference is not None:
+            search_results = await vector_db.lookup_verses(*reference, doc_ids=req.doc_ids)
+        if not search_results:
+            query_embedding = await asyncio.to_thread(embeddings_function, user_message)
+            candidates = max(req.top_searches, math.ceil(req.context_tokens / CHUNK_MAX_TOKENS))
+            search_results = await vector_db.search(query_embedding, candidates, doc_ids=req.doc_ids,
+                                                    query=user_message, mode=req.search_mode)
+        retrieval_ms = (time.perf_counter() - start) * 1000
+
+        # A near-duplicate question over the same conversation and retrieved chunks gets the stored answer
+        # without assembling a prompt; reference lookups have no query embedding to compare and are not cached
+        use_cache = RESPONSE_CACHE_SIZE > 0 and query_embedding is not None
+        cache_key = None
+        cached = None
+        if use_cache:
+            history = req.messages[:max(i for i, msg in enumerate(req.messages) if msg["role"] == "user")]
+            cache_key = ResponseCache.make_key(req.model, req.max_tokens,
+                                               [result.get("chunk_id") for result in search_results], history,
+                                               budget=(req.prompt_tokens, req.context_tokens),
+                                               conversation_id=req.conversation_id)
+            cached = response_cache.get(cache_key, query_embedding)
+            record_cache_lookup("response", cached is not None)
+
+        if cached is not None:
+            context = cached["context"]
+            references = cached.get("references", [])
+            messages = None
+            source_doc_ids = set()
+            # Usage of the prompt the stored answer was generated from
+            prompt_usage = cached["usage"]
+            # Answers stored in a shared cache before summaries were kept with them have none
+            summary = cached.get("summary", "")
+            # The turn still happened: remember its chunks and summary as assembling its prompt would have
+            prompt_assembler.record_turn(req.messages, search_results, conversation_id=req.conversation_id,
+                                         summary=summary, summarized=prompt_usage["messages_in_summary"],
+                                         messages_kept=prompt_usage["messages_kept"])
+        else:
+            # Fit the conversation and the best chunks that fit the context budget into the prompt budget;
+            # this may call the model to summarize older messages, so it runs off the event loop
+            with timed("prompt_assembly"):
+                prompt = await asyncio.to_thread(
+                    prompt_assembler.assemble,
+                    req.messages,
+                    search_results,
+                    conversation_id=req.conversation_id,
+                    max_tokens=req.prompt_tokens,
+                    context_tokens=req.context_tokens,
+                )
+            context = prompt["context"]
+            references = prompt["references"]
+            messages = prompt["messages"]
+            source_doc_ids = prompt["doc_ids"] | {result.get("doc_id") for result in search_results}
+            prompt_usage = prompt["usage"]
+            summary = prompt["summary"]
+            PROMPT_TOKENS.observe(prompt_usage["prompt_tokens"])
+        usage = dict(prompt_usage)
+        usage["latency_ms"] = {
+            "retrieval": round(retrieval_ms, 1),
+            "prompt_assembly": round((time.perf_counter() - start) * 1000 - retrieval_ms, 1),
+        }
 
+        def finish_usage(answer: str):
+            usage["completion_tokens"] = count_tokens(answer)
+            usage["latency_ms"]["total"] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info(f"Turn used {usage['prompt_tokens']} prompt and {usage['completion_tokens']} completion "
+                        f"tokens in {usage['latency_ms']['total']:.0f} ms ({usage['messages_kept']} messages kept, "
+                        f"{usage['messages_summarized']} summarized, {usage['messages_dropped']} dropped)")
+            return usage
+
+        def cache_answer(answer: str):
+            if use_cache:
+                response_cache.set(cache_key, query_embedding,
+                                   {"response": answer, "context": context, "references": references,
+                                    "usage": prompt_usage, "summary": summary},
+                                   source_doc_ids)
+
+        if req.stream:
+            # Send the context and its sources first, then tokens as they are generated
+            async def event_stream():
+                yield sse_event("context", {"context": context, "references": references})
+                if cached is not None:
+                    yield sse_event("token", {"delta": cached["response"]})
+                    yield sse_event("done", {"cached": True, "usage": finish_usage(cached["response"])})
+                    return
+                stats = {}
+                deltas = []
+                try:
+                    async for delta in llm_service.stream_response(
+                        messages=messages,
+                        model=req.model,
+                        max_tokens=req.max_tokens,
+                        stats=stats
+                    ):
+                        deltas.append(delta)
+                        yield sse_event("token", {"delta": delta})
+                except Exception as e:
+                    logger.error(f"Error while streaming response: {e}")
+                    yield sse_event("error", {"detail": str(e)})
+                    return
+                cache_answer("".join(deltas))
+                stats["usage"] = finish_usage("".join(deltas))
+                yield sse_event("done", stats)
+
+            return StreamingResponse(
+                event_stream(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
 
-        # Retrieve relevant content from the vector database
-        search_results = await vector_db.find(user_message, req.top_searches)
-
-        # Format the retrieved content as context
-        context = format_context_list(search_results)
-
-        system_prompt = f"""You are a helpful AI assistant created by xAI. Use the following context to inform your responses:
-
-                        {context}
-
-                        Instructions:
-                        1. Provide accurate and relevant responses based on the given context.
-                        2. If the context doesn't contain sufficient information to answer, say so clearly.
-                        3. Maintain a neutral and professional tone.
-                        4. Do not make up information not present in the context or your training data.
-                        """
-
-        # Append the context to the conversation
-        messages = req.messages.copy()
-        for msg in messages:
-            if msg["role"] == "user" and msg["content"] == user_message:
-                msg["content"] = user_message
-        messages.append({"role": "system", "content": system_prompt})
+        if cached is not None:
+            return {
+                "response": cached["response"],
+                "context": context,
+                "references": references,
+                "cached": True,
+                "usage": finish_usage(cached["response"]),
+            }
 
         # Generate a response using the LLM service
-        english_response = llm_service.generate_response(
+        generation_start = time.perf_counter()
+        english_response = await asyncio.to_thread(
+            llm_service.generate_response,
             messages=messages,
             model=req.model,
             max_tokens=req.max_tokens
@@ -98,129 +348,279 @@ async def generate_response(req: GenerateRequest):
 
 
         final_response = english_response.content
+        usage["latency_ms"]["generation"] = round((time.perf_counter() - generation_start) * 1000, 1)
+        cache_answer(final_response)
 
         return {
             "response": final_response,
             "context": context,
+            "references": references,
+            "cached": False,
+            "usage": finish_usage(final_response),
         }
 
+    except (HTTPException, RateLimitExceeded):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response from Backend: {str(e)}")
 
 @app.get("/find")
-async def find_vector(query: str, top_searches: int = 5):
+@timed("http.find_vector")
+async def find_vector(query: str, top_searches: int = 5, doc_ids: Optional[List[str]] = Query(None),
+                      mode: Optional[Literal["vector", "hybrid"]] = None):
     if not query:
         raise HTTPException(status_code=400, detail="Query parameter is required")
         
-    result = await vector_db.find(query, top_searches)
+    try:
+        vector_db.check_search_mode(mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = await vector_db.find(query, top_searches, doc_ids=doc_ids, mode=mode)
     return {"results": result}
 
+@app.post("/find/batch", response_model=FindBatchResponse)
+@timed("http.find_batch")
+async def find_batch(req: FindBatchRequest):
+    """
+    Search for many queries in one request: one batched embedding call, then the searches as a batch.
+    """
+    if not req.queries or any(not query for query in req.queries):
+        raise HTTPException(status_code=400, detail="queries must be a non-empty list of non-empty strings")
+    if len(req.queries) > FIND_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {FIND_BATCH_MAX_QUERIES} queries per request")
+
+    try:
+        vector_db.check_search_mode(req.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await vector_db.find_many(req.queries, req.top_searches, doc_ids=req.doc_ids, mode=req.mode)
+
+@app.get("/verses/{reference}")
+@timed("http.get_verses")
+async def get_verses(reference: str, doc_ids: Optional[List[str]] = Query(None), neighbors: int = VERSE_NEIGHBORS):
+    """
+    Look up a verse ("2:255") or a range of verses ("2:255-257") in documents indexed in verse mode,
+    without embedding or vector search.
+    """
+    parsed = parse_reference(reference)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="Reference must look like 'chapter:verse' or 'chapter:first-last'")
+    if neighbors < 0:
+        raise HTTPException(status_code=400, detail="neighbors must not be negative")
+
+    results = await vector_db.lookup_verses(*parsed, doc_ids=doc_ids, neighbors=neighbors)
+    if not any("neighbor_of" not in result for result in results):
+        raise HTTPException(status_code=404, detail=f"Verse {reference} not found")
+    return {"reference": reference, "results": results}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"embeddings": embedding_cache.stats(), "responses": response_cache.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Expose stage timings and counters in the Prometheus text format.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/insert")
+@timed("http.insert_doc")
 async def insert_doc(document: Dict):
-    if vector_db.insert(document):
+    if await vector_db.insert_async(document):
         return {"status": "insert success"}
     return {"status": "insert failed"}
 
 @app.post("/index-pdf")
-async def index_documents(file: UploadFile = File(...)):
-    vector_db.clean_collection()
+@timed("http.index_documents")
+async def index_documents(response: Response, file: UploadFile = File(...),
+                          mode: Literal["chunks", "verses"] = Query(INGESTION_MODE)):
     try:
         # Validate file type
         if file.content_type != "application/pdf":
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-        # Read PDF bytes
-        pdf_bytes = await file.read()
-        logger.info(f"Received PDF: {file.filename}, size: {len(pdf_bytes)} bytes")
-
-        # Save to GridFS
-        with fs.new_file(filename=file.filename, content_type=file.content_type) as grid_out:
-            grid_out.write(pdf_bytes)
-            file_id = grid_out._id
-        logger.info(f"Saved to GridFS with file_id: {file_id}")
-
-        # Process OCR using Mistral AI
-        # Prepare file content as bytes for Mistral upload
-        file_content = BytesIO(pdf_bytes)
-        
-        # Upload the file to Mistral
-        uploaded_file = mistral_client.files.upload(
-            file={
-                "file_name": file.filename,
-                "content": file_content.getvalue(),  # Get bytes from BytesIO
-            },
-            purpose="ocr"
-        )
-        logger.info(f"Uploaded to Mistral, file ID: {uploaded_file.id}")
-
-        # Retrieve signed URL from Mistral
-        signed_url = mistral_client.files.get_signed_url(file_id=uploaded_file.id)
-
-        # Perform OCR processing using the signed URL
-        ocr_response = mistral_client.ocr.process(
-            model="mistral-ocr-latest",
-            document={
-                "type": "document_url",
-                "document_url": signed_url.url  # Access URL as attribute
-            }
-        )
-        logger.info("OCR processed successfully using signed URL")
-
-        page_count = 0
-        if hasattr(ocr_response, 'pages'):
-            for idx, page in enumerate(ocr_response.pages):
-                text = page.text if hasattr(page, 'text') else str(page)
-                reference = f"Page {idx + 1}"
-                embeddings = embeddings_function(
-                    text=text
-                )
-                document = {
-                    "content": text,
-                    "reference": reference,
-                    "document_embedding": embeddings
+        # Stream the upload into GridFS, fingerprinting it on the way, so it is never held in memory whole
+        if UPLOAD_MAX_RSS_MB and process_rss_bytes() > UPLOAD_MAX_RSS_MB * 1024 * 1024:
+            UPLOADS_REJECTED.labels("memory").inc()
+            raise HTTPException(status_code=503, detail="Server is busy, retry the upload shortly",
+                                headers={"Retry-After": "5"})
+        async with upload_slots:
+            with timed("gridfs_write"):
+                try:
+                    file_id, size, file_hash, existing_file = await store_upload(
+                        fs_bucket, vector_db.async_db["fs.files"], file, file.filename, file.content_type,
+                        UPLOAD_MAX_BYTES, UPLOAD_CHUNK_SIZE)
+                except UploadTooLarge as e:
+                    UPLOADS_REJECTED.labels("size").inc()
+                    raise HTTPException(status_code=413, detail=str(e))
+        logger.info(f"Received PDF: {file.filename}, size: {size} bytes, sha256: {file_hash}, stored as {file_id}")
+
+        # Skip OCR and embedding entirely when these exact bytes are already indexed with the current model;
+        # store_upload kept only the copy stored first
+        if existing_file is not None:
+            active_job = await job_store.find_active(str(file_id), mode)
+            if active_job is not None:
+                response.status_code = 202
+                return {
+                    "message": "PDF is already being indexed",
+                    "filename": file.filename,
+                    "size": size,
+                    "mode": mode,
+                    "file_id": str(file_id),
+                    "job_id": str(active_job["_id"]),
+                    "status": "queued",
+                    "file_details": {
+                        "id": str(file_id),
+                        "filename": existing_file["filename"]
+                    }
                 }
-                vector_db.insert(document)
-                page_count += 1
-                time.sleep(0.5)  # Optional delay to avoid overwhelming the DB
-        else:
-            # Fallback for single page or different structure
-            text = str(ocr_response)
-            embeddings = embeddings_function(
-                text=text
+            indexed_chunks = await asyncio.to_thread(vector_db.get_indexed_chunks, str(file_id),
+                                                   STORED_EMBEDDING_MODEL, mode)
+            await asyncio.to_thread(
+                vector_db.db["fs.files"].update_one,
+                {"_id": file_id},
+                {"$set": {"metadata.last_uploaded_at": datetime.now()}}
             )
-            document = {
-                "content": text,
-                "reference": "Page 1",
-                "document_embedding": embeddings
-            }
-            vector_db.insert(document)
-            page_count = 1
+            # Only a completed job whose chunks are all still stored counts as indexed; a job that failed
+            # part-way leaves some chunks behind, and a new job resumes from them
+            latest_job = await job_store.find_latest(str(file_id), mode)
+            expected_chunks = ((latest_job or {}).get("result") or {}).get("chunk_count")
+            if indexed_chunks and latest_job is not None and latest_job["status"] == DONE \
+                    and len(indexed_chunks) >= (expected_chunks or 0):
+                logger.info(f"PDF {file_hash} already indexed as {file_id}, skipping OCR and embedding")
+                return {
+                    "message": "PDF already indexed",
+                    "filename": file.filename,
+                    "size": size,
+                    "mode": mode,
+                    "page_count": len({page for page, _ in indexed_chunks}),
+                    "chunk_count": len(indexed_chunks),
+                    "reused_count": len(indexed_chunks),
+                    "file_id": str(file_id),
+                    "job_id": None,
+                    "status": "indexed",
+                    "file_details": {
+                        "id": str(file_id),
+                        "filename": existing_file["filename"]
+                    }
+                }
+            # Stored bytes are reused; only chunks from another embedding model, size or format, or from the other
+            # ingestion mode are replaced
+            await asyncio.to_thread(vector_db.delete_stale_chunks, str(file_id), STORED_EMBEDDING_MODEL, mode)
+            logger.info(f"PDF {file_hash} stored as {file_id} but not fully indexed with {STORED_EMBEDDING_MODEL} in {mode} mode "
+                        f"({len(indexed_chunks)} chunks stored), indexing the rest")
+        else:
+            latest_job = None
 
-        # Ensure all IDs are serialized properly
-        response = {
-            "message": "PDF processed successfully",
+        # OCR, embedding and insertion run in the background job workers
+        resume_from = latest_job if latest_job is not None and latest_job["status"] != DONE else None
+        job_id = await job_store.create(str(file_id), file.filename, size, file_hash, mode, resume_from=resume_from)
+        ingestion_workers.notify()
+        logger.info(f"Queued ingestion job {job_id} for file_id: {file_id}")
+
+        response.status_code = 202
+        return {
+            "message": "PDF queued for indexing",
             "filename": file.filename,
-            "size": len(pdf_bytes),
-            "page_count": page_count,
+            "size": size,
+            "mode": mode,
             "file_id": str(file_id),  # Convert MongoDB ObjectId to string
-            "ocr_result_id": str(uploaded_file.id),  # Ensure Mistral file ID is a string
-            "status": "indexed",
+            "job_id": job_id,
+            "status": "queued",
             "file_details": {
                 "id": str(file_id),  # Use MongoDB file_id, converted to string
-                "filename": file.filename  # No need for hasattr check here, file.filename is always available
+                "filename": file.filename
             }
         }
-        logger.info(f"PDF processing completed: {response}")
-        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
-    
-    
+
+@app.get("/jobs/{job_id}")
+@timed("http.get_job")
+async def get_job(job_id: str):
+    """
+    Report an ingestion job's stage, progress and throughput.
+    """
+    job = await job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+@app.delete("/documents/{doc_id}")
+@timed("http.delete_document")
+async def delete_document(doc_id: str):
+    """
+    Delete one document's chunks and its stored PDF without touching other documents.
+    """
+    if not ObjectId.is_valid(doc_id):
+        raise HTTPException(status_code=400, detail="Invalid file ID format")
+
+    def delete_stored_files():
+        # Derived files such as stored OCR output reference their document in metadata.doc_id
+        for grid_out in fs.find({"metadata.doc_id": doc_id}):
+            fs.delete(grid_out._id)
+        fs.delete(ObjectId(doc_id))
+
+    # Stop indexing first, so a running job does not insert chunks for the deleted document
+    cancelled_jobs = await job_store.cancel(doc_id)
+    deleted_chunks = await asyncio.to_thread(vector_db.delete_document, doc_id)
+    await asyncio.to_thread(delete_stored_files)
+    await asyncio.to_thread(vector_db.save_index)
+    logger.info(f"Deleted document {doc_id}: {deleted_chunks} chunks, {cancelled_jobs} ingestion jobs cancelled")
+    return {"status": "deleted", "doc_id": doc_id, "deleted_chunks": deleted_chunks, "cancelled_jobs": cancelled_jobs}
+
+async def serve_page_preview(file_id: str, page: int, kind: str, request: Request):
+    """
+    Serve a per-page file stored at indexing time. They never change, so browsers may cache them for a year.
+    """
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=400, detail="Invalid file ID format")
+    if page < 1:
+        raise HTTPException(status_code=400, detail="Pages are numbered from 1")
+
+    cursor = fs_bucket.find({"metadata.doc_id": file_id, "metadata.kind": kind, "metadata.page": page}, limit=1)
+    grid_out = next(iter(await cursor.to_list()), None)
+    if grid_out is None:
+        raise HTTPException(status_code=404, detail=f"No stored {kind} for page {page} of this document")
+
+    etag = file_etag(grid_out._id, md5=grid_out.md5, upload_date=grid_out.upload_date, length=grid_out.length)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = f'inline; filename="{grid_out.filename}"'
+    return Response(content=await grid_out.read(), media_type=grid_out.metadata.get("content_type"), headers=headers)
+
+@app.get("/preview-pdf/{file_id}/page/{page}")
+@timed("http.preview_page")
+async def preview_page(file_id: str, page: int, request: Request):
+    """
+    A single page of a PDF as a one-page PDF, so a search result can be shown without the whole file.
+    """
+    return await serve_page_preview(file_id, page, "page", request)
+
+@app.get("/preview-pdf/{file_id}/page/{page}/thumbnail")
+@timed("http.preview_thumbnail")
+async def preview_thumbnail(file_id: str, page: int, request: Request):
+    """
+    A small image of a PDF page, rendered at indexing time.
+    """
+    return await serve_page_preview(file_id, page, "thumbnail", request)
+
 @app.get("/preview-pdf/{file_id}")
-async def preview_pdf(file_id: str):
+@timed("http.preview_pdf")
+async def preview_pdf(file_id: str, request: Request):
     """
     Stream a PDF file from GridFS using the file ID.
+    Supports single byte ranges (206 Partial Content), so viewers can fetch only the pages they
+    display, and ETag revalidation (304 Not Modified).
     """
     try:
         # Validate file_id
@@ -230,35 +630,67 @@ async def preview_pdf(file_id: str):
         file_id_obj = ObjectId(file_id)
 
         # Retrieve the file from GridFS
-        grid_file = fs.get(file_id_obj)
-
-        # Stream the PDF in chunks
-        def stream_pdf():
-            chunk_size = 8192  # 8KB chunks
-            while True:
-                data = grid_file.read(chunk_size)
-                if not data:
-                    break
-                yield data
+        grid_file = await fs_bucket.open_download_stream(file_id_obj)
+        length = int(grid_file.length)
+        etag = file_etag(file_id, md5=grid_file.md5, upload_date=grid_file.upload_date, length=length)
 
         # Safely encode filename for Content-Disposition header
         filename_encoded = quote(grid_file.filename)
         content_disposition = f'inline; filename="{grid_file.filename}"; filename*=UTF-8\'\'{filename_encoded}'
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={PREVIEW_CACHE_MAX_AGE}",
+            "Content-Disposition": content_disposition,
+        }
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            await grid_file.close()
+            return Response(status_code=304, headers=headers)
+
+        # A Range is only honoured while the client's copy (If-Range) is still current
+        if_range = request.headers.get("if-range")
+        try:
+            byte_range = parse_range_header(request.headers.get("range"), length) \
+                if not if_range or if_range.strip() == etag else None
+        except RangeNotSatisfiable:
+            await grid_file.close()
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                                headers={"Content-Range": f"bytes */{length}"})
+        start, end = byte_range or (0, length - 1)
+
+        # Seek to the first requested byte and stream whole GridFS chunks from there,
+        # trimming only the last one, without blocking the event loop
+        async def stream_pdf():
+            try:
+                await grid_file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = await grid_file.readchunk()
+                    if not data:
+                        break
+                    if len(data) > remaining:
+                        data = data[:remaining]
+                    remaining -= len(data)
+                    yield data
+            finally:
+                await grid_file.close()
+
+        headers["Content-Length"] = str(end - start + 1 if length else 0)
+        if byte_range is not None:
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
 
         # Return streaming response
         return StreamingResponse(
             stream_pdf(),
+            status_code=206 if byte_range is not None else 200,
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": content_disposition,
-                "Content-Length": str(grid_file.length),
-            }
+            headers=headers,
         )
 
     except NoFile:
         raise HTTPException(status_code=404, detail="File not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving PDF: {str(e)}")
-    finally:
-        if 'grid_file' in locals():
-            grid_file.close()
\ No newline at end of file
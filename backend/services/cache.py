@@ -0,0 +1,431 @@
+"""
+Caching layers for remote model calls: an in-process LRU with TTL plus optional shared backends,
+and single-flight coalescing of identical calls that are still in flight
+"""
+from collections import OrderedDict
+import asyncio
+import numpy as np
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so trivially different spellings of the same question share a cache entry
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.casefold().split())
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a size limit and per-entry TTL
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        """
+        :param max_size: Maximum number of entries kept before the least recently used is evicted.
+        :param ttl: Seconds an entry stays valid; 0 disables expiry.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None when missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Store value under key, evicting the least recently used entries when full
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        Remove key from the cache if present
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_if(self, predicate):
+        """
+        Remove every entry whose value matches predicate
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            keys = [key for key, (value, _) in self._entries.items() if predicate(value)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Hit/miss counters and current size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteCacheBackend:
+    """
+    Shared cache stored in a local SQLite file, usable by every worker on the same host
+
+    Expired rows are skipped on read and deleted every purge_every writes, so the file does not keep growing.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, purge_every: int = 256):
+        """
+        :param path: SQLite database file.
+        :param ttl: Seconds an entry stays valid; 0 disables expiry.
+        :param purge_every: Writes between deletions of expired rows; 0 disables purging.
+        """
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        self._connection.commit()
+        self.purge()
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at and expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._connection.commit()
+            self._writes += 1
+            purge = self.purge_every and self._writes % self.purge_every == 0
+        if purge:
+            self.purge()
+
+    def purge(self) -> int:
+        """
+        Delete expired rows
+        Returns:
+            int: Number of rows deleted
+        """
+        with self._lock:
+            deleted = self._connection.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            ).rowcount
+            self._connection.commit()
+        if deleted:
+            logger.info(f"Purged {deleted} expired cache entries")
+        return deleted
+
+
+class RedisCacheBackend:
+    """
+    Shared cache stored in Redis, usable across hosts
+    """
+
+    def __init__(self, url: str, ttl: float = 3600):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis package is required for a redis:// cache backend") from e
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self._client.set(key, json.dumps(value), ex=int(self.ttl) if self.ttl else None)
+
+
+def make_cache_backend(url: str, ttl: float = 3600):
+    """
+    Build a shared cache backend from a URL such as sqlite:///data/cache.db or redis://host:6379/0
+
+    Returns None when url is empty, leaving only the in-process cache.
+    """
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteCacheBackend(url[len("sqlite:///"):], ttl=ttl)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url, ttl=ttl)
+    raise ValueError(f"Unsupported cache backend URL: {url}")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one: the first caller runs the function and the
+    others wait for its result (or exception) instead of making the same upstream call again
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.shared = 0
+
+    def do(self, key, func):
+        """
+        Run func() for the first caller of key, from any thread, and hand its outcome to concurrent callers
+        Returns:
+            tuple: (value, shared) where shared is True when the value came from another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "value": None, "error": None}
+        if not leader:
+            call["done"].wait()
+            with self._lock:
+                self.shared += 1
+            if call["error"] is not None:
+                raise call["error"]
+            return call["value"], True
+        try:
+            call["value"] = func()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["value"], False
+
+    async def do_async(self, key, func):
+        """
+        Await func() for the first caller of key on the event loop, and share it with concurrent callers
+        Returns:
+            tuple: (value, shared) as for do()
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            self.shared += 1
+            # Shield the shared call so one waiter going away does not cancel it for the others
+            return await asyncio.shield(task), True
+        task = self._tasks[key] = asyncio.ensure_future(func())
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task), False
+
+
+class EmbeddingCache:
+    """
+    Two-level cache for embeddings keyed by model name, task type and normalized text
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, backend=None):
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.backend = backend
+        self.backend_hits = 0
+        self.backend_errors = 0
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"embedding:{model}:{task_type}:{digest}"
+
+    def get(self, model: str, task_type: str, text: str):
+        """
+        Look the embedding up locally first, then in the shared backend
+        """
+        key = self.make_key(model, task_type, text)
+        value = self.local.get(key)
+        if value is not None or self.backend is None:
+            return value
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Embedding cache backend read failed: {e}")
+            return None
+        if value is not None:
+            self.backend_hits += 1
+            self.local.set(key, value)
+        return value
+
+    def set(self, model: str, task_type: str, text: str, value):
+        key = self.make_key(model, task_type, text)
+        self.local.set(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning(f"Embedding cache backend write failed: {e}")
+
+    def stats(self):
+        stats = self.local.stats()
+        stats["backend"] = type(self.backend).__name__ if self.backend else None
+        stats["backend_hits"] = self.backend_hits
+        stats["backend_errors"] = self.backend_errors
+        return stats
+
+
+class ResponseCache:
+    """
+    Semantic cache for generated answers
+
+    Entries are grouped under a key built from the model, max_tokens, the prompt budget, the earlier conversation
+    and its conversation_id, whose remembered state also shapes the prompt, and the ids of the retrieved chunks,
+    so a lookup needs no prompt assembly. Within a group, a lookup hits when
+    the query embedding is at least threshold cosine similar to a stored one, so near-duplicate questions over
+    the same context reuse the stored answer.
+
+    Entries live in this process only: each worker has its own cache, and invalidation after an upload or delete
+    only reaches the worker that made the change. Keep RESPONSE_CACHE_TTL short when running several workers.
+    """
+
+    def __init__(self, max_size: int = 512, ttl: float = 3600, threshold: float = 0.95, entries_per_key: int = 8):
+        """
+        :param max_size: Maximum number of groups kept before the least recently used is evicted.
+        :param ttl: Seconds a group stays valid; 0 disables expiry.
+        :param threshold: Minimum cosine similarity between query embeddings for a hit.
+        :param entries_per_key: Maximum number of answers kept per group; the oldest is dropped first.
+        """
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.threshold = threshold
+        self.entries_per_key = entries_per_key
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(model: str, max_tokens: int, chunk_ids, history, budget=None, conversation_id: str = None) -> str:
+        """
+        :param chunk_ids: Ids of the chunks retrieved for the question.
+        :param budget: Prompt and context token budgets the answer was assembled with.
+        :param conversation_id: Conversation whose remembered summary and earlier chunks went into the prompt.
+        """
+        payload = json.dumps([model, max_tokens, sorted(map(str, chunk_ids)), history, budget, conversation_id],
+                             sort_keys=True, default=str)
+        return f"response:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, key: str, embedding):
+        """
+        Return the stored answer for the closest query in the group, or None below the threshold
+        """
+        group = self.local.get(key)
+        best = None
+        if group is not None:
+            query = self._unit(embedding)
+            with self._lock:
+                scored = [(float(np.dot(query, vector)), value) for vector, value in group["entries"]]
+            if scored:
+                score, value = max(scored, key=lambda item: item[0])
+                if score >= self.threshold:
+                    best = value
+        with self._lock:
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best
+
+    def set(self, key: str, embedding, value, doc_ids):
+        """
+        Store an answer for a query embedding, remembering which documents its context came from
+        """
+        group = self.local.get(key) or {"doc_ids": set(), "entries": []}
+        with self._lock:
+            group["doc_ids"].update(doc_id for doc_id in doc_ids if doc_id)
+            group["entries"].append((self._unit(embedding), value))
+            del group["entries"][:-self.entries_per_key]
+        self.local.set(key, group)
+
+    def invalidate_documents(self, doc_ids=None):
+        """
+        Drop every answer built from chunks of the given documents, or all answers when doc_ids is None
+        """
+        if doc_ids is None:
+            removed = len(self.local)
+            self.local.clear()
+        else:
+            doc_ids = set(doc_ids)
+            removed = self.local.discard_if(lambda group: not group["doc_ids"].isdisjoint(doc_ids))
+        if removed:
+            self.invalidations += removed
+            logger.info(f"Invalidated {removed} cached responses")
+
+    def stats(self):
+        stats = self.local.stats()
+        lookups = self.hits + self.misses
+        stats.update({
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "threshold": self.threshold,
+        })
+        return stats
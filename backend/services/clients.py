@@ -0,0 +1,62 @@
+"""
+Shared API clients, built on first use and reused for the life of the process
+
+The Gemini, Mistral and OpenAI SDKs are imported inside the getters, so importing the app does not pay
+for them and a cold start can serve its first request before any of them is needed.
+"""
+from functools import lru_cache
+from core.config import GEMINI_API_KEY, GEMINI_BASE_URL, MISTRAL_API_KEY, EMBEDDING_DIMENSIONS, PROVIDER_MODE, \
+                        FAKE_EMBEDDING_LATENCY_MS, FAKE_OCR_PAGE_LATENCY_MS, \
+                        FAKE_LLM_TTFT_MS, FAKE_LLM_TOKEN_LATENCY_MS
+
+
+@lru_cache
+def get_genai_client():
+    """
+    Get the process-wide Gemini client used for embeddings
+    """
+    if PROVIDER_MODE == "fake":
+        from services.fakes import FakeGenAIClient
+        return FakeGenAIClient(dimensions=EMBEDDING_DIMENSIONS or 768, latency_ms=FAKE_EMBEDDING_LATENCY_MS)
+    from google import genai
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+
+@lru_cache
+def get_mistral_client():
+    """
+    Get the process-wide Mistral client used for OCR
+    """
+    if PROVIDER_MODE == "fake":
+        from services.fakes import FakeMistralClient
+        return FakeMistralClient(page_latency_ms=FAKE_OCR_PAGE_LATENCY_MS)
+    from mistralai import Mistral
+    return Mistral(api_key=MISTRAL_API_KEY)
+
+
+@lru_cache
+def get_chat_client(provider: str):
+    """
+    Get the process-wide OpenAI-compatible chat client for an LLM provider ("gemini" or "fake")
+    """
+    if provider == "fake":
+        from services.fakes import FakeOpenAIClient
+        return FakeOpenAIClient(ttft_ms=FAKE_LLM_TTFT_MS, token_latency_ms=FAKE_LLM_TOKEN_LATENCY_MS)
+    if provider == "gemini":
+        from openai import OpenAI
+        return OpenAI(api_key=GEMINI_API_KEY, base_url=GEMINI_BASE_URL)
+    raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+@lru_cache
+def get_async_chat_client(provider: str):
+    """
+    Get the process-wide async chat client for an LLM provider, used for streaming
+    """
+    if provider == "fake":
+        from services.fakes import FakeAsyncOpenAIClient
+        return FakeAsyncOpenAIClient(ttft_ms=FAKE_LLM_TTFT_MS, token_latency_ms=FAKE_LLM_TOKEN_LATENCY_MS)
+    if provider == "gemini":
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=GEMINI_API_KEY, base_url=GEMINI_BASE_URL)
+    raise ValueError(f"Unsupported LLM provider: {provider}")
@@ -1,24 +1,171 @@
-from google import genai
-from google.genai import types
+import asyncio
+import logging
 
-from dotenv import load_dotenv
-load_dotenv()
-import os
+from core.config import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY, \
+                        EMBEDDING_MAX_RETRIES, EMBEDDING_RETRY_BASE_DELAY, \
+                        EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_BACKEND, \
+                        EMBEDDING_MODEL, EMBEDDINGS_SIZE, EMBEDDING_RATE_LIMIT_RPM, EMBEDDING_STORAGE
+from utils.vectors import truncate_embedding, embedding_key
+from services.clients import get_genai_client
+from services.cache import EmbeddingCache, SingleFlight, make_cache_backend
+from services.metrics import timed, record_cache_lookup, COALESCED_CALLS
+from services.rate_limit import call_with_retry, get_rate_limiter
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+logger = logging.getLogger(__name__)
 
+EMBEDDING_TASK_TYPE = "SEMANTIC_SIMILARITY"
+
+# Cached vectors are only valid for the dimensions they were truncated to
+EMBEDDING_CACHE_MODEL = f"{EMBEDDING_MODEL}@{EMBEDDINGS_SIZE}" if EMBEDDINGS_SIZE else EMBEDDING_MODEL
+
+# Stored in each chunk's embedding_model: stored vectors are only reused for the same model, dimensions and format
+STORED_EMBEDDING_MODEL = embedding_key(EMBEDDING_MODEL, EMBEDDINGS_SIZE, EMBEDDING_STORAGE)
+
+# Query embeddings repeat constantly, so cache hits skip the Gemini call entirely
+embedding_cache = EmbeddingCache(
+    max_size=EMBEDDING_CACHE_SIZE,
+    ttl=EMBEDDING_CACHE_TTL,
+    backend=make_cache_backend(EMBEDDING_CACHE_BACKEND, ttl=EMBEDDING_CACHE_TTL),
+)
+
+# Identical queries arriving together wait for the first one's Gemini call instead of making their own
+embedding_calls = SingleFlight()
+
+def _embed_content(contents):
+    """
+    One embed_content call on the shared Gemini client, created on first use, returning one vector per input.
+    With EMBEDDINGS_SIZE set, the model is asked for that many dimensions and the vectors are
+    truncated and renormalized locally as well, since not every model returns unit vectors.
+    """
+    from google.genai import types
+    get_rate_limiter("gemini", EMBEDDING_MODEL, EMBEDDING_RATE_LIMIT_RPM).acquire()
+    result = get_genai_client().models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=contents,
+            config=types.EmbedContentConfig(task_type=EMBEDDING_TASK_TYPE,
+                                            output_dimensionality=EMBEDDINGS_SIZE or None)
+    )
+    return [truncate_embedding(embedding.values, EMBEDDINGS_SIZE) for embedding in result.embeddings]
+
+@timed("query_embedding")
 def embeddings_function(text):
     """
     This function takes a string input and returns its embeddings using the Gemini API.
+    Results are cached by model, task type and normalized text, and concurrent calls for the same
+    text share one Gemini call.
     Args:
         text (str): The input string to be embedded.
     Returns:
         list: The embeddings of the input string.
         
     """
-    result = client.models.embed_content(
-            model=os.getenv("EMBEDDING_MODEL"),
-            contents=text,
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY")
-    )
-    return result.embeddings[0].values
\ No newline at end of file
+    cached = embedding_cache.get(EMBEDDING_CACHE_MODEL, EMBEDDING_TASK_TYPE, text)
+    record_cache_lookup("embedding", cached is not None)
+    if cached is not None:
+        return cached
+
+    def embed():
+        embedding = _embed_content(text)[0]
+        embedding_cache.set(EMBEDDING_CACHE_MODEL, EMBEDDING_TASK_TYPE, text, embedding)
+        return embedding
+
+    key = EmbeddingCache.make_key(EMBEDDING_CACHE_MODEL, EMBEDDING_TASK_TYPE, text)
+    embedding, shared = embedding_calls.do(key, embed)
+    if shared:
+        COALESCED_CALLS.labels("embedding").inc()
+    return embedding
+
+@timed("query_embedding_batch")
+def embed_queries(texts, batch_size: int = EMBEDDING_BATCH_SIZE):
+    """
+    Embed several query strings, sending every uncached one to Gemini in a single call per batch_size texts.
+    Args:
+        texts (list): The query strings to be embedded.
+        batch_size (int): Most strings sent per embed_content call.
+    Returns:
+        list: One embedding per query string, in the same order.
+    """
+    embeddings = [None] * len(texts)
+    missing = {}
+    for i, text in enumerate(texts):
+        cached = embedding_cache.get(EMBEDDING_CACHE_MODEL, EMBEDDING_TASK_TYPE, text)
+        record_cache_lookup("embedding", cached is not None)
+        if cached is not None:
+            embeddings[i] = cached
+        else:
+            missing.setdefault(text, []).append(i)
+
+    pending = list(missing)
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        for text, embedding in zip(batch, _embed_content(batch)):
+            embedding_cache.set(EMBEDDING_CACHE_MODEL, EMBEDDING_TASK_TYPE, text, embedding)
+            for i in missing[text]:
+                embeddings[i] = embedding
+    return embeddings
+
+@timed("embedding_batch")
+def embed_batch(texts):
+    """
+    Embed several strings with a single Gemini API call.
+    Args:
+        texts (list): The input strings to be embedded.
+    Returns:
+        list: One embedding per input string, in the same order.
+    """
+    return _embed_content(list(texts))
+
+async def _embed_batch_with_retry(texts, semaphore, max_retries):
+    """
+    Embed one batch in a worker thread, backing off exponentially on rate limits.
+    """
+    return await call_with_retry(embed_batch, texts, max_retries=max_retries, base_delay=EMBEDDING_RETRY_BASE_DELAY,
+                                 semaphore=semaphore, description=f"Embedding batch of {len(texts)}")
+
+async def iter_embedding_batches(texts, batch_size: int = EMBEDDING_BATCH_SIZE,
+                                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+                                 max_retries: int = EMBEDDING_MAX_RETRIES):
+    """
+    Embed many strings in batches, several batches at a time, yielding each batch as soon as it is ready.
+    The blocking API calls run in worker threads so the event loop stays free.
+    Args:
+        texts (list): The input strings to be embedded.
+        batch_size (int): Number of strings sent per embed_content call.
+        max_concurrency (int): Maximum number of batches in flight at once.
+        max_retries (int): Retries per batch on rate limit or server errors.
+    Yields:
+        tuple: (start, embeddings) where start is the index of the batch's first string in texts.
+    """
+    texts = list(texts)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(start):
+        batch = texts[start:start + batch_size]
+        return start, await _embed_batch_with_retry(batch, semaphore, max_retries)
+
+    tasks = [asyncio.create_task(run(start)) for start in range(0, len(texts), batch_size)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def embed_documents(texts, batch_size: int = EMBEDDING_BATCH_SIZE,
+                          max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+                          max_retries: int = EMBEDDING_MAX_RETRIES):
+    """
+    Embed many strings with the batched pipeline and return them in input order.
+    Args:
+        texts (list): The input strings to be embedded.
+        batch_size (int): Number of strings sent per embed_content call.
+        max_concurrency (int): Maximum number of batches in flight at once.
+        max_retries (int): Retries per batch on rate limit or server errors.
+    Returns:
+        list: One embedding per input string, in the same order.
+    """
+    texts = list(texts)
+    embeddings = [None] * len(texts)
+    async for start, batch in iter_embedding_batches(texts, batch_size, max_concurrency, max_retries):
+        embeddings[start:start + len(batch)] = batch
+    return embeddings
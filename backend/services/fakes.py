@@ -0,0 +1,174 @@
+"""
+Offline stand-ins for the Gemini, Mistral and OpenAI-compatible clients, selected with PROVIDER_MODE=fake
+
+They mirror the slice of each client API the backend uses, return deterministic output derived from their
+input, and sleep for a configurable latency so benchmarks exercise realistic concurrency without credentials.
+"""
+from types import SimpleNamespace
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+import time
+import uuid
+
+import numpy as np
+import PyPDF2
+
+WORDS = (
+    "mercy patience charity prayer covenant river garden mountain journey light darkness truth "
+    "people city king prophet servant night morning harvest sea ship fire water promise law "
+    "wisdom story family trust reward guidance path heaven earth word sign"
+).split()
+
+
+def _seed(*parts) -> int:
+    digest = hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def fake_embedding(text: str, dimensions: int = 768):
+    """
+    Deterministic unit vector built by hashing the words of text, so texts sharing words score as similar
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in re.findall(r"\w+", text.casefold()):
+        seed = _seed("word", word)
+        vector[seed % dimensions] += 1.0 if (seed >> 32) & 1 else -1.0
+    # A small text-specific component keeps distinct texts apart and empty texts non-zero
+    vector += 0.01 * np.random.default_rng(_seed("text", text)).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_text(seed: int, sentences: int = 6) -> str:
+    rng = random.Random(seed)
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+
+class FakeGenAIClient:
+    """
+    Stand-in for google.genai.Client: client.models.embed_content and client.models.generate_content
+    """
+
+    def __init__(self, dimensions: int = 768, latency_ms: float = 50):
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+        self.models = SimpleNamespace(embed_content=self.embed_content, generate_content=self.generate_content)
+
+    def embed_content(self, model, contents, config=None):
+        time.sleep(self.latency_ms / 1000)
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        return SimpleNamespace(embeddings=[
+            SimpleNamespace(values=fake_embedding(text, self.dimensions)) for text in texts
+        ])
+
+    def generate_content(self, model, contents, config=None):
+        """
+        Structured verse extraction: every "chapter:verse text" line in the text layer of the PDF part
+        """
+        time.sleep(self.latency_ms / 1000)
+        text = ""
+        for part in contents:
+            data = getattr(getattr(part, "inline_data", None), "data", None)
+            if data:
+                text += "\n".join(page.extract_text() or "" for page in PyPDF2.PdfReader(io.BytesIO(data)).pages)
+        verses = [{"reference": f"{chapter}:{verse}", "text": body.strip()}
+                  for chapter, verse, body in re.findall(r"^\s*(\d+):(\d+)\s+(.+)$", text, re.MULTILINE)]
+        return SimpleNamespace(text=json.dumps(verses))
+
+
+class FakeMistralClient:
+    """
+    Stand-in for mistralai.Mistral: files.upload, files.get_signed_url and ocr.process
+    """
+
+    def __init__(self, page_latency_ms: float = 200):
+        self.page_latency_ms = page_latency_ms
+        self._files = {}
+        self.files = SimpleNamespace(upload=self.upload, get_signed_url=self.get_signed_url)
+        self.ocr = SimpleNamespace(process=self.process)
+
+    def upload(self, file, purpose="ocr"):
+        file_id = str(uuid.uuid4())
+        content = file["content"]
+        self._files[file_id] = content.read() if hasattr(content, "read") else content
+        return SimpleNamespace(id=file_id)
+
+    def get_signed_url(self, file_id):
+        return SimpleNamespace(url=f"fake://{file_id}")
+
+    def process(self, model, document, **kwargs):
+        content = self._files.pop(document["document_url"][len("fake://"):], b"")
+        try:
+            page_count = len(PyPDF2.PdfReader(io.BytesIO(content)).pages)
+        except Exception:
+            page_count = 1
+        time.sleep(page_count * self.page_latency_ms / 1000)
+        digest = hashlib.sha256(content).hexdigest()
+        return SimpleNamespace(pages=[
+            SimpleNamespace(index=index, markdown=f"# Page {index + 1}\n\n{fake_text(_seed(digest, index))}")
+            for index in range(page_count)
+        ])
+
+
+def _fake_answer(messages, max_tokens: int):
+    """
+    Deterministic answer: words drawn from the conversation, capped at max_tokens words
+    """
+    text = " ".join(str(message.get("content", "")) for message in messages)
+    words = re.findall(r"\w+", text) or WORDS
+    rng = random.Random(_seed(text))
+    length = min(max_tokens, 60)
+    return [rng.choice(words) for _ in range(length)], len(words)
+
+
+class FakeOpenAIClient:
+    """
+    Stand-in for openai.OpenAI: chat.completions.create(model, messages, max_tokens)
+    """
+
+    def __init__(self, ttft_ms: float = 300, token_latency_ms: float = 10):
+        self.ttft_ms = ttft_ms
+        self.token_latency_ms = token_latency_ms
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens=300, **kwargs):
+        words, prompt_tokens = _fake_answer(messages, max_tokens)
+        time.sleep((self.ttft_ms + len(words) * self.token_latency_ms) / 1000)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=" ".join(words)))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(words)),
+        )
+
+
+class FakeAsyncOpenAIClient:
+    """
+    Stand-in for openai.AsyncOpenAI: chat.completions.create, with stream=True yielding one word per chunk
+    """
+
+    def __init__(self, ttft_ms: float = 300, token_latency_ms: float = 10):
+        self.ttft_ms = ttft_ms
+        self.token_latency_ms = token_latency_ms
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens=300, stream=False, **kwargs):
+        words, prompt_tokens = _fake_answer(messages, max_tokens)
+        if not stream:
+            await asyncio.sleep((self.ttft_ms + len(words) * self.token_latency_ms) / 1000)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=" ".join(words)))],
+                usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(words)),
+            )
+
+        async def chunks():
+            await asyncio.sleep(self.ttft_ms / 1000)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(self.token_latency_ms / 1000)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word if not i else f" {word}"))])
+        return chunks()
@@ -0,0 +1,362 @@
+"""
+PDF ingestion pipeline run by the background job workers: OCR and chunking (or verse extraction), embedding
+and insertion
+"""
+from gridfs import GridFS
+from bson.objectid import ObjectId
+from services.vector_db import VectorDB
+from services.embeddings import iter_embedding_batches, STORED_EMBEDDING_MODEL
+from services.jobs import JobStore
+from services.ocr import OCRProvider, summarize_ocr_pages
+from services.metrics import record_ocr_page, timed
+from services.clients import get_genai_client
+from services.rate_limit import call_with_retry, get_rate_limiter
+from utils.chunking import chunk_page
+from utils.pdf_reader import count_pdf_pages, iter_page_previews, iter_pdf_pages, read_pdf_pages, \
+                             read_from_pdf_in_bytes
+from utils.verses import verse_records, merge_verses
+from core.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, \
+                        PAGE_PREVIEWS, PAGE_THUMBNAIL_WIDTH, PAGE_THUMBNAIL_FORMAT, SYSTEM_PROMPT, VERSE_MODEL, \
+                        VERSE_MAX_RETRIES, VERSE_RETRY_BASE_DELAY, VERSE_CHECKPOINT_PAGES, LLM_RATE_LIMIT_RPM
+from collections import Counter
+from contextlib import contextmanager
+import asyncio
+import hashlib
+import json
+import logging
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionPipeline:
+    """
+    Turn a PDF stored in GridFS into indexed chunks, recording progress on its job
+    """
+
+    def __init__(self, vector_db: VectorDB, fs: GridFS, ocr_provider: OCRProvider, jobs: JobStore):
+        self.vector_db = vector_db
+        self.fs = fs
+        self.ocr_provider = ocr_provider
+        self.jobs = jobs
+
+    async def run(self, job: dict) -> dict:
+        """
+        Run every stage for a claimed job. Stages that already finished in an earlier attempt are skipped.
+        Returns:
+            dict: Summary stored as the job result
+        """
+        job_id = job["_id"]
+        doc_id = job["doc_id"]
+        # Every write checks the job is still held by the worker that claimed it
+        owner = job.get("worker_id")
+
+        # Stage 1: OCR and chunk every page, or extract one record per verse
+        mode = job.get("mode", "chunks")
+        if mode == "verses":
+            chunks, page_count = await self._verse_chunks(job)
+        else:
+            chunks, page_count = await self._page_chunks(job)
+
+        # Stage 2: embed and insert the chunks not already indexed for this document
+        await self.jobs.set_stage(job_id, "embedding", owner=owner, pages_total=page_count)
+        for chunk in chunks:
+            chunk["content_hash"] = hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()
+
+        indexed = await asyncio.to_thread(self.vector_db.get_indexed_chunks, doc_id, STORED_EMBEDDING_MODEL, mode)
+        pending = [chunk for chunk in chunks if (chunk["page"], chunk["chunk_index"]) not in indexed]
+        if len(pending) < len(chunks):
+            logger.info(f"Job {job_id}: {len(chunks) - len(pending)} chunks already indexed, {len(pending)} remaining")
+
+        # A page counts as done once all of its chunks are stored
+        remaining_per_page = Counter(chunk["page"] for chunk in pending)
+        pages_done = page_count - len(remaining_per_page)
+
+        def mark_done(documents):
+            nonlocal pages_done
+            for document in documents:
+                remaining_per_page[document["page"]] -= 1
+                if remaining_per_page[document["page"]] == 0:
+                    pages_done += 1
+
+        def chunk_document(chunk, embedding):
+            return {
+                "doc_id": doc_id,
+                "content": chunk["text"],
+                "reference": chunk.get("reference") or f"Page {chunk['page']}",
+                "page": chunk["page"],
+                "chunk_index": chunk["chunk_index"],
+                "char_start": chunk["char_start"],
+                "char_end": chunk["char_end"],
+                "document_embedding": embedding,
+                "embedding_model": STORED_EMBEDDING_MODEL,
+                "content_hash": chunk["content_hash"],
+                "file_hash": job["file_hash"],
+                "chapter": chunk.get("chapter"),
+                "verse": chunk.get("verse"),
+            }
+
+        # Reuse stored vectors for chunks whose text was already embedded with the current model, dimensions and
+        # storage format, so they are copied as they are
+        stored_embeddings = await asyncio.to_thread(
+            self.vector_db.get_embeddings_by_hash, [chunk["content_hash"] for chunk in pending], STORED_EMBEDDING_MODEL
+        )
+        async def insert(documents):
+            # Checked before every batch: the job may have been cancelled, e.g. because its document was deleted
+            await self.jobs.heartbeat(job_id, owner)
+            return await asyncio.to_thread(self.vector_db.insert_many, documents)
+
+        reused = [chunk_document(chunk, stored_embeddings[chunk["content_hash"]])
+                  for chunk in pending if chunk["content_hash"] in stored_embeddings]
+        missing = [chunk for chunk in pending if chunk["content_hash"] not in stored_embeddings]
+
+        chunk_count = len(chunks) - len(pending)
+        failed_count = 0
+        if reused:
+            report = await insert(reused)
+            chunk_count += report["inserted"]
+            failed_count += report["failed"]
+            mark_done(reused)
+            await self.jobs.update(job_id, owner=owner, pages_done=pages_done, chunks_done=chunk_count,
+                                   reused_count=len(reused), failed_count=failed_count)
+
+        # Embed the remaining chunks in concurrent batches and bulk insert each batch as it lands
+        async for start, embeddings in iter_embedding_batches([chunk["text"] for chunk in missing]):
+            documents = [chunk_document(chunk, embedding) for chunk, embedding in zip(missing[start:], embeddings)]
+            report = await insert(documents)
+            chunk_count += report["inserted"]
+            failed_count += report["failed"]
+            mark_done(documents)
+            await self.jobs.update(job_id, owner=owner, pages_done=pages_done, chunks_done=chunk_count,
+                                   failed_count=failed_count)
+
+        await asyncio.to_thread(self.vector_db.save_index)
+
+        # Stage 3: per-page PDF slices and thumbnails for result previews; chunks are already searchable
+        if PAGE_PREVIEWS and not job.get("previews"):
+            await self.jobs.set_stage(job_id, "previews", owner=owner)
+            try:
+                previews = await asyncio.to_thread(self._store_previews, doc_id)
+            except Exception as e:
+                logger.warning(f"Job {job_id}: storing page previews failed, full PDF previews still work: {e}")
+            else:
+                await self.jobs.update(job_id, owner=owner, previews=previews)
+
+        return {
+            "mode": mode,
+            "page_count": page_count,
+            "chunk_count": chunk_count,
+            "failed_count": failed_count,
+            "reused_count": len(reused),
+            "file_id": doc_id,
+        }
+
+    async def _page_chunks(self, job: dict):
+        """
+        OCR the PDF, keeping the page texts in GridFS so a resumed job does not pay for OCR again, and chunk each page
+        Returns:
+            tuple: (chunks, page count)
+        """
+        job_id = job["_id"]
+        doc_id = job["doc_id"]
+        owner = job.get("worker_id")
+        texts = None
+        if job.get("ocr_file_id"):
+            texts = await asyncio.to_thread(self._load_json, job["ocr_file_id"], "OCR output")
+        if texts is None:
+            await self.jobs.set_stage(job_id, "ocr", owner=owner)
+            pages = await asyncio.to_thread(self._ocr, doc_id, job["filename"])
+            texts = [page["text"] for page in pages]
+            ocr_file_id = await asyncio.to_thread(self._store_json, doc_id, "ocr", texts)
+            await self.jobs.update(
+                job_id,
+                owner=owner,
+                ocr_file_id=ocr_file_id,
+                pages_total=len(texts),
+                ocr_pages=[{"page": page["index"] + 1, "engine": page["engine"],
+                            "latency_ms": round(page["latency_ms"], 2)} for page in pages],
+                ocr_summary=summarize_ocr_pages(pages),
+            )
+
+        chunks = [
+            chunk
+            for idx, text in enumerate(texts)
+            for chunk in chunk_page(text, idx + 1, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+        ]
+        return chunks, len(texts)
+
+    async def _verse_chunks(self, job: dict):
+        """
+        Extract the verses of the PDF, keeping them in GridFS so a resumed job does not extract them again,
+        and turn each verse into one chunk
+        Returns:
+            tuple: (chunks, page count)
+        """
+        job_id = job["_id"]
+        doc_id = job["doc_id"]
+        owner = job.get("worker_id")
+        extracted = None
+        if job.get("verses_file_id"):
+            extracted = await asyncio.to_thread(self._load_json, job["verses_file_id"], "verses")
+        if extracted is None:
+            await self.jobs.set_stage(job_id, "verses", owner=owner)
+            extracted = await self._extract_verses(job)
+            verses_file_id = await asyncio.to_thread(self._store_json, doc_id, "verses", extracted)
+            await self.jobs.update(job_id, owner=owner, verses_file_id=verses_file_id, pages_total=extracted["page_count"],
+                                   verse_count=len(extracted["verses"]), rejected_references=extracted["rejected"],
+                                   verse_pages_file_id=None)
+            if job.get("verse_pages_file_id"):
+                await asyncio.to_thread(self.fs.delete, job["verse_pages_file_id"])
+
+        chunks = [
+            {
+                "text": record["text"],
+                "reference": record["reference"],
+                "page": record["page"],
+                # Unique per document, so the existing (page, chunk_index) resume check applies unchanged
+                "chunk_index": index,
+                "char_start": None,
+                "char_end": None,
+                "chapter": record["chapter"],
+                "verse": record["verse"],
+            }
+            for index, record in enumerate(extracted["verses"])
+        ]
+        return chunks, extracted["page_count"]
+
+    @timed("verse_extraction")
+    async def _extract_verses(self, job: dict) -> dict:
+        """
+        Send each page of the stored PDF to VERSE_MODEL and keep the verses that validate as DocumentParser.
+        Each page is rate limited and retried on its own, and the parsed pages are checkpointed in GridFS
+        every VERSE_CHECKPOINT_PAGES pages so a resumed job only sends the pages it had not finished.
+        Returns:
+            dict: page_count, verses (merged across pages, in reading order) and the number of rejected items
+        """
+        doc_id = job["doc_id"]
+        checkpoint_id = job.get("verse_pages_file_id")
+        done = {}
+        if checkpoint_id:
+            done = await asyncio.to_thread(self._load_json, checkpoint_id, "verse pages") or {}
+            logger.info(f"Resuming verse extraction of {doc_id} after {len(done)} pages")
+        client = get_genai_client()
+
+        def read_page(page):
+            get_rate_limiter("gemini", VERSE_MODEL, LLM_RATE_LIMIT_RPM).acquire()
+            return read_from_pdf_in_bytes(page, client, SYSTEM_PROMPT, VERSE_MODEL)
+
+        async def read_with_retry(index, page):
+            start = time.perf_counter()
+            items = await call_with_retry(read_page, page, max_retries=VERSE_MAX_RETRIES,
+                                          base_delay=VERSE_RETRY_BASE_DELAY,
+                                          description=f"Verse extraction of page {index + 1} of {doc_id}")
+            record_ocr_page("verses", (time.perf_counter() - start) * 1000)
+            return items
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as temp_file:
+            await asyncio.to_thread(self._copy_stored_pdf, doc_id, temp_file)
+            page_count = await asyncio.to_thread(count_pdf_pages, temp_file.name)
+            pages = ((index, page) for index, page in iter_pdf_pages(temp_file.name) if str(index) not in done)
+            pending = 0
+            async for index, items in read_pdf_pages(pages, client, SYSTEM_PROMPT, model=VERSE_MODEL,
+                                                     read_page=read_with_retry):
+                done[str(index)] = items
+                pending += 1
+                if pending >= VERSE_CHECKPOINT_PAGES:
+                    checkpoint_id = await self._checkpoint_verse_pages(job, done, checkpoint_id)
+                    pending = 0
+        if checkpoint_id:
+            # The finished verses replace the checkpoint once the caller stores them
+            job["verse_pages_file_id"] = checkpoint_id
+
+        records = []
+        rejected = 0
+        for index in sorted(done, key=int):
+            page_records, page_rejected = verse_records(done[index], int(index) + 1)
+            records += page_records
+            rejected += page_rejected
+        verses = merge_verses(records)
+        logger.info(f"Extracted {len(verses)} verses from {page_count} pages of {doc_id}, rejected {rejected} items")
+        return {"page_count": page_count, "verses": verses, "rejected": rejected}
+
+    async def _checkpoint_verse_pages(self, job: dict, done: dict, previous_id=None):
+        """
+        Store the pages parsed so far and point the job at them, replacing the previous checkpoint
+        Returns:
+            ObjectId: GridFS id of the new checkpoint
+        """
+        checkpoint_id = await asyncio.to_thread(self._store_json, job["doc_id"], "verse_pages", done)
+        await self.jobs.update(job["_id"], owner=job.get("worker_id"), verse_pages_file_id=checkpoint_id,
+                               pages_done=len(done))
+        if previous_id:
+            await asyncio.to_thread(self.fs.delete, previous_id)
+        return checkpoint_id
+
+    def _copy_stored_pdf(self, doc_id: str, temp_file):
+        grid_out = self.fs.get(ObjectId(doc_id))
+        for chunk in grid_out:
+            temp_file.write(chunk)
+        temp_file.flush()
+
+    @contextmanager
+    def _stored_pdf(self, doc_id: str):
+        """
+        Copy the stored PDF to a temporary file one GridFS chunk at a time and yield its path,
+        so OCR and page splitting read from disk instead of holding the file in memory
+        """
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as temp_file:
+            self._copy_stored_pdf(doc_id, temp_file)
+            yield temp_file.name
+
+    def _ocr(self, doc_id: str, filename: str):
+        """
+        OCR the stored PDF with the configured provider
+        Returns:
+            list: Per-page dicts with index, text, engine and latency_ms
+        """
+        with self._stored_pdf(doc_id) as path:
+            pages = self.ocr_provider.process(path, filename)
+        for page in pages:
+            record_ocr_page(page["engine"], page["latency_ms"])
+        logger.info(f"OCR processed successfully for {doc_id}: {summarize_ocr_pages(pages)}")
+        return pages
+
+    @timed("page_previews")
+    def _store_previews(self, doc_id: str):
+        """
+        Store a single-page PDF and a thumbnail of every page in GridFS, next to the original
+        Returns:
+            dict: Number of pages and thumbnails stored
+        """
+        # Drop what an interrupted earlier attempt left behind
+        for grid_out in self.fs.find({"metadata.doc_id": doc_id, "metadata.kind": {"$in": ["page", "thumbnail"]}}):
+            self.fs.delete(grid_out._id)
+
+        content_type = f"image/{PAGE_THUMBNAIL_FORMAT}"
+        stored = {"pages": 0, "thumbnails": 0}
+        with self._stored_pdf(doc_id) as path:
+            for index, (page_bytes, thumbnail) in iter_page_previews(path, PAGE_THUMBNAIL_WIDTH, PAGE_THUMBNAIL_FORMAT):
+                page = index + 1
+                self.fs.put(page_bytes, filename=f"{doc_id}.page-{page}.pdf",
+                            metadata={"kind": "page", "doc_id": doc_id, "page": page, "content_type": "application/pdf"})
+                stored["pages"] += 1
+                if thumbnail is not None:
+                    self.fs.put(thumbnail, filename=f"{doc_id}.page-{page}.{PAGE_THUMBNAIL_FORMAT}",
+                                metadata={"kind": "thumbnail", "doc_id": doc_id, "page": page, "content_type": content_type})
+                    stored["thumbnails"] += 1
+        logger.info(f"Stored page previews for {doc_id}: {stored}")
+        return stored
+
+    def _store_json(self, doc_id: str, kind: str, value):
+        with self.fs.new_file(filename=f"{doc_id}.{kind}.json", content_type="application/json",
+                              metadata={"kind": kind, "doc_id": doc_id}) as grid_out:
+            grid_out.write(json.dumps(value).encode("utf-8"))
+            return grid_out._id
+
+    def _load_json(self, file_id, description: str):
+        try:
+            return json.loads(self.fs.get(file_id).read())
+        except Exception as e:
+            logger.warning(f"Stored {description} {file_id} unavailable, computing it again: {e}")
+            return None
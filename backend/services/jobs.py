@@ -0,0 +1,326 @@
+"""
+Background ingestion jobs: a MongoDB-backed job store and an asyncio worker pool
+"""
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pymongo.asynchronous.collection import AsyncCollection
+from bson.objectid import ObjectId
+from contextlib import suppress
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Stage outputs a job for the same document and mode can pick up instead of recomputing
+RESUMABLE_FIELDS = ("ocr_file_id", "ocr_pages", "ocr_summary", "verses_file_id", "verse_count", "rejected_references",
+                    "verse_pages_file_id")
+
+
+class JobLost(Exception):
+    """
+    Raised when a worker writes to a job it no longer holds, because another worker reclaimed it as stale
+    or it was cancelled
+    """
+
+
+class JobStore:
+    """
+    Persist ingestion job state in MongoDB so any worker can pick up, report on, or resume a job
+    """
+
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("created_at", 1)])
+        await self.collection.create_index([("doc_id", 1), ("created_at", -1)])
+        # One queued or running job per document and mode, however many uploads of the same file arrive at once
+        await self.collection.create_index([("doc_id", 1), ("mode", 1)], unique=True,
+                                           partialFilterExpression={"active": True})
+
+    async def create(self, doc_id: str, filename: str, size: int, file_hash: str, mode: str = "chunks",
+                     resume_from: dict = None) -> str:
+        """
+        Queue a new ingestion job for a PDF already stored in GridFS, unless one is already queued or running for
+        the document in this mode
+        Args:
+            mode (str): "chunks" or "verses", see INGESTION_MODE
+            resume_from (dict): Earlier unfinished job for the document whose stored OCR or verse output is reused
+        Returns:
+            str: The new job's id, or the id of the job already queued or running
+        """
+        now = datetime.now()
+        carried = {}
+        if resume_from is not None:
+            carried = {field: resume_from[field] for field in RESUMABLE_FIELDS if resume_from.get(field) is not None}
+        job = {
+            "doc_id": doc_id,
+            "filename": filename,
+            "size": size,
+            "file_hash": file_hash,
+            "mode": mode,
+            "status": QUEUED,
+            # Cleared when the job finishes, fails or is cancelled
+            "active": True,
+            "stage": QUEUED,
+            "pages_total": None,
+            "pages_done": 0,
+            "chunks_done": 0,
+            "reused_count": 0,
+            "failed_count": 0,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            **carried,
+        }
+        try:
+            result = await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            active = await self.collection.find_one({"doc_id": doc_id, "mode": mode, "active": True})
+            if active is None:
+                # The other job ended in the meantime
+                result = await self.collection.insert_one(job)
+            else:
+                return str(active["_id"])
+        return str(result.inserted_id)
+
+    async def get(self, job_id: str):
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.collection.find_one({"_id": ObjectId(job_id)})
+
+    async def find_active(self, doc_id: str, mode: str = "chunks"):
+        """
+        The queued or running job for a document in an ingestion mode, if any
+        """
+        # Jobs queued before ingestion modes existed have no mode and indexed chunks
+        modes = [mode, None] if mode == "chunks" else [mode]
+        return await self.collection.find_one({"doc_id": doc_id, "mode": {"$in": modes},
+                                               "status": {"$in": [QUEUED, RUNNING]}})
+
+    async def find_latest(self, doc_id: str, mode: str = "chunks"):
+        """
+        The most recent job for a document in an ingestion mode, whatever its status
+        """
+        # Jobs queued before ingestion modes existed have no mode and indexed chunks
+        modes = [mode, None] if mode == "chunks" else [mode]
+        return await self.collection.find_one({"doc_id": doc_id, "mode": {"$in": modes}}, sort=[("created_at", -1)])
+
+    async def claim(self, worker_id: str, stale_after: float):
+        """
+        Atomically take the oldest queued job, or a running job whose worker stopped heartbeating
+        """
+        now = datetime.now()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "heartbeat_at": {"$lt": now - timedelta(seconds=stale_after)}},
+            ]},
+            {
+                "$set": {"status": RUNNING, "worker_id": worker_id, "heartbeat_at": now, "updated_at": now},
+                "$inc": {"attempts": 1},
+                "$min": {"started_at": now},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def update(self, job_id, owner: str = None, **fields):
+        """
+        Record progress for a job, which also counts as a heartbeat
+        :param owner: Worker id the job was claimed with; the update only applies while that worker still holds it.
+        Raises:
+            JobLost: When owner is given and the job is no longer running under it
+        """
+        now = datetime.now()
+        fields.update({"heartbeat_at": now, "updated_at": now})
+        query = {"_id": job_id}
+        if owner is not None:
+            query.update({"status": RUNNING, "worker_id": owner})
+        result = await self.collection.update_one(query, {"$set": fields})
+        if owner is not None and not result.matched_count:
+            raise JobLost(f"Job {job_id} is no longer held by {owner}")
+
+    async def set_stage(self, job_id, stage: str, owner: str = None, **fields):
+        await self.update(job_id, owner=owner, stage=stage, stage_started_at=datetime.now(), **fields)
+
+    async def heartbeat(self, job_id, owner: str = None):
+        await self.update(job_id, owner=owner)
+
+    async def complete(self, job_id, result: dict, owner: str = None):
+        await self.update(job_id, owner=owner, status=DONE, stage=DONE, result=result, active=False,
+                          finished_at=datetime.now())
+
+    async def fail(self, job_id, error: str, owner: str = None):
+        await self.update(job_id, owner=owner, status=FAILED, error=error, active=False,
+                          finished_at=datetime.now())
+
+    async def requeue(self, job_id, owner: str = None):
+        await self.update(job_id, owner=owner, status=QUEUED, worker_id=None)
+
+    async def cancel(self, doc_id: str) -> int:
+        """
+        Cancel a document's queued and running jobs, e.g. because it was deleted. Queued jobs are never claimed,
+        and a running job's worker stops at its next write.
+        Returns:
+            int: Number of jobs cancelled
+        """
+        now = datetime.now()
+        result = await self.collection.update_many(
+            {"doc_id": doc_id, "status": {"$in": [QUEUED, RUNNING]}},
+            {"$set": {"status": CANCELLED, "active": False, "updated_at": now, "finished_at": now}},
+        )
+        return result.modified_count
+
+
+def serialize_job(job: dict) -> dict:
+    """
+    Convert a job document into an API response with throughput figures
+    """
+    started_at = job.get("started_at")
+    ended_at = job.get("finished_at") or job.get("updated_at")
+    elapsed = (ended_at - started_at).total_seconds() if started_at and ended_at else 0.0
+    pages_done = job.get("pages_done", 0)
+    return {
+        "job_id": str(job["_id"]),
+        "doc_id": job["doc_id"],
+        "filename": job.get("filename"),
+        "mode": job.get("mode", "chunks"),
+        "status": job["status"],
+        "stage": job.get("stage"),
+        "pages_total": job.get("pages_total"),
+        "pages_done": pages_done,
+        "chunks_done": job.get("chunks_done", 0),
+        "reused_count": job.get("reused_count", 0),
+        "failed_count": job.get("failed_count", 0),
+        "attempts": job.get("attempts", 0),
+        "elapsed_seconds": round(elapsed, 3),
+        "pages_per_second": round(pages_done / elapsed, 3) if elapsed > 0 else None,
+        "ocr": job.get("ocr_summary"),
+        "ocr_pages": job.get("ocr_pages"),
+        "verse_count": job.get("verse_count"),
+        "rejected_references": job.get("rejected_references"),
+        "previews": job.get("previews"),
+        "error": job.get("error"),
+        "result": job.get("result"),
+    }
+
+
+class IngestionWorkerPool:
+    """
+    Run queued ingestion jobs on a fixed number of asyncio tasks
+    """
+
+    def __init__(self, jobs: JobStore, pipeline, concurrency: int = 2, poll_interval: float = 2.0,
+                 stale_after: float = 120.0, max_attempts: int = 3):
+        """
+        :param jobs: Job store to claim work from.
+        :param pipeline: Object with an async run(job) method returning the job result.
+        :param concurrency: Number of jobs processed at once by this process.
+        :param poll_interval: Seconds between polls for new work when idle.
+        :param stale_after: Seconds without a heartbeat before a running job is considered abandoned.
+        :param max_attempts: Attempts allowed before an abandoned job is marked failed.
+        """
+        self.jobs = jobs
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        # Each task claims under its own id, so a job reclaimed by a sibling task is not still written by the first
+        self._tasks = [asyncio.create_task(self._worker(f"{self.worker_id}/{n}")) for n in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} ingestion workers as {self.worker_id}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """
+        Wake idle workers after a job was queued by this process
+        """
+        self._wake.set()
+
+    async def _worker(self, worker_id: str):
+        while True:
+            self._wake.clear()
+            try:
+                job = await self.jobs.claim(worker_id, self.stale_after)
+            except Exception as e:
+                logger.warning(f"Failed to claim ingestion job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except JobLost as e:
+                logger.warning(f"Ingestion job {job['_id']} stopped: {e}")
+            except Exception as e:
+                logger.warning(f"Failed to record the outcome of ingestion job {job['_id']}: {e}")
+
+    async def _heartbeat(self, job_id, owner: str, pipeline: asyncio.Task):
+        """
+        Keep the job's claim fresh while the pipeline runs, and stop the pipeline once the claim is lost
+        """
+        while True:
+            await asyncio.sleep(self.stale_after / 4)
+            try:
+                await self.jobs.heartbeat(job_id, owner)
+            except JobLost as e:
+                logger.warning(f"Stopping ingestion job {job_id}: {e}")
+                pipeline.cancel()
+                return
+            except Exception as e:
+                # A missed beat only matters if none lands within stale_after, so keep beating
+                logger.warning(f"Heartbeat for ingestion job {job_id} failed: {e}")
+
+    async def _run(self, job):
+        job_id = job["_id"]
+        owner = job["worker_id"]
+        if job["attempts"] > self.max_attempts:
+            await self.jobs.fail(job_id, f"Gave up after {self.max_attempts} attempts", owner=owner)
+            return
+        if job["attempts"] > 1:
+            logger.info(f"Resuming ingestion job {job_id} at stage {job.get('stage')} (attempt {job['attempts']})")
+
+        pipeline = asyncio.create_task(self.pipeline.run(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, owner, pipeline))
+        try:
+            result = await pipeline
+            await self.jobs.complete(job_id, result, owner=owner)
+            logger.info(f"Ingestion job {job_id} completed: {result}")
+        except asyncio.CancelledError:
+            if heartbeat.done() and not asyncio.current_task().cancelling():
+                # The heartbeat stopped the pipeline: the job belongs to another worker now
+                return
+            # Shutting down: hand the job back so the next worker resumes it straight away
+            with suppress(JobLost):
+                await asyncio.shield(self.jobs.requeue(job_id, owner=owner))
+            raise
+        except JobLost:
+            raise
+        except Exception as e:
+            logger.exception(f"Ingestion job {job_id} failed")
+            await self.jobs.fail(job_id, str(e), owner=owner)
+        finally:
+            heartbeat.cancel()
@@ -0,0 +1,261 @@
+"""
+Full-text search backends used for hybrid retrieval: Atlas $search or a local BM25 inverted index,
+plus reciprocal rank fusion to merge their ranking with the vector search ranking
+"""
+from abc import ABC, abstractmethod
+from collections import Counter
+from pymongo.asynchronous.collection import AsyncCollection
+from services.vector_index import fetch_ranked
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Verse references such as 2:255 stay one token, so an exact reference matches exactly
+TOKEN_PATTERN = re.compile(r"\d+:\d+|\w+")
+
+
+def tokenize(text: str):
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def lexical_text(document: dict) -> str:
+    """
+    Text indexed for a stored chunk: its reference (e.g. "Page 3" or "2:255") and its content
+    """
+    return f"{document.get('reference') or ''} {document.get('text') or ''}"
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Merge several rankings of ids with reciprocal rank fusion
+    Args:
+        rankings (list): Lists of ids, best first
+        k (int): Damping constant; larger values flatten the contribution of the top ranks
+
+    Returns:
+        list: (id, fused score) pairs, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class LexicalBackend(ABC):
+    """
+    Interface for the component that ranks stored chunks against a text query
+    """
+
+    #: Whether chunks must be added to the backend explicitly after being written to MongoDB
+    local = False
+
+    def add(self, ids, texts, doc_ids):
+        """
+        Add the text of chunks already stored in MongoDB
+        """
+
+    def remove(self, ids):
+        """
+        Remove the given chunk ids
+        """
+
+    def save(self):
+        """
+        Persist the index, if the backend keeps one
+        """
+
+    def ids(self):
+        """
+        Chunk ids held by the backend, if it keeps its own index
+        """
+        return []
+
+    def __len__(self):
+        return 0
+
+    @abstractmethod
+    async def search(self, query: str, top_k: int, doc_ids: list = None):
+        """
+        Rank chunks by text relevance to query
+        Returns:
+            list: Chunk documents with chunk_id and search_score fields, best first
+        """
+
+
+class AtlasSearchBackend(LexicalBackend):
+    """
+    Full-text $search against an Atlas Search index mapping text and reference as strings and doc_id as a token
+    """
+
+    def __init__(self, collection: AsyncCollection, index_name: str):
+        self.collection = collection
+        self.index_name = index_name
+
+    async def search(self, query: str, top_k: int, doc_ids: list = None):
+        search = {
+            "index": self.index_name,
+            "compound": {
+                "must": [{"text": {"query": query, "path": ["text", "reference"]}}],
+            },
+        }
+        if doc_ids:
+            search["compound"]["filter"] = [{"in": {"path": "doc_id", "value": list(doc_ids)}}]
+
+        pipeline = [
+            {"$search": search},
+            {"$limit": top_k},
+            {"$addFields": {"chunk_id": {"$toString": "$_id"}}},
+            {"$project": {
+                "_id": 0,
+                "document_embedding": 0,
+                "timestamp": 0,
+                "search_score": {"$meta": "searchScore"}
+            }}
+        ]
+        cursor = await self.collection.aggregate(pipeline)
+        return await cursor.to_list()
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over chunk ids. Returns (id, score) pairs; VectorDB fetches the documents.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        """
+        :param path: Directory holding bm25.json.
+        :param k1: Term frequency saturation.
+        :param b: Document length normalization.
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._docs = {}
+        self._total_length = 0
+        self.load()
+
+    def add(self, ids, texts, doc_ids):
+        with self._lock:
+            for chunk_id, text, doc_id in zip(ids, texts, doc_ids):
+                self._remove(chunk_id)
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self._docs[chunk_id] = (doc_id, length, counts)
+                self._total_length += length
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+
+    def _remove(self, chunk_id):
+        entry = self._docs.pop(chunk_id, None)
+        if entry is None:
+            return
+        _, length, counts = entry
+        self._total_length -= length
+        for term in counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+    def search(self, query: str, top_k: int, doc_ids: list = None):
+        terms = set(tokenize(query))
+        allowed = set(doc_ids) if doc_ids else None
+        with self._lock:
+            count = len(self._docs)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    doc_id, length, _ = self._docs[chunk_id]
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda pair: pair[1])
+
+    def save(self):
+        with self._lock:
+            docs = {chunk_id: [doc_id, counts] for chunk_id, (doc_id, _, counts) in self._docs.items()}
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, "bm25.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": docs}, f)
+        os.replace(tmp_path, os.path.join(self.path, "bm25.json"))
+
+    def load(self):
+        index_path = os.path.join(self.path, "bm25.json")
+        if not os.path.exists(index_path):
+            return
+        start = time.perf_counter()
+        with open(index_path) as f:
+            docs = json.load(f)["docs"]
+        with self._lock:
+            self._postings, self._docs, self._total_length = {}, {}, 0
+            for chunk_id, (doc_id, counts) in docs.items():
+                length = sum(counts.values())
+                self._docs[chunk_id] = (doc_id, length, counts)
+                self._total_length += length
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+        logger.info(f"Loaded BM25 index with {len(self._docs)} chunks from {self.path} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def ids(self):
+        with self._lock:
+            return list(self._docs)
+
+    def __len__(self):
+        return len(self._docs)
+
+
+class LocalLexicalBackend(LexicalBackend):
+    """
+    Rank chunks with an in-process BM25 index, then fetch the winning documents from MongoDB
+    """
+
+    local = True
+
+    def __init__(self, index: BM25Index, collection: AsyncCollection):
+        self.index = index
+        self.collection = collection
+
+    def add(self, ids, texts, doc_ids):
+        self.index.add(ids, texts, doc_ids)
+
+    def remove(self, ids):
+        self.index.remove(ids)
+
+    def save(self):
+        self.index.save()
+
+    def ids(self):
+        return self.index.ids()
+
+    def __len__(self):
+        return len(self.index)
+
+    async def search(self, query: str, top_k: int, doc_ids: list = None):
+        ranked = await asyncio.to_thread(self.index.search, query, top_k, doc_ids)
+        return await fetch_ranked(self.collection, ranked)
@@ -1,5 +1,12 @@
-from openai import OpenAI
-from core.config import GEMINI_API_KEY, GEMINI_BASE_URL
+from services.clients import get_chat_client, get_async_chat_client
+from services.metrics import timed, TOKENS, LLM_TTFT_SECONDS
+from services.rate_limit import get_rate_limiter
+from core.config import LLM_RATE_LIMIT_RPM
+from utils.tokens import count_tokens
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class LLMService:
@@ -9,24 +16,22 @@ class LLMService:
 
     def __init__(self, provider: str):
         """
-        Initialize the LLMService with API key, base URL, and provider.
+        Initialize the LLMService for a provider. Its clients are created on first use and shared across requests.
         
-        :param api_key: The API key for authenticating with the LLM service.
-        :param base_url: The base URL of the LLM API.
-        :param provider: The LLM provider (e.g., "openai", "gemini", "anthropic", "groq").
+        :param provider: The LLM provider (e.g., "openai", "gemini", "anthropic", "groq", or "fake" for offline runs).
         """
-        if provider == "openai":
-            #TODO: Do the OpenAI API key later
-            pass
-        
-        elif provider == "gemini":
-            self.client = OpenAI(
-                api_key=GEMINI_API_KEY,
-                base_url=GEMINI_BASE_URL
-            )
+        #TODO: Add the OpenAI, Anthropic and Groq clients later
         self.provider = provider.lower()
 
+    @property
+    def client(self):
+        return get_chat_client(self.provider)
 
+    @property
+    def async_client(self):
+        return get_async_chat_client(self.provider)
+
+    @timed("llm_generate")
     def generate_response(self, messages: str, model: str, max_tokens: int = 300) -> dict:
         """
         Send a messages to the LLM API and get a response.
@@ -34,16 +39,65 @@ class LLMService:
         :param messages: The input messages for the LLM.
         :param model: The model to use for the LLM (default depends on the provider).
         :param max_tokens: The maximum number of tokens to generate in the response.
-        :return: The response from the LLM API as a dictionary.
+        :return: The response message from the LLM API.
+        :raises RateLimitExceeded: If the provider's rate limit would keep the call waiting too long.
+        :raises Exception: Errors from the LLM API are logged and re-raised.
         """
-
+        get_rate_limiter(self.provider, model, LLM_RATE_LIMIT_RPM).acquire()
         try:
             response = self.client.chat.completions.create(
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens
             )
-            return response.choices[0].message
         except Exception as e:
-            print(f"Error while calling {self.provider} API: {e}")
-            return {"error": str(e)}
\ No newline at end of file
+            logger.error(f"Error while calling {self.provider} API: {e}")
+            raise
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            TOKENS.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+            TOKENS.labels(model, "completion").inc(usage.completion_tokens or 0)
+        return response.choices[0].message
+
+    @timed("llm_stream")
+    async def stream_response(self, messages: list, model: str, max_tokens: int = 300, stats: dict = None):
+        """
+        Stream the LLM response token by token through the async client.
+        
+        :param messages: The input messages for the LLM.
+        :param model: The model to use for the LLM.
+        :param max_tokens: The maximum number of tokens to generate in the response.
+        :param stats: Optional dict filled with ttft_ms and total_ms once the stream ends.
+        :return: An async generator of text deltas.
+        """
+        await get_rate_limiter(self.provider, model, LLM_RATE_LIMIT_RPM).acquire_async()
+        start = time.perf_counter()
+        ttft = None
+        completion_tokens = 0
+        stream = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+                LLM_TTFT_SECONDS.labels(model).observe(ttft)
+                logger.info(f"{self.provider} time to first token: {ttft * 1000:.0f} ms (model {model})")
+            # The stream carries no usage block, so completion tokens are estimated locally
+            completion_tokens += count_tokens(delta)
+            yield delta
+
+        total = time.perf_counter() - start
+        TOKENS.labels(model, "prompt").inc(sum(count_tokens(msg.get("content", "")) for msg in messages))
+        TOKENS.labels(model, "completion").inc(completion_tokens)
+        logger.info(f"{self.provider} stream finished in {total * 1000:.0f} ms (model {model})")
+        if stats is not None:
+            stats["ttft_ms"] = round(ttft * 1000, 1) if ttft is not None else None
+            stats["total_ms"] = round(total * 1000, 1)
@@ -0,0 +1,212 @@
+"""
+Prometheus metrics shared by the backend, plus a timing helper usable as a decorator or context manager
+"""
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from utils.tokens import tokenizer_is_approximate
+import asyncio
+import functools
+import inspect
+import os
+import resource
+import sys
+import time
+
+# Buckets span cache hits (sub-millisecond) up to multi-minute OCR calls
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each backend stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total",
+    "Exceptions raised by each backend stage",
+    ["stage"],
+)
+PAGES_PROCESSED = Counter(
+    "rag_pages_processed_total",
+    "PDF pages turned into text, by OCR engine",
+    ["engine"],
+)
+OCR_PAGE_SECONDS = Histogram(
+    "rag_ocr_page_duration_seconds",
+    "Time spent turning one PDF page into text, by OCR engine",
+    ["engine"],
+    buckets=STAGE_BUCKETS,
+)
+TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "LLM tokens, by model and kind (prompt or completion)",
+    ["model", "kind"],
+)
+CACHE_LOOKUPS = Counter(
+    "rag_cache_lookups_total",
+    "Cache lookups, by cache and result (hit or miss)",
+    ["cache", "result"],
+)
+LLM_TTFT_SECONDS = Histogram(
+    "rag_llm_time_to_first_token_seconds",
+    "Time until the first streamed LLM token",
+    ["model"],
+    buckets=STAGE_BUCKETS,
+)
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens",
+    "Input tokens per /generate-response turn after prompt assembly",
+    buckets=(250, 500, 1000, 2000, 4000, 6000, 8000, 16000, 32000),
+)
+UPLOAD_PEAK_RSS_BYTES = Histogram(
+    "rag_upload_peak_rss_bytes",
+    "Highest process resident memory seen while streaming an upload",
+    buckets=tuple(mb * 1024 * 1024 for mb in (128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)),
+)
+UPLOADS_REJECTED = Counter(
+    "rag_uploads_rejected_total",
+    "Uploads refused before indexing, by reason",
+    ["reason"],
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "rag_rate_limit_wait_seconds",
+    "Time provider calls queued for a rate limit token",
+    ["provider", "model"],
+    buckets=STAGE_BUCKETS,
+)
+RATE_LIMIT_REJECTED = Counter(
+    "rag_rate_limit_rejected_total",
+    "Provider calls refused because their rate limit wait would exceed RATE_LIMIT_MAX_WAIT",
+    ["provider", "model"],
+)
+COALESCED_CALLS = Counter(
+    "rag_coalesced_calls_total",
+    "Calls answered by an identical call already in flight, by kind",
+    ["call"],
+)
+TOKENIZER_APPROXIMATE = Gauge(
+    "rag_tokenizer_approximate",
+    "1 while token counts are 4-characters-per-token estimates because the cl100k_base encoding failed to load",
+)
+TOKENIZER_APPROXIMATE.set_function(lambda: float(tokenizer_is_approximate()))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_rss_bytes() -> int:
+    """
+    Current resident memory of this process, falling back to the peak where /proc is unavailable
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _is_error(exc) -> bool:
+    # Client errors such as a 404 HTTPException are expected outcomes, not stage failures
+    return getattr(exc, "status_code", 500) >= 500
+
+
+class timed:
+    """
+    Record the duration of a stage in STAGE_SECONDS, and count the exceptions it raises in STAGE_ERRORS
+
+    Works as a context manager (sync or async) and as a decorator for functions, coroutines and async generators:
+
+        with timed("gridfs_write"):
+            fs.put(...)
+
+        @timed("vector_search")
+        async def search(...): ...
+
+    When a decorated coroutine returns a streaming response (anything with a body_iterator, such as Starlette's
+    StreamingResponse), the stage ends when the body has been sent rather than when the handler returns.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.labels(self.stage).observe(time.perf_counter() - self._start)
+        if exc is not None and _is_error(exc):
+            STAGE_ERRORS.labels(self.stage).inc()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    async def _finish_after(self, iterator):
+        """
+        Yield from a response body and end the stage once it is exhausted, fails or is closed by the client
+        """
+        error = None
+        try:
+            async for item in iterator:
+                yield item
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.__exit__(type(error) if error else None, error, None)
+
+    def __call__(self, func):
+        stage = self.stage
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def agen_wrapper(*args, **kwargs):
+                with timed(stage):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return agen_wrapper
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                timer = timed(stage).__enter__()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException as e:
+                    timer.__exit__(type(e), e, e.__traceback__)
+                    raise
+                if hasattr(result, "body_iterator"):
+                    result.body_iterator = timer._finish_after(result.body_iterator)
+                else:
+                    timer.__exit__(None, None, None)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_ocr_page(engine: str, latency_ms: float):
+    PAGES_PROCESSED.labels(engine).inc()
+    OCR_PAGE_SECONDS.labels(engine).observe(latency_ms / 1000)
+
+
+def render_metrics():
+    """
+    Current metrics in the Prometheus text exposition format
+    Returns:
+        tuple: (body, content type)
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
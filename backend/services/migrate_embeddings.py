@@ -0,0 +1,143 @@
+"""
+Rewrite the stored chunk embeddings of a collection in another storage format and/or fewer dimensions.
+Run from the backend directory:
+
+    python -m services.migrate_embeddings --storage int8 --dimensions 256 --dry-run
+    python -m services.migrate_embeddings --storage int8 --dimensions 256
+
+Defaults come from EMBEDDING_STORAGE and EMBEDDINGS_SIZE. Documents already in the target format
+are skipped, so an interrupted run can simply be started again. Each chunk's embedding_model key is
+rewritten to the new dimensions and format, so ingestion keeps reusing the converted vectors. Float vectors cannot be recovered
+from int8, and truncated dimensions cannot be restored; re-index the documents for that.
+
+After changing the dimensions or moving to or from int8, recreate the Atlas vector index (run
+setup_vector_search_index twice: once to drop it, once to create it with the new settings) and
+delete any local index under VECTOR_INDEX_PATH so it is rebuilt on startup.
+"""
+import argparse
+import logging
+import time
+
+import bson
+from pymongo import UpdateOne
+
+from core.config import MONGODB_CONNECTION_STRING, MONGODB_DATABASE, MONGODB_COLLECTION, \
+                        EMBEDDING_STORAGE, EMBEDDINGS_SIZE, NATIVE_EMBEDDING_DIMENSIONS
+from services.mongo import get_mongo_client
+from utils.vectors import EMBEDDING_STORAGE_FORMATS, encode_embedding, decode_embedding, embedding_storage_of, \
+                          embedding_key, parse_embedding_key
+
+logger = logging.getLogger(__name__)
+
+
+def encoded_size(value) -> int:
+    """
+    Bytes the embedding takes in a BSON document, field name and type byte included
+    """
+    return len(bson.encode({"document_embedding": value})) - 5
+
+
+def migrated_key(key: str, storage: str, length_before: int, length_after: int):
+    """
+    The embedding_model key of a chunk once its vector is stored in storage with length_after dimensions
+    """
+    if not key:
+        return key
+    model, dimensions, _ = parse_embedding_key(key)
+    if length_after != length_before:
+        dimensions = length_after
+    elif dimensions is None and length_after != NATIVE_EMBEDDING_DIMENSIONS.get(model, length_after):
+        # Keys written before dimensions were recorded: a vector shorter than the model's output was truncated
+        dimensions = length_after
+    return embedding_key(model, dimensions, storage)
+
+
+def migrate(collection, storage: str, dimensions: int = None, batch_size: int = 500, dry_run: bool = False):
+    """
+    Convert every document_embedding in the collection to the target storage format and dimensions
+    Args:
+        collection (Collection): Chunk collection
+        storage (str): "array", "float32" or "int8"
+        dimensions (int): Truncate to this many dimensions, or keep them all when 0/None
+        batch_size (int): Updates sent per bulk write
+        dry_run (bool): Only measure the sizes, write nothing
+
+    Returns:
+        dict: Counts of converted, skipped and re-keyed documents, and embedding bytes before and after
+    """
+    if storage not in EMBEDDING_STORAGE_FORMATS:
+        raise ValueError(f"Unsupported embedding storage: {storage}")
+    stats = {"converted": 0, "skipped": 0, "rekeyed": 0, "bytes_before": 0, "bytes_after": 0, "formats_before": {}}
+    updates = []
+
+    def flush():
+        if updates and not dry_run:
+            collection.bulk_write(updates, ordered=False)
+        updates.clear()
+
+    cursor = collection.find({"document_embedding": {"$exists": True}}, {"document_embedding": 1, "embedding_model": 1})
+    for doc in cursor:
+        value = doc["document_embedding"]
+        current = embedding_storage_of(value)
+        stats["formats_before"][current] = stats["formats_before"].get(current, 0) + 1
+        size = encoded_size(value)
+        stats["bytes_before"] += size
+
+        length = len(decode_embedding(value))
+        key = doc.get("embedding_model")
+        if current == storage and (not dimensions or length <= dimensions):
+            stats["skipped"] += 1
+            stats["bytes_after"] += size
+            new_key = migrated_key(key, storage, length, length)
+            if new_key != key:
+                stats["rekeyed"] += 1
+                updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding_model": new_key}}))
+                if len(updates) >= batch_size:
+                    flush()
+            continue
+        if current == "int8" and storage != "int8":
+            raise ValueError(f"Chunk {doc['_id']} is stored as int8 and cannot be converted back to {storage}; re-index it")
+
+        encoded = encode_embedding(value, storage, dimensions)
+        stats["bytes_after"] += encoded_size(encoded)
+        stats["converted"] += 1
+        fields = {"document_embedding": encoded}
+        new_key = migrated_key(key, storage, length, len(decode_embedding(encoded)))
+        if new_key != key:
+            stats["rekeyed"] += 1
+            fields["embedding_model"] = new_key
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(updates) >= batch_size:
+            flush()
+            logger.info(f"Converted {stats['converted']} embeddings")
+    flush()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storage", default=EMBEDDING_STORAGE, choices=EMBEDDING_STORAGE_FORMATS)
+    parser.add_argument("--dimensions", type=int, default=EMBEDDINGS_SIZE,
+                        help="Keep the first N dimensions (Matryoshka truncation); 0 keeps them all")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Report the size change without writing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    collection = get_mongo_client(MONGODB_CONNECTION_STRING)[MONGODB_DATABASE][MONGODB_COLLECTION]
+
+    start = time.perf_counter()
+    stats = migrate(collection, args.storage, args.dimensions, args.batch_size, args.dry_run)
+    elapsed = time.perf_counter() - start
+
+    total = stats["converted"] + stats["skipped"]
+    print(f"{'Would convert' if args.dry_run else 'Converted'} {stats['converted']} of {total} embeddings "
+          f"to {args.storage}{f' x {args.dimensions}' if args.dimensions else ''} in {elapsed:.1f}s "
+          f"(formats before: {stats['formats_before']}, {stats['rekeyed']} embedding keys updated)")
+    if total:
+        print(f"Embedding bytes: {stats['bytes_before']:,} -> {stats['bytes_after']:,} "
+              f"({stats['bytes_before'] / total:,.0f} -> {stats['bytes_after'] / total:,.0f} per chunk)")
+
+
+if __name__ == "__main__":
+    main()
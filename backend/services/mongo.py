@@ -0,0 +1,36 @@
+"""
+Shared MongoDB clients, so every component in a worker draws from the same connection pool
+"""
+from functools import lru_cache
+from pymongo import MongoClient, AsyncMongoClient
+from core.config import MONGODB_CONNECTION_STRING, MONGODB_MAX_POOL_SIZE, \
+                        MONGODB_MIN_POOL_SIZE, MONGODB_MAX_IDLE_TIME_MS, \
+                        MONGODB_WAIT_QUEUE_TIMEOUT_MS
+
+
+def pool_options():
+    """
+    Connection pool settings applied to both the sync and async clients
+    """
+    return {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+    }
+
+
+@lru_cache
+def get_mongo_client(connection_string: str = MONGODB_CONNECTION_STRING) -> MongoClient:
+    """
+    Get the process-wide synchronous client used for writes and maintenance
+    """
+    return MongoClient(connection_string, **pool_options())
+
+
+@lru_cache
+def get_async_mongo_client(connection_string: str = MONGODB_CONNECTION_STRING) -> AsyncMongoClient:
+    """
+    Get the process-wide asynchronous client used by request handlers
+    """
+    return AsyncMongoClient(connection_string, **pool_options())
@@ -0,0 +1,259 @@
+"""
+OCR providers: Mistral OCR, a local PDF text-layer extractor, and a hybrid that only sends image-only pages to Mistral
+"""
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from utils.pdf_reader import iter_pdf_text, extract_pages
+from services.metrics import timed
+from services.clients import get_mistral_client
+from services.rate_limit import get_rate_limiter
+from core.config import OCR_RATE_LIMIT_RPM
+import logging
+import re
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+class OCRProvider(ABC):
+    """
+    Turn a PDF into per-page text
+    """
+
+    name = "ocr"
+
+    @abstractmethod
+    def process(self, source, filename: str, pages: list = None):
+        """
+        OCR a PDF
+        Args:
+            source (str | bytes): Path to the PDF file, or its bytes
+            filename (str): Original file name
+            pages (list): 0-based page indexes to process, or all pages when None
+
+        Returns:
+            list: One dict per page with index, text, engine and latency_ms, in page order
+        """
+
+
+class MistralOCRProvider(OCRProvider):
+    """
+    OCR through Mistral: upload the file, get a signed URL, then run OCR on it
+    """
+
+    name = "mistral"
+
+    def __init__(self, mistral_client=None, model: str = "mistral-ocr-latest"):
+        """
+        Args:
+            mistral_client (Mistral): Client to use, or None for the shared client created on first use
+            model (str): Mistral OCR model
+        """
+        self._mistral_client = mistral_client
+        self.model = model
+
+    @property
+    def mistral_client(self):
+        return self._mistral_client or get_mistral_client()
+
+    @mistral_client.setter
+    def mistral_client(self, client):
+        self._mistral_client = client
+
+    def process(self, source, filename: str, pages: list = None):
+        start = time.perf_counter()
+
+        # Only upload the requested pages; response indexes are mapped back to the original page numbers
+        page_map = None
+        if pages is not None:
+            page_map = sorted(pages)
+            source = extract_pages(source, page_map)
+
+        # One token per document: the upload, signed URL and OCR calls make up a single OCR request
+        get_rate_limiter(self.name, self.model, OCR_RATE_LIMIT_RPM).acquire()
+
+        # Upload the file to Mistral, streaming it from disk when given a path
+        with timed("mistral_upload"), open(source, "rb") if isinstance(source, str) else nullcontext(source) as content:
+            uploaded_file = self.mistral_client.files.upload(
+                file={
+                    "file_name": filename,
+                    "content": content,
+                },
+                purpose="ocr"
+            )
+            logger.info(f"Uploaded {filename} to Mistral, file ID: {uploaded_file.id}")
+
+            # Retrieve signed URL from Mistral
+            signed_url = self.mistral_client.files.get_signed_url(file_id=uploaded_file.id)
+
+        # Perform OCR processing using the signed URL
+        with timed("mistral_ocr"):
+            ocr_response = self.mistral_client.ocr.process(
+                model=self.model,
+                document={
+                    "type": "document_url",
+                    "document_url": signed_url.url
+                }
+            )
+
+        if hasattr(ocr_response, 'pages'):
+            # Mistral returns each page as markdown, which the chunker splits on headings and paragraphs
+            texts = [(getattr(page, 'index', idx), getattr(page, 'markdown', None) or getattr(page, 'text', None) or str(page))
+                     for idx, page in enumerate(ocr_response.pages)]
+        else:
+            # Fallback for single page or different structure
+            texts = [(0, str(ocr_response))]
+        if page_map is not None:
+            texts = [(page_map[index], text) for index, text in texts]
+
+        # Mistral processes the pages in one call, so its latency is shared evenly across them
+        latency_ms = (time.perf_counter() - start) * 1000 / max(len(texts), 1)
+        logger.info(f"Mistral OCR processed {len(texts)} pages of {filename}")
+        return [
+            {"index": index, "text": text, "engine": self.name, "latency_ms": latency_ms}
+            for index, text in sorted(texts)
+        ]
+
+
+# A run of Arabic-script characters, including the presentation-form glyph blocks and combining marks
+ARABIC_WORD = re.compile(r"[\u0600-\u06ff\u0750-\u077f\ufb50-\ufdff\ufe70-\ufefc]+")
+ARABIC_ARTICLE = "\u0627\u0644"
+
+
+def _is_unmapped(char: str) -> bool:
+    """
+    Replacement and private-use characters come from glyphs whose font has no Unicode mapping
+    """
+    return char == "\ufffd" or "\ue000" <= char <= "\uf8ff" or unicodedata.category(char) == "Cc"
+
+
+def _is_presentation_form(char: str) -> bool:
+    return "\ufb50" <= char <= "\ufdff" or "\ufe70" <= char <= "\ufefc"
+
+
+def _arabic_letters(word: str) -> str:
+    """
+    Base letters of an Arabic word without diacritics, with alef wasla read as alef
+    """
+    return "".join(char for char in word if not unicodedata.combining(char)).replace("\u0671", "\u0627")
+
+
+def is_garbled_arabic(text: str, min_letters: int = 20, max_presentation_ratio: float = 0.2,
+                      max_detached_ratio: float = 0.3) -> bool:
+    """
+    Detect the broken Arabic that text-layer extraction produces for many right-to-left fonts: glyphs returned
+    as presentation forms, letters returned one at a time, or words returned in visual (reversed) order
+    Args:
+        text (str): Extracted page text
+        min_letters (int): Arabic letters needed before judging; pages with less Arabic are never garbled
+        max_presentation_ratio (float): Largest share of letters allowed to be presentation-form glyphs
+        max_detached_ratio (float): Largest share of words allowed to be a single letter
+    """
+    words = [_arabic_letters(word) for word in ARABIC_WORD.findall(text)]
+    words = [word for word in words if word]
+    letters = sum(len(word) for word in words)
+    if letters < min_letters:
+        return False
+    if sum(_is_presentation_form(char) for word in words for char in word) / letters > max_presentation_ratio:
+        return True
+    if sum(len(word) == 1 for word in words) / len(words) > max_detached_ratio:
+        return True
+    # The definite article opens many words; read in reverse it closes them instead
+    opening = sum(len(word) > 2 and word.startswith(ARABIC_ARTICLE) for word in words)
+    closing = sum(len(word) > 2 and word.endswith(ARABIC_ARTICLE[::-1]) for word in words)
+    return closing > max(opening, 2)
+
+
+def has_usable_text(text: str, min_chars: int = 50, min_alnum_ratio: float = 0.5,
+                    max_unmapped_ratio: float = 0.02) -> bool:
+    """
+    Decide whether an extracted text layer is real text rather than empty or garbled output: long enough,
+    mostly letters and digits, almost no unmapped glyphs, and no garbled Arabic
+    """
+    # Diacritics are neither letters nor noise, so vocalized text is judged on its base letters
+    stripped = "".join(char for char in "".join(text.split()) if not unicodedata.combining(char))
+    if len(stripped) < min_chars:
+        return False
+    if sum(_is_unmapped(char) for char in stripped) / len(stripped) > max_unmapped_ratio:
+        return False
+    alnum = sum(1 for char in stripped if char.isalnum())
+    if alnum / len(stripped) < min_alnum_ratio:
+        return False
+    return not is_garbled_arabic(text)
+
+
+class TextLayerOCRProvider(OCRProvider):
+    """
+    Extract the embedded text layer of born-digital PDFs locally, in parallel, without any remote call
+    """
+
+    name = "text_layer"
+
+    @timed("text_layer_extract")
+    def process(self, source, filename: str, pages: list = None):
+        wanted = set(pages) if pages is not None else None
+        return [
+            {"index": index, "text": text, "engine": self.name, "latency_ms": latency_ms}
+            for index, (text, latency_ms) in iter_pdf_text(source)
+            if wanted is None or index in wanted
+        ]
+
+
+class HybridOCRProvider(OCRProvider):
+    """
+    Use the local text layer where it is usable and send only image-only pages to a remote OCR provider
+    """
+
+    name = "hybrid"
+
+    def __init__(self, local: OCRProvider, remote: OCRProvider, min_chars: int = 50):
+        self.local = local
+        self.remote = remote
+        self.min_chars = min_chars
+
+    def process(self, source, filename: str, pages: list = None):
+        try:
+            results = {page["index"]: page for page in self.local.process(source, filename, pages)}
+        except Exception as e:
+            logger.warning(f"Text layer extraction failed for {filename}, using {self.remote.name} for every page: {e}")
+            return self.remote.process(source, filename, pages)
+
+        image_pages = sorted(index for index, page in results.items()
+                             if not has_usable_text(page["text"], self.min_chars))
+        logger.info(f"{filename}: {len(results) - len(image_pages)} pages from the text layer, "
+                    f"{len(image_pages)} sent to {self.remote.name}")
+        if image_pages:
+            for page in self.remote.process(source, filename, image_pages):
+                # Keep the time spent checking the text layer in the page's total
+                page["latency_ms"] += results[page["index"]]["latency_ms"]
+                results[page["index"]] = page
+        return [results[index] for index in sorted(results)]
+
+
+def make_ocr_provider(kind: str, mistral_client=None, min_chars: int = 50) -> OCRProvider:
+    """
+    Build the OCR provider named by OCR_PROVIDER: "mistral", "text_layer" or "hybrid"
+    """
+    if kind == "mistral":
+        return MistralOCRProvider(mistral_client)
+    if kind == "text_layer":
+        return TextLayerOCRProvider()
+    if kind == "hybrid":
+        return HybridOCRProvider(TextLayerOCRProvider(), MistralOCRProvider(mistral_client), min_chars=min_chars)
+    raise ValueError(f"Unsupported OCR provider: {kind}")
+
+
+def summarize_ocr_pages(pages: list) -> dict:
+    """
+    Per-engine page counts and latency for job reporting
+    """
+    summary = {}
+    for page in pages:
+        engine = summary.setdefault(page["engine"], {"pages": 0, "total_latency_ms": 0.0})
+        engine["pages"] += 1
+        engine["total_latency_ms"] += page["latency_ms"]
+    for engine in summary.values():
+        engine["mean_latency_ms"] = round(engine["total_latency_ms"] / engine["pages"], 2)
+        engine["total_latency_ms"] = round(engine["total_latency_ms"], 2)
+    return summary
@@ -0,0 +1,281 @@
+"""
+Prompt assembly for /generate-response: fit the conversation and retrieved context into an input token budget
+
+The latest messages are always sent verbatim. Older ones are added back newest first while they fit, and the
+rest are folded into a running summary kept per conversation_id, so each turn only summarizes the messages
+that newly fell out of the window. Chunks retrieved for earlier turns still in the window stay in the context,
+and a chunk retrieved again is only sent once.
+"""
+import hashlib
+import json
+import logging
+
+from services.cache import LRUCache
+from utils.format_request import format_context_list, format_references
+from utils.tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Role markers and separators the chat format adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+SUMMARY_PROMPT = """Summarize the conversation below for an assistant that will continue it.
+Keep the user's questions, the facts and references given in the answers, and any open points.
+Write plain sentences, no preamble."""
+
+
+def build_system_message(context: str) -> dict:
+    """
+    The system message carrying the retrieved context and the answering instructions
+    """
+    system_prompt = f"""You are a helpful AI assistant created by xAI. Use the following context to inform your responses:
+
+                    {context}
+
+                    Instructions:
+                    1. Provide accurate and relevant responses based on the given context.
+                    2. If the context doesn't contain sufficient information to answer, say so clearly.
+                    3. Maintain a neutral and professional tone.
+                    4. Do not make up information not present in the context or your training data.
+                    """
+    return {"role": "system", "content": system_prompt}
+
+
+def make_llm_summarizer(llm_service, model: str, max_tokens: int = 256):
+    """
+    Build a summarize function for PromptAssembler that asks the chat model to extend a running summary
+    """
+    def summarize(summary: str, messages: list) -> str:
+        transcript = "\n\n".join(f"{msg.get('role')}: {msg.get('content')}" for msg in messages)
+        if summary:
+            transcript = f"Summary so far:\n{summary}\n\nNew messages:\n{transcript}"
+        reply = llm_service.generate_response(
+            messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+            model=model,
+            max_tokens=max_tokens,
+        )
+        return (reply.content or "").strip()
+    return summarize
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _shorten(text: str, excess: int) -> str:
+    """
+    Cut about excess tokens off the end of text, or all of it when the tokenizer cannot shorten it further
+    """
+    tokens = count_tokens(text)
+    shorter = truncate_tokens(text, tokens - excess)
+    return shorter if count_tokens(shorter) < tokens else ""
+
+
+def _chunk_key(result: dict):
+    return result.get("chunk_id") or result.get("text")
+
+
+def _messages_hash(messages) -> str:
+    payload = json.dumps([[msg.get("role"), msg.get("content")] for msg in messages])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PromptAssembler:
+    """
+    Build the messages sent to the LLM for one turn, within a token budget, remembering per conversation
+    what was summarized and which chunks earlier turns retrieved
+    """
+
+    def __init__(self, summarize=None, recent_messages: int = 4, summary_tokens: int = 256,
+                 max_conversations: int = 1024, ttl: float = 86400):
+        """
+        :param summarize: Function (previous summary, messages) -> new summary, or None to drop old messages.
+        :param recent_messages: Latest messages always kept verbatim, the current question included.
+        :param summary_tokens: Output budget for a summary; 0 drops old messages instead of summarizing them.
+        :param max_conversations: Conversations remembered before the least recently used is forgotten.
+        :param ttl: Seconds a conversation is remembered after its last turn; 0 disables expiry.
+        """
+        self.summarize = summarize
+        self.recent_messages = recent_messages
+        self.summary_tokens = summary_tokens
+        self.conversations = LRUCache(max_size=max_conversations, ttl=ttl)
+
+    def _state(self, conversation_id: str, messages: list, turn: int) -> dict:
+        """
+        The remembered state of a conversation, reset when the client's history no longer matches it
+        """
+        empty = {"summary": "", "summarized": 0, "summarized_hash": _messages_hash([]), "turns": []}
+        if not conversation_id:
+            return empty
+        state = self.conversations.get(conversation_id)
+        if state is None:
+            return empty
+        # A cleared or edited chat reuses the id with a different history
+        if state["summarized"] > len(messages) \
+                or _messages_hash(messages[:state["summarized"]]) != state["summarized_hash"] \
+                or any(previous["turn"] > turn for previous in state["turns"]):
+            logger.info(f"Conversation {conversation_id} history changed, starting over")
+            return empty
+        return state
+
+    def assemble(self, messages: list, search_results: list, conversation_id: str = None,
+                 max_tokens: int = 6000, context_tokens: int = 3000) -> dict:
+        """
+        Assemble the prompt for one turn
+        Args:
+            messages (list): Conversation from the client, ending with the current user message
+            search_results (list): Chunks retrieved for the current question, best first
+            conversation_id (str): Client-chosen id for the chat, enabling summaries and chunk reuse
+            max_tokens (int): Input token budget for the whole prompt, summary included, which is never exceeded
+            context_tokens (int): Part of the budget available to retrieved chunks
+
+        Returns:
+            dict: messages to send, the context string, the chunk_ids in it and their references, and a usage
+                breakdown
+        """
+        messages = [dict(msg) for msg in messages]
+        turn = sum(1 for msg in messages if msg.get("role") == "user")
+        state = self._state(conversation_id, messages, turn)
+
+        # Chunks for this question first, then those earlier turns in the window retrieved, newest turn first
+        current_ids = {_chunk_key(result) for result in search_results}
+        seen = set()
+        candidates = []
+        for result in list(search_results) + [result for previous in reversed(state["turns"])
+                                              for result in previous["results"]]:
+            if _chunk_key(result) in seen:
+                continue
+            seen.add(_chunk_key(result))
+            candidates.append(result)
+        context, used = format_context_list(candidates, max_tokens=context_tokens, return_used=True)
+        system_message = build_system_message(context)
+        system_tokens = message_tokens(system_message)
+
+        # The newest messages are kept whatever they cost; older ones only while the budget allows,
+        # and never those already folded into the summary
+        summarized = state["summarized"]
+        keep_from = max(summarized, len(messages) - self.recent_messages)
+        summarizing = bool(conversation_id) and self.summarize is not None and self.summary_tokens > 0
+        summary_allowance = self.summary_tokens + MESSAGE_OVERHEAD_TOKENS if summarizing else 0
+        budget = max_tokens - system_tokens - summary_allowance - sum(map(message_tokens, messages[keep_from:]))
+        while keep_from > summarized and message_tokens(messages[keep_from - 1]) <= budget:
+            keep_from -= 1
+            budget -= message_tokens(messages[keep_from])
+
+        summary = state["summary"]
+        dropped = 0
+        if keep_from > summarized:
+            folded = messages[summarized:keep_from]
+            if summarizing:
+                try:
+                    summary = self.summarize(summary, folded)
+                    summarized = keep_from
+                except Exception as e:
+                    logger.warning(f"Summarizing conversation {conversation_id} failed, dropping old messages: {e}")
+                    dropped = len(folded)
+            else:
+                dropped = len(folded)
+
+        # The summary can come back longer than its allowance, and the newest messages alone can overflow:
+        # cut the summary, then the context, then the oldest recent messages, then the question itself
+        kept = messages[keep_from:]
+        prompt_summary = summary
+
+        def summary_tokens():
+            return message_tokens({"content": SUMMARY_HEADER + prompt_summary}) if prompt_summary else 0
+
+        def overflow():
+            return system_tokens + summary_tokens() + sum(map(message_tokens, kept)) - max_tokens
+
+        while prompt_summary and overflow() > 0:
+            prompt_summary = _shorten(prompt_summary, overflow())
+        while overflow() > 0 and used:
+            context, used = format_context_list(candidates, max_tokens=max(0, count_tokens(context) - overflow()),
+                                                return_used=True)
+            system_message = build_system_message(context)
+            system_tokens = message_tokens(system_message)
+        while overflow() > 0 and len(kept) > 1:
+            kept.pop(0)
+            keep_from += 1
+            dropped += 1
+        if overflow() > 0 and kept:
+            logger.warning(f"Prompt budget of {max_tokens} tokens is too small, truncating the latest message")
+            while kept[-1].get("content") and overflow() > 0:
+                kept[-1]["content"] = _shorten(kept[-1]["content"], overflow())
+
+        prompt = []
+        if prompt_summary:
+            prompt.append({"role": "system", "content": SUMMARY_HEADER + prompt_summary})
+        prompt += kept
+        prompt.append(system_message)
+
+        if conversation_id:
+            self._remember(conversation_id, state, messages, search_results, summary, summarized, keep_from)
+
+        history_tokens = sum(message_tokens(msg) for msg in prompt[:-1])
+        if history_tokens + system_tokens > max_tokens:
+            logger.warning(f"Prompt of {history_tokens + system_tokens} tokens exceeds its budget of {max_tokens}")
+        return {
+            "messages": prompt,
+            "context": context,
+            "chunk_ids": [result.get("chunk_id") for result in used],
+            "references": format_references(used),
+            # The conversation's whole running summary, which record_turn takes back
+            "summary": summary,
+            "doc_ids": {result.get("doc_id") for result in used},
+            "usage": {
+                "prompt_tokens": history_tokens + system_tokens,
+                "context_tokens": count_tokens(context),
+                "history_tokens": history_tokens,
+                "messages_kept": len(messages) - keep_from,
+                # Folded into the summary this turn, and in total
+                "messages_summarized": summarized - state["summarized"],
+                "messages_in_summary": summarized,
+                "messages_dropped": dropped,
+                "chunks_from_earlier_turns": sum(1 for result in used if _chunk_key(result) not in current_ids),
+            },
+        }
+
+    def _remember(self, conversation_id: str, state: dict, messages: list, search_results: list, summary: str,
+                  summarized: int, keep_from: int):
+        """
+        Remember a turn's chunks while its messages can still be in the verbatim window, with the summary so far.
+        A retried turn replaces what was remembered for it.
+        """
+        turn = sum(1 for msg in messages if msg.get("role") == "user")
+        turns = [previous for previous in state["turns"] if previous["turn"] != turn]
+        turns.append({"turn": turn, "results": list(search_results)})
+        first_kept_turn = turn - sum(1 for msg in messages[keep_from:] if msg.get("role") == "user")
+        self.conversations.set(conversation_id, {
+            "summary": summary,
+            "summarized": summarized,
+            "summarized_hash": _messages_hash(messages[:summarized]),
+            "turns": [previous for previous in turns if previous["turn"] > first_kept_turn][-self.recent_messages:],
+        })
+
+    def record_turn(self, messages: list, search_results: list, conversation_id: str = None, summary: str = "",
+                    summarized: int = 0, messages_kept: int = None):
+        """
+        Remember a turn answered without assembling its prompt, e.g. from the response cache, as assemble would have
+        Args:
+            messages (list): Conversation from the client, ending with the current user message
+            search_results (list): Chunks retrieved for the current question
+            conversation_id (str): Client-chosen id for the chat; nothing is remembered without one
+            summary (str): Summary the answer's prompt was assembled with, from assemble's result
+            summarized (int): Messages folded into that summary
+            messages_kept (int): Messages the prompt sent verbatim, defaulting to recent_messages
+        """
+        if not conversation_id:
+            return
+        messages = [dict(msg) for msg in messages]
+        turn = sum(1 for msg in messages if msg.get("role") == "user")
+        state = self._state(conversation_id, messages, turn)
+        # The same history was summarized when the answer was made; keep whichever summary covers more of it
+        if summarized > state["summarized"] and summarized <= len(messages):
+            state = {**state, "summary": summary, "summarized": summarized}
+        kept = self.recent_messages if messages_kept is None else messages_kept
+        keep_from = max(state["summarized"], len(messages) - kept)
+        self._remember(conversation_id, state, messages, search_results, state["summary"], state["summarized"],
+                       keep_from)
@@ -0,0 +1,245 @@
+"""
+Token-bucket rate limits for provider calls (Gemini embeddings and chat, Mistral OCR), and retries with
+exponential backoff for calls that hit a rate limit or a transient server error
+
+Each provider and model gets its own bucket. With RATE_LIMIT_BACKEND=mongo the bucket is a document updated
+atomically by every worker and instance, so the configured rate is shared across the deployment; with "local"
+each process keeps its own bucket and the rate applies per process.
+"""
+from contextlib import nullcontext
+from functools import lru_cache
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from core.config import RATE_LIMIT_BACKEND, RATE_LIMIT_COLLECTION, RATE_LIMIT_BURST_SECONDS, RATE_LIMIT_MAX_WAIT, \
+                        MONGODB_CONNECTION_STRING, MONGODB_DATABASE
+from services.metrics import RATE_LIMIT_WAIT_SECONDS, RATE_LIMIT_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(Exception):
+    """
+    A provider call would have waited longer than RATE_LIMIT_MAX_WAIT for its rate limit
+    """
+
+    status_code = 429
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"Rate limit for {key} exceeded, retry in {retry_after:.1f}s")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class LocalTokenBucket:
+    """
+    Thread-safe token bucket kept in this process
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: Tokens added per second.
+        :param capacity: Most tokens the bucket holds, i.e. the largest burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, cost: float = 1) -> float:
+        """
+        Take cost tokens if the bucket holds them
+        Returns:
+            float: 0 when the tokens were taken, else the seconds until enough will have accumulated
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return 0.0
+            return (cost - self._tokens) / self.rate
+
+
+class MongoTokenBucket:
+    """
+    Token bucket stored in a MongoDB document and shared by every process using the same collection
+
+    The refill and the take happen in one pipeline update timed by the server clock ($$NOW), so concurrent
+    callers on different hosts never spend the same token and host clock skew does not matter.
+    """
+
+    def __init__(self, collection, key: str, rate: float, capacity: float):
+        self.collection = collection
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def try_acquire(self, cost: float = 1) -> float:
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        refilled = {"$min": [self.capacity,
+                             {"$add": [{"$ifNull": ["$tokens", self.capacity]}, {"$multiply": [elapsed, self.rate]}]}]}
+        granted = {"$gte": ["$tokens", cost]}
+        bucket = self.collection.find_one_and_update(
+            {"_id": self.key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": "$$NOW"}},
+                {"$set": {"granted": granted,
+                          "tokens": {"$cond": [granted, {"$subtract": ["$tokens", cost]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["granted"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / self.rate
+
+
+class RateLimiter:
+    """
+    Wait for a token before each provider call, giving up with RateLimitExceeded past max_wait
+    """
+
+    def __init__(self, provider: str, model: str, bucket=None, max_wait: float = 30, fallback=None):
+        """
+        :param provider: Provider label used in metrics.
+        :param model: Model label used in metrics.
+        :param bucket: LocalTokenBucket or MongoTokenBucket, or None for no limit.
+        :param max_wait: Longest a call may queue for a token, in seconds.
+        :param fallback: Bucket used while the shared bucket cannot be reached.
+        """
+        self.provider = provider
+        self.model = model
+        self.bucket = bucket
+        self.max_wait = max_wait
+        self.fallback = fallback
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    def _try_acquire(self, cost: float) -> float:
+        try:
+            return self.bucket.try_acquire(cost)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            logger.warning(f"Shared rate limit for {self.key} unavailable, limiting locally: {e}")
+            return self.fallback.try_acquire(cost)
+
+    def _next_delay(self, start: float, cost: float) -> float:
+        """
+        Seconds to sleep before trying again, 0 once a token was taken
+        Raises:
+            RateLimitExceeded: If the wait would go past max_wait
+        """
+        delay = self._try_acquire(cost)
+        waited = time.perf_counter() - start
+        if not delay:
+            RATE_LIMIT_WAIT_SECONDS.labels(self.provider, self.model).observe(waited)
+            return 0.0
+        if waited + delay > self.max_wait:
+            RATE_LIMIT_REJECTED.labels(self.provider, self.model).inc()
+            raise RateLimitExceeded(self.key, delay)
+        return delay
+
+    def acquire(self, cost: float = 1):
+        """
+        Block the calling thread until cost tokens are taken
+        """
+        if self.bucket is None:
+            return
+        start = time.perf_counter()
+        while delay := self._next_delay(start, cost):
+            time.sleep(delay)
+
+    async def acquire_async(self, cost: float = 1):
+        """
+        Wait on the event loop until cost tokens are taken
+        """
+        if self.bucket is None:
+            return
+        start = time.perf_counter()
+        while True:
+            # A shared bucket is a MongoDB round trip, so it is checked off the event loop
+            if isinstance(self.bucket, MongoTokenBucket):
+                delay = await asyncio.to_thread(self._next_delay, start, cost)
+            else:
+                delay = self._next_delay(start, cost)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+
+@lru_cache
+def _rate_limit_collection():
+    from services.mongo import get_mongo_client
+    return get_mongo_client(MONGODB_CONNECTION_STRING)[MONGODB_DATABASE][RATE_LIMIT_COLLECTION]
+
+
+@lru_cache
+def get_rate_limiter(provider: str, model: str, rpm: float) -> RateLimiter:
+    """
+    Get the process-wide limiter for a provider and model
+    Args:
+        provider (str): Provider name, e.g. "gemini" or "mistral"
+        model (str): Model the calls go to; each model has its own quota
+        rpm (float): Requests per minute allowed, from the matching *_RATE_LIMIT_RPM setting; 0 for no limit
+    """
+    if rpm <= 0:
+        return RateLimiter(provider, model)
+    rate = rpm / 60
+    capacity = max(1.0, rate * RATE_LIMIT_BURST_SECONDS)
+    local = LocalTokenBucket(rate, capacity)
+    if RATE_LIMIT_BACKEND == "mongo":
+        shared = MongoTokenBucket(_rate_limit_collection(), f"{provider}:{model}", rate, capacity)
+        return RateLimiter(provider, model, shared, RATE_LIMIT_MAX_WAIT, fallback=local)
+    if RATE_LIMIT_BACKEND != "local":
+        raise ValueError(f"Unsupported rate limit backend: {RATE_LIMIT_BACKEND}")
+    return RateLimiter(provider, model, local, RATE_LIMIT_MAX_WAIT)
+
+
+def is_retryable(error) -> bool:
+    """
+    Check whether a Gemini API error, or a wait for our own rate limit, is worth retrying
+    """
+    if isinstance(error, RateLimitExceeded):
+        return True
+    from google.genai import errors
+    return isinstance(error, errors.APIError) and error.code in RETRYABLE_STATUS_CODES
+
+
+async def call_with_retry(func, *args, max_retries: int = 5, base_delay: float = 1.0, semaphore=None,
+                          description: str = "Provider call"):
+    """
+    Run a blocking provider call in a worker thread, backing off exponentially on rate limits and server errors
+    Args:
+        func (callable): The call, run as func(*args)
+        max_retries (int): Retries before the last error is raised
+        base_delay (float): Seconds before the first retry, doubled for each further one, plus jitter
+        semaphore (asyncio.Semaphore): Slot held during each attempt, released while backing off
+        description (str): What is being called, for the retry log
+    """
+    attempt = 0
+    while True:
+        async with semaphore or nullcontext():
+            try:
+                return await asyncio.to_thread(func, *args)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= max_retries:
+                    raise
+        # Sleep outside the semaphore so other calls can use the slot
+        delay = base_delay * (2 ** attempt) + random.uniform(0, base_delay)
+        attempt += 1
+        logger.warning(f"{description} rate limited, retry {attempt}/{max_retries} in {delay:.1f}s")
+        await asyncio.sleep(delay)
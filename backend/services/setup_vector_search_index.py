@@ -1,43 +1,58 @@
-from dotenv import load_dotenv
-import os
+"""
+Create (or drop, when it exists) the Atlas vector search index, and create the full-text search index
+used by SEARCH_MODE=hybrid when it is missing. Run from the backend directory:
+
+    python -m services.setup_vector_search_index
+"""
 from pymongo.mongo_client import MongoClient
 from pymongo.operations import SearchIndexModel
+from core.config import MONGODB_CONNECTION_STRING, MONGODB_DATABASE, MONGODB_COLLECTION, \
+                        MONGODB_SEARCH_INDEX_NAME, MONGODB_VECTOR_EMBEDDING_PATH, EMBEDDING_DIMENSIONS, \
+                        MONGODB_TEXT_SEARCH_INDEX_NAME, EMBEDDING_STORAGE
 
+import sys
 import time
 
-_ = load_dotenv()
+if not EMBEDDING_DIMENSIONS:
+  sys.exit("Set EMBEDDINGS_SIZE: the vector index needs the embedding size, and EMBEDDING_MODEL's is not known")
 
 # Connect to your Atlas deployment
-uri = os.getenv("MONGODB_CONNECTION_STRING")
-EMBEDDINGS_SIZE = int(os.getenv("EMBEDDINGS_SIZE"))
-client = MongoClient(uri)
+client = MongoClient(MONGODB_CONNECTION_STRING)
 
 # Access your database and collection
-database = client[os.getenv("MONGODB_DATABASE")]
-collection = database[os.getenv("MONGODB_COLLECTION")]
+database = client[MONGODB_DATABASE]
+collection = database[MONGODB_COLLECTION]
 
-index_name = os.getenv("MONGODB_SEARCH_INDEX_NAME")
+index_name = MONGODB_SEARCH_INDEX_NAME
 
 index_exists = any(index['name'] == index_name for index in collection.list_search_indexes())
 
 if index_exists:
-  collection.drop_search_index(os.getenv("MONGODB_SEARCH_INDEX_NAME"))
+  collection.drop_search_index(index_name)
 else:
 
+  vector_field = {
+    "type": "vector",
+    "numDimensions": EMBEDDING_DIMENSIONS,
+    "path": MONGODB_VECTOR_EMBEDDING_PATH,
+    "similarity": "cosine",
+  }
+  # Atlas quantizes float vectors itself; int8 binary vectors are already quantized
+  if EMBEDDING_STORAGE != "int8":
+    vector_field["quantization"] = "scalar"
+
   # Create your index model, then create the search index
   search_index_model = SearchIndexModel(
     definition={
       "fields": [
+        vector_field,
         {
-          "type": "vector",
-          "numDimensions": EMBEDDINGS_SIZE,
-          "path": os.getenv("MONGODB_VECTOR_EMBEDDING_PATH"),
-          "similarity": "cosine",
-          "quantization": "scalar"
+          "type": "filter",
+          "path": "doc_id"
         }
       ]
     },
-    name=os.getenv("MONGODB_SEARCH_INDEX_NAME"),
+    name=index_name,
     type="vectorSearch"
   )
 
@@ -57,4 +72,22 @@ else:
     time.sleep(5)
   print(result + " is ready for querying.")
 
-  client.close()
+# Full-text index for hybrid search: text and reference are analyzed, doc_id is filterable
+if not any(index['name'] == MONGODB_TEXT_SEARCH_INDEX_NAME for index in collection.list_search_indexes()):
+  text_index_model = SearchIndexModel(
+    definition={
+      "mappings": {
+        "dynamic": False,
+        "fields": {
+          "text": {"type": "string", "analyzer": "lucene.standard"},
+          "reference": {"type": "string", "analyzer": "lucene.whitespace"},
+          "doc_id": {"type": "token"}
+        }
+      }
+    },
+    name=MONGODB_TEXT_SEARCH_INDEX_NAME,
+    type="search"
+  )
+  print("New search index named " + collection.create_search_index(model=text_index_model) + " is building.")
+
+client.close()
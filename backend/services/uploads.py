@@ -0,0 +1,79 @@
+"""
+Store uploaded PDFs in GridFS once per distinct content
+"""
+from gridfs import AsyncGridFSBucket
+from gridfs.errors import FileExists
+from pymongo.asynchronous.collection import AsyncCollection
+from services.metrics import process_rss_bytes, UPLOAD_PEAK_RSS_BYTES
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    """
+    The upload is larger than the configured limit
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"PDF is larger than the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+async def store_upload(bucket: AsyncGridFSBucket, files: AsyncCollection, upload, filename: str,
+                       content_type: str, max_bytes: int, chunk_size: int):
+    """
+    Stream an upload into GridFS in chunk_size pieces, hashing and counting it in the same pass.
+    The hash goes into the files document written when the upload closes, so the unique index on metadata.sha256
+    admits one copy of the same bytes however many uploads of it run at once; the others are dropped.
+    Args:
+        bucket (AsyncGridFSBucket): Bucket the PDF is stored in
+        files (AsyncCollection): The bucket's files collection
+        upload: Object with an async read(size) method, e.g. a FastAPI UploadFile
+        filename (str): Name the file is stored under
+        content_type (str): MIME type recorded with the file
+        max_bytes (int): Largest upload accepted
+        chunk_size (int): Bytes read and written at a time
+
+    Returns:
+        tuple: (file_id, size in bytes, sha256 hex digest, existing), where existing is the files document of
+            an earlier copy of the same bytes, whose id is then file_id, or None when this upload was stored
+
+    Raises:
+        UploadTooLarge: When the upload is larger than max_bytes; nothing is left stored
+    """
+    digest = hashlib.sha256()
+    size = 0
+    peak_rss = process_rss_bytes()
+    grid_in = bucket.open_upload_stream(filename, metadata={"content_type": content_type})
+    try:
+        while chunk := await upload.read(chunk_size):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+            await grid_in.write(chunk)
+            peak_rss = max(peak_rss, process_rss_bytes())
+        file_hash = digest.hexdigest()
+        await grid_in.set("metadata", {"content_type": content_type, "sha256": file_hash})
+        await grid_in.close()
+    except FileExists:
+        # Another upload of the same bytes was stored first; drop the chunks written for this one
+        await grid_in.abort()
+        existing = await files.find_one({"metadata.sha256": file_hash})
+        if existing is None:
+            raise
+        return existing["_id"], size, file_hash, existing
+    except BaseException:
+        await grid_in.abort()
+        raise
+    finally:
+        UPLOAD_PEAK_RSS_BYTES.observe(peak_rss)
+
+    # Without the unique index, e.g. while files stored by older versions still share a hash, the earliest copy wins
+    existing = await files.find_one({"metadata.sha256": file_hash, "_id": {"$lt": grid_in._id}}, sort=[("_id", 1)])
+    if existing is not None:
+        await bucket.delete(grid_in._id)
+        return existing["_id"], size, file_hash, existing
+    return grid_in._id, size, file_hash, None
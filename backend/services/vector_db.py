@@ -1,32 +1,244 @@
 
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import BulkWriteError
 from core.config import MONGODB_CONNECTION_STRING, MONGODB_DATABASE, \
                             MONGODB_COLLECTION, EMBEDDING_MODEL, \
                             MONGODB_SEARCH_INDEX_NAME, MONGODB_SEARCH_TOP_K, \
-                            MONGODB_VECTOR_EMBEDDING_PATH
+                            MONGODB_VECTOR_EMBEDDING_PATH, INSERT_BATCH_SIZE, \
+                            VECTOR_BACKEND, VECTOR_INDEX_PATH, VECTOR_INDEX_DTYPE, \
+                            EMBEDDING_DIMENSIONS, EMBEDDING_STORAGE, SEARCH_MODE, LEXICAL_BACKEND, LEXICAL_INDEX_PATH, \
+                            MONGODB_TEXT_SEARCH_INDEX_NAME, RRF_K, HYBRID_CANDIDATES_FACTOR, \
+                            FIND_BATCH_CONCURRENCY, VERSE_NEIGHBORS
 from utils.format_request import format_inserts
-from services.embeddings import embeddings_function
+from utils.verses import parse_reference
+from utils.vectors import decode_embedding
+from services.embeddings import embeddings_function, embed_queries
+from services.mongo import get_mongo_client, get_async_mongo_client
+from services.metrics import timed, COALESCED_CALLS
+from services.cache import SingleFlight, normalize_text
+from services.vector_index import VectorBackend, AtlasVectorBackend, LocalVectorBackend, make_local_index
+from services.lexical_index import LexicalBackend, AtlasSearchBackend, LocalLexicalBackend, BM25Index, \
+                                   lexical_text, reciprocal_rank_fusion
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 class VectorDB:
-    def __init__(self):
+    def __init__(self, connection_string: str = MONGODB_CONNECTION_STRING,
+                 database: str = MONGODB_DATABASE, collection: str = MONGODB_COLLECTION,
+                 mongodb_client: MongoClient = None, async_mongodb_client: AsyncMongoClient = None,
+                 backend: VectorBackend = None, lexical_backend: LexicalBackend = None):
         """
         Initialize the VectorDB connection, database, and collection
         Args:
             connection_string (str): Connection string to the MongoDB database
             database (str): Name of the MongoDB database
             collection (str): Name of the MongoDB collection
+            mongodb_client (MongoClient): Existing client to reuse instead of the shared pool
+            async_mongodb_client (AsyncMongoClient): Existing async client to reuse instead of the shared pool
+            backend (VectorBackend): Vector search backend, built from VECTOR_BACKEND when omitted
+            lexical_backend (LexicalBackend): Full-text backend for hybrid search, built from LEXICAL_BACKEND
+                when omitted and SEARCH_MODE is hybrid
             
         """
-        self.mongodb_client = MongoClient(MONGODB_CONNECTION_STRING)
-        self.db = self.mongodb_client[MONGODB_DATABASE]
-        self.collection: Collection = self.db[MONGODB_COLLECTION]
+        self.mongodb_client = mongodb_client or get_mongo_client(connection_string)
+        self.db = self.mongodb_client[database]
+        self.collection: Collection = self.db[collection]
+
+        # Request handlers read through the async client so they never block the event loop
+        self.async_mongodb_client = async_mongodb_client or get_async_mongo_client(connection_string)
+        self.async_db = self.async_mongodb_client[database]
+        self.async_collection: AsyncCollection = self.async_db[collection]
+
+        # Callbacks told which documents' chunks changed, e.g. to invalidate cached answers
+        self._change_listeners = []
+        # Identical searches in flight at the same time share one embedding and one backend query
+        self._find_calls = SingleFlight()
+
+        self.backend = backend if backend is not None else self._make_backend()
+        self.lexical_backend = lexical_backend
+        if self.lexical_backend is None and SEARCH_MODE == "hybrid":
+            self.lexical_backend = self._make_lexical_backend()
+        if self._local_backends(empty=True):
+            self.rebuild_local_index()
+        # A saved index can be older than the collection, e.g. after another worker wrote to it
+        if self._local_backends():
+            self.sync_local_index()
+
+    def _make_backend(self) -> VectorBackend:
+        """
+        Build the vector search backend selected by VECTOR_BACKEND
+        """
+        if VECTOR_BACKEND == "atlas":
+            return AtlasVectorBackend(self.async_collection, MONGODB_SEARCH_INDEX_NAME, MONGODB_VECTOR_EMBEDDING_PATH,
+                                      storage=EMBEDDING_STORAGE)
+        index = make_local_index(VECTOR_BACKEND, VECTOR_INDEX_PATH, dimensions=EMBEDDING_DIMENSIONS, dtype=VECTOR_INDEX_DTYPE)
+        return LocalVectorBackend(index, self.async_collection)
+
+    def _make_lexical_backend(self) -> LexicalBackend:
+        """
+        Build the full-text search backend selected by LEXICAL_BACKEND
+        """
+        if LEXICAL_BACKEND == "atlas":
+            return AtlasSearchBackend(self.async_collection, MONGODB_TEXT_SEARCH_INDEX_NAME)
+        if LEXICAL_BACKEND == "bm25":
+            return LocalLexicalBackend(BM25Index(LEXICAL_INDEX_PATH), self.async_collection)
+        raise ValueError(f"Unsupported lexical backend: {LEXICAL_BACKEND}")
+
+    def _local_backends(self, empty: bool = False):
+        """
+        Backends that mirror MongoDB in process, optionally only those holding nothing yet
+        """
+        backends = [backend for backend in (self.backend, self.lexical_backend)
+                    if backend is not None and backend.local]
+        return [backend for backend in backends if not len(backend)] if empty else backends
+
+    def rebuild_local_index(self, batch_size: int = 10000):
+        """
+        Load every stored chunk into the empty local indexes, e.g. when no saved index exists yet
+        """
+        targets = self._local_backends(empty=True)
+        batch = []
+        cursor = self.collection.find({}, {"_id": 1, "doc_id": 1, "document_embedding": 1, "text": 1, "reference": 1})
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self._index_documents(batch, targets)
+                batch = []
+        if batch:
+            self._index_documents(batch, targets)
+        for backend in targets:
+            if len(backend):
+                logger.info(f"Rebuilt local {type(backend).__name__} with {len(backend)} chunks")
+                backend.save()
+
+    def sync_local_index(self, batch_size: int = 10000) -> bool:
+        """
+        Bring the local indexes in line with the collection when it changed behind them, e.g. through another
+        worker or while a saved index file was not being updated. Only the difference is loaded or dropped.
+        Returns:
+            bool: True when any local index was changed
+        """
+        backends = self._local_backends()
+        if not backends:
+            return False
+        # Cheap fingerprint first: chunk count and newest chunk id
+        count = self.collection.estimated_document_count()
+        newest = self.collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        newest_id = str(newest["_id"]) if newest else None
+        local_ids = {backend: set(backend.ids()) for backend in backends}
+        stale = [backend for backend in backends
+                 if len(local_ids[backend]) != count or max(local_ids[backend], default=None) != newest_id]
+        if not stale:
+            return False
+
+        stored = {str(doc["_id"]): doc["_id"] for doc in self.collection.find({}, {"_id": 1})}
+        changed = False
+        for backend in stale:
+            extra = local_ids[backend] - stored.keys()
+            missing = [stored[chunk_id] for chunk_id in stored.keys() - local_ids[backend]]
+            if not extra and not missing:
+                continue
+            changed = True
+            backend.remove(list(extra))
+            for start in range(0, len(missing), batch_size):
+                cursor = self.collection.find({"_id": {"$in": missing[start:start + batch_size]}},
+                                              {"_id": 1, "doc_id": 1, "document_embedding": 1, "text": 1, "reference": 1})
+                self._index_documents(list(cursor), [backend])
+            logger.info(f"Synced local {type(backend).__name__} with the collection: "
+                        f"{len(missing)} chunks added, {len(extra)} removed")
+            backend.save()
+        if changed:
+            self._chunks_changed(None)
+        return changed
+
+    def _index_documents(self, documents, backends=None):
+        """
+        Mirror inserted documents into the local vector and full-text backends
+        """
+        if not documents:
+            return
+        ids = [str(doc["_id"]) for doc in documents]
+        doc_ids = [doc.get("doc_id") for doc in documents]
+        for backend in self._local_backends() if backends is None else backends:
+            if backend is self.backend:
+                backend.add(ids, [decode_embedding(doc["document_embedding"]) for doc in documents], doc_ids)
+            else:
+                backend.add(ids, [lexical_text(doc) for doc in documents], doc_ids)
+
+    def _unindex(self, query):
+        """
+        Drop the local entries of documents about to be deleted
+        """
+        backends = self._local_backends()
+        if backends:
+            ids = [str(_id) for _id in self.collection.distinct("_id", query)]
+            for backend in backends:
+                backend.remove(ids)
+
+    def add_change_listener(self, callback):
+        """
+        Register callback(doc_ids) to run whenever chunks are inserted or deleted; doc_ids is None when every document changed
+        """
+        self._change_listeners.append(callback)
+
+    def _chunks_changed(self, doc_ids):
+        for callback in self._change_listeners:
+            try:
+                callback(doc_ids)
+            except Exception as e:
+                logger.warning(f"Chunk change listener failed: {e}")
+
+    def save_index(self):
+        """
+        Persist the local vector and full-text indexes, if used
+        """
+        self.backend.save()
+        if self.lexical_backend is not None:
+            self.lexical_backend.save()
 
     def ping(self):
         """
         Check if the MongoDB connection is active"""
         return self.mongodb_client.admin.command('ping')
 
+    def ensure_indexes(self):
+        """
+        Create the secondary indexes used for deduplication lookups
+        """
+        # One chunk per position, so a job resumed by a second worker cannot store its chunks twice; chunks inserted
+        # without a position through /insert are left out. The non-unique index older versions created is replaced.
+        position_index = "doc_id_1_embedding_model_1_page_1_chunk_index_1"
+        existing = self.collection.index_information().get(position_index)
+        if existing is not None and not existing.get("unique"):
+            self.collection.drop_index(position_index)
+        self.collection.create_index([("doc_id", 1), ("embedding_model", 1), ("page", 1), ("chunk_index", 1)],
+                                     unique=True, partialFilterExpression={"chunk_index": {"$type": "number"}})
+        self.collection.create_index("doc_id")
+        self.collection.create_index([("content_hash", 1), ("embedding_model", 1)])
+        # Verse records only: reference lookups and neighbour expansion are range scans on this index
+        self.collection.create_index([("chapter", 1), ("verse", 1), ("doc_id", 1)],
+                                     partialFilterExpression={"verse": {"$exists": True}})
+        # One stored copy of each uploaded PDF; the upload that loses the race drops its own. Files stored by older
+        # versions can share a hash, and then keep the non-unique index until the extra copies are deleted.
+        files = self.db["fs.files"]
+        existing = files.index_information().get("metadata.sha256_1")
+        if existing is None or not existing.get("unique"):
+            hashed = {"metadata.sha256": {"$exists": True}}
+            if files.count_documents(hashed) > len(files.distinct("metadata.sha256", hashed)):
+                logger.warning("Several stored PDFs share a sha256, keeping a non-unique index on metadata.sha256")
+                files.create_index("metadata.sha256")
+            else:
+                if existing is not None:
+                    files.drop_index("metadata.sha256_1")
+                files.create_index("metadata.sha256", unique=True, partialFilterExpression=hashed)
+        self.db["fs.files"].create_index([("metadata.doc_id", 1), ("metadata.kind", 1), ("metadata.page", 1)])
+
+    @timed("mongo_insert")
     def insert(self, data):
         """
         Insert data into the MongoDB collection
@@ -39,41 +251,372 @@ class VectorDB:
         formatted_data = format_inserts(data)
 
         if self.collection.insert_one(formatted_data):
+            self._index_documents([formatted_data])
+            self._chunks_changed([formatted_data["doc_id"]])
             return True
         return False
 
-    async def find(self, data, top_searches: int = 5):
+    @timed("mongo_insert")
+    async def insert_async(self, data):
+        """
+        Insert data into the MongoDB collection through the async client, for request handlers
+        Args:
+            data (dict): Data to be inserted into the collection
+
+        Returns:
+            bool: True if the data was successfully inserted, False otherwise
+        """
+        formatted_data = format_inserts(data)
+
+        result = await self.async_collection.insert_one(formatted_data)
+        if result.acknowledged:
+            await asyncio.to_thread(self._index_documents, [formatted_data])
+            self._chunks_changed([formatted_data["doc_id"]])
+            return True
+        return False
+
+    def insert_many(self, documents, batch_size: int = INSERT_BATCH_SIZE):
+        """
+        Insert documents into the MongoDB collection in unordered bulk batches
+        Args:
+            documents (iterable): Documents to be inserted, formatted with format_inserts
+            batch_size (int): Maximum number of documents sent per insert_many call
+
+        Returns:
+            dict: Total inserted and failed counts, plus the counts for every batch
+        """
+        report = {"inserted": 0, "failed": 0, "batches": []}
+
+        def flush(batch):
+            try:
+                with timed("mongo_insert"):
+                    result = self.collection.insert_many(batch, ordered=False)
+                inserted, failed = len(result.inserted_ids), 0
+                self._index_documents(batch)
+            except BulkWriteError as e:
+                # With ordered=False the server keeps going past failed documents
+                inserted = e.details.get("nInserted", 0)
+                write_errors = e.details.get("writeErrors", [])
+                failed = len(write_errors)
+                failed_indexes = {error["index"] for error in write_errors}
+                self._index_documents([doc for i, doc in enumerate(batch) if i not in failed_indexes])
+                logger.warning(f"Bulk insert batch {len(report['batches'])}: {failed} of {len(batch)} documents failed")
+            if inserted:
+                self._chunks_changed({doc.get("doc_id") for doc in batch})
+            report["batches"].append({"batch": len(report["batches"]), "inserted": inserted, "failed": failed})
+            report["inserted"] += inserted
+            report["failed"] += failed
+
+        batch = []
+        for document in documents:
+            batch.append(format_inserts(document))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        return report
+
+    @timed("mongo_lookup")
+    def get_indexed_chunks(self, doc_id: str, embedding_model: str, mode: str = "chunks"):
+        """
+        (page, chunk_index) pairs of a document already stored under the given embedding key and ingestion mode
+        """
+        cursor = self.collection.find(
+            {"doc_id": doc_id, "embedding_model": embedding_model, "verse": {"$exists": mode == "verses"},
+             # Matches the unique position index's filter, so the lookup can use it
+             "chunk_index": {"$type": "number"}},
+            {"_id": 0, "page": 1, "chunk_index": 1}
+        )
+        return {(doc.get("page"), doc.get("chunk_index")) for doc in cursor}
+
+    @timed("mongo_lookup")
+    def get_embeddings_by_hash(self, content_hashes, embedding_model: str):
+        """
+        Fetch stored embeddings for chunks whose text hashes match, stored under the same embedding key
+        Args:
+            content_hashes (list): SHA-256 hex digests of chunk texts
+            embedding_model (str): embedding_key (model, dimensions and storage format) the stored vectors must have
+
+        Returns:
+            dict: Mapping of content hash to the stored document_embedding value, unconverted
+        """
+        cursor = self.collection.find(
+            {"content_hash": {"$in": list(set(content_hashes))}, "embedding_model": embedding_model},
+            {"_id": 0, "content_hash": 1, "document_embedding": 1}
+        )
+        return {doc["content_hash"]: doc["document_embedding"] for doc in cursor}
+
+    async def find(self, data, top_searches: int = 5, doc_ids: list = None, mode: str = None):
         """
         Find data in the MongoDB collection
+        Args:
+            data (str): Query text
+            top_searches (int): Number of results to return
+            doc_ids (list): Restrict the search to chunks of these documents, or search all when empty
+            mode (str): "vector" or "hybrid", defaulting to SEARCH_MODE
         """
-        embeddings = embeddings_function(text = data)
-
-        pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": MONGODB_SEARCH_INDEX_NAME,
-                    "queryVector": embeddings,
-                    "path": MONGODB_VECTOR_EMBEDDING_PATH,
-                    "exact": True,
-                    "limit": top_searches
-                }
+        # A bare reference such as "2:255" is read straight from the verse index, without embedding it,
+        # falling back to search when no document was indexed in verse mode
+        reference = parse_reference(data)
+        if reference is not None:
+            results = await self.lookup_verses(*reference, doc_ids=doc_ids)
+            if results:
+                return results
+
+        async def find():
+            embeddings = await asyncio.to_thread(embeddings_function, text = data)
+            return await self.search(embeddings, top_searches, doc_ids=doc_ids, query=data, mode=mode)
+
+        key = (normalize_text(data), top_searches, tuple(sorted(doc_ids or ())), mode or SEARCH_MODE)
+        results, shared = await self._find_calls.do_async(key, find)
+        if shared:
+            COALESCED_CALLS.labels("search").inc()
+            # Each caller gets its own result dicts, since handlers may add fields to them
+            results = [dict(result) for result in results]
+        return results
+
+    async def find_many(self, queries, top_searches: int = 5, doc_ids: list = None, mode: str = None):
+        """
+        Find the chunks for several queries, embedding them together and searching them as one batch
+        Args:
+            queries (list): Query texts
+            top_searches (int): Number of results to return per query
+            doc_ids (list): Restrict the search to chunks of these documents, or search all when empty
+            mode (str): "vector" or "hybrid", defaulting to SEARCH_MODE
+
+        Returns:
+            dict: results (one dict per query with its results and its own search_ms, which is None for vector
+                searches on a local index, where the batch is scored at once) and the batch's timings_ms
+        """
+        mode = self.check_search_mode(mode)
+        start = time.perf_counter()
+        embeddings = await asyncio.to_thread(embed_queries, list(queries))
+        embedded = time.perf_counter()
+
+        if mode == "vector" and self.backend.local:
+            # A local index scores every query in one matrix product, so no query has a search time of its own;
+            # only the batch's is reported, in timings_ms
+            with timed("vector_search_batch"):
+                results = await self.backend.search_many(embeddings, top_searches, doc_ids=doc_ids)
+            search_ms = None
+        else:
+            # Atlas searches and hybrid searches are one call per query, run concurrently and timed one by one
+            if mode == "vector":
+                def search(i):
+                    return self._vector_search(embeddings[i], top_searches, doc_ids)
+            else:
+                def search(i):
+                    return self._hybrid_search(embeddings[i], queries[i], top_searches, doc_ids)
+            semaphore = asyncio.Semaphore(FIND_BATCH_CONCURRENCY)
+            search_ms = [None] * len(queries)
+
+            async def run(i):
+                async with semaphore:
+                    # Timed from when the query gets a slot, so the wait for other queries is not counted
+                    query_start = time.perf_counter()
+                    found = await search(i)
+                    search_ms[i] = round((time.perf_counter() - query_start) * 1000, 1)
+                return found
+
+            results = await asyncio.gather(*(run(i) for i in range(len(queries))))
+        results = await asyncio.gather(*(self.expand_verses(found) for found in results))
+
+        finished = time.perf_counter()
+        search_ms = search_ms or [None] * len(queries)
+        entries = [{"query": query, "results": found, "search_ms": elapsed}
+                   for query, found, elapsed in zip(queries, results, search_ms)]
+        return {
+            "results": entries,
+            "timings_ms": {
+                "embedding": round((embedded - start) * 1000, 1),
+                "search": round((finished - embedded) * 1000, 1),
+                "total": round((finished - start) * 1000, 1),
             },
-            {"$project": {
-                "_id": 0, #Excluded
-                "document_embedding": 0, #Excluded
-                "timestamp": 0, #Excluded
-                "search_score": { "$meta": "vectorSearchScore"}
-            }}
-        ]
-        
-        return list(self.collection.aggregate(pipeline))
+        }
+
+    async def search(self, embedding, top_searches: int = 5, doc_ids: list = None, query: str = None, mode: str = None):
+        """
+        Find the chunks closest to an already computed query embedding
+        Args:
+            embedding (list): Query embedding
+            top_searches (int): Number of results to return
+            doc_ids (list): Restrict the search to chunks of these documents, or search all when empty
+            query (str): Query text, required for hybrid search
+            mode (str): "vector" or "hybrid", defaulting to SEARCH_MODE
+        """
+        mode = self.check_search_mode(mode)
+        if mode == "vector" or query is None:
+            results = await self._vector_search(embedding, top_searches, doc_ids)
+        else:
+            results = await self._hybrid_search(embedding, query, top_searches, doc_ids)
+        return await self.expand_verses(results)
+
+    @timed("verse_lookup")
+    async def lookup_verses(self, chapter: int, first: int, last: int = None, doc_ids: list = None,
+                            neighbors: int = VERSE_NEIGHBORS):
+        """
+        Read a verse or a range of verses of one chapter with a range scan on the (chapter, verse) index
+        Args:
+            chapter (int): Chapter number
+            first (int): First verse of the reference
+            last (int): Last verse of the reference, defaulting to first
+            doc_ids (list): Restrict the lookup to these documents, or read every document when empty
+            neighbors (int): Verses added on each side of the reference
+
+        Returns:
+            list: Verse records in verse order; neighbours carry the reference they surround in neighbor_of
+        """
+        last = first if last is None else last
+        query = {"chapter": chapter, "verse": {"$gte": max(1, first - neighbors), "$lte": last + neighbors}}
+        if doc_ids:
+            query["doc_id"] = {"$in": list(doc_ids)}
+        reference = f"{chapter}:{first}" if first == last else f"{chapter}:{first}-{last}"
+        cursor = self.async_collection.find(query, {"document_embedding": 0, "timestamp": 0},
+                                            sort=[("chapter", 1), ("verse", 1), ("doc_id", 1)])
+        results = []
+        async for doc in cursor:
+            doc["chunk_id"] = str(doc.pop("_id"))
+            if not first <= doc["verse"] <= last:
+                doc["neighbor_of"] = reference
+            results.append(doc)
+        return results
+
+    @timed("verse_expand")
+    async def expand_verses(self, results, neighbors: int = VERSE_NEIGHBORS):
+        """
+        Surround every verse in the results with its neighbouring verses, read in one query made of index
+        range scans, instead of retrieving more results to get the surrounding text
+        Args:
+            results (list): Search results, best first
+            neighbors (int): Verses added on each side of each verse hit
+
+        Returns:
+            list: The results with each verse hit's neighbours around it in verse order, each chunk once
+        """
+        hits = [result for result in results if result.get("verse") is not None]
+        if neighbors <= 0 or not hits:
+            return results
+
+        # One range per document and chapter, merging hits whose windows overlap
+        windows = {}
+        for hit in hits:
+            windows.setdefault((hit["doc_id"], hit["chapter"]), []).append(
+                (max(1, hit["verse"] - neighbors), hit["verse"] + neighbors))
+        ranges = []
+        for (doc_id, chapter), spans in windows.items():
+            spans.sort()
+            low, high = spans[0]
+            for start, end in spans[1:]:
+                if start > high + 1:
+                    ranges.append({"doc_id": doc_id, "chapter": chapter, "verse": {"$gte": low, "$lte": high}})
+                    low = start
+                high = max(high, end)
+            ranges.append({"doc_id": doc_id, "chapter": chapter, "verse": {"$gte": low, "$lte": high}})
+
+        verses = {}
+        async for doc in self.async_collection.find({"$or": ranges}, {"document_embedding": 0, "timestamp": 0}):
+            doc["chunk_id"] = str(doc.pop("_id"))
+            verses[(doc["doc_id"], doc["chapter"], doc["verse"])] = doc
+
+        expanded = []
+        seen = set()
+
+        def add(result):
+            if result["chunk_id"] not in seen:
+                seen.add(result["chunk_id"])
+                expanded.append(result)
+
+        for result in results:
+            if result.get("verse") is None:
+                add(result)
+                continue
+            doc_id, chapter, verse = result["doc_id"], result["chapter"], result["verse"]
+            reference = f"{chapter}:{verse}"
+            for number in range(verse - neighbors, verse + neighbors + 1):
+                if number == verse:
+                    add(result)
+                elif (doc_id, chapter, number) in verses:
+                    add({**verses[(doc_id, chapter, number)], "neighbor_of": reference})
+        return expanded
+
+    def check_search_mode(self, mode: str = None) -> str:
+        """
+        Resolve a requested search mode against SEARCH_MODE and the configured backends
+        Raises:
+            ValueError: If the mode is unknown, or hybrid without a full-text backend
+        """
+        mode = mode or SEARCH_MODE
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unsupported search mode: {mode}")
+        if mode == "hybrid" and self.lexical_backend is None:
+            raise ValueError("Hybrid search needs a full-text backend; set SEARCH_MODE=hybrid")
+        return mode
+
+    @timed("vector_search")
+    async def _vector_search(self, embedding, top_searches: int, doc_ids: list = None):
+        return await self.backend.search(embedding, top_searches, doc_ids=doc_ids)
+
+    @timed("lexical_search")
+    async def _lexical_search(self, query: str, top_searches: int, doc_ids: list = None):
+        return await self.lexical_backend.search(query, top_searches, doc_ids=doc_ids)
+
+    @timed("hybrid_search")
+    async def _hybrid_search(self, embedding, query: str, top_searches: int, doc_ids: list = None):
+        """
+        Run the vector and full-text queries concurrently and merge them with reciprocal rank fusion
+        """
+        candidates = top_searches * HYBRID_CANDIDATES_FACTOR
+        vector_results, lexical_results = await asyncio.gather(
+            self._vector_search(embedding, candidates, doc_ids),
+            self._lexical_search(query, candidates, doc_ids),
+        )
+        documents = {}
+        for result in vector_results + lexical_results:
+            documents.setdefault(result["chunk_id"], result)
+        fused = reciprocal_rank_fusion([
+            [result["chunk_id"] for result in vector_results],
+            [result["chunk_id"] for result in lexical_results],
+        ], k=RRF_K)
+        results = []
+        for chunk_id, score in fused[:top_searches]:
+            document = dict(documents[chunk_id])
+            document["search_score"] = score
+            results.append(document)
+        return results
     
+    @timed("mongo_delete")
+    def delete_document(self, doc_id: str):
+        """
+        Delete every chunk of one document, leaving other documents untouched
+        Returns:
+            int: Number of chunks deleted
+        """
+        self._unindex({"doc_id": doc_id})
+        deleted = self.collection.delete_many({"doc_id": doc_id}).deleted_count
+        self._chunks_changed([doc_id])
+        return deleted
+
+    def delete_stale_chunks(self, doc_id: str, embedding_model: str, mode: str = "chunks"):
+        """
+        Delete a document's chunks stored under a different embedding key or indexed in the other ingestion mode
+        """
+        query = {"doc_id": doc_id, "$or": [{"embedding_model": {"$ne": embedding_model}},
+                                           {"verse": {"$exists": mode != "verses"}}]}
+        self._unindex(query)
+        deleted = self.collection.delete_many(query).deleted_count
+        if deleted:
+            self._chunks_changed([doc_id])
+        return deleted
+
     def clean_collection(self):
         """
         Clean the MongoDB collection
         """
         if self.collection.count_documents({}) != 0:
+            self._unindex({})
             self.collection.delete_many({})
+            self._chunks_changed(None)
             return True
         return False
 
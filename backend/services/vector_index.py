@@ -0,0 +1,543 @@
+"""
+Pluggable vector search backends used by VectorDB: Atlas $vectorSearch or a local in-process index
+"""
+from abc import ABC, abstractmethod
+from pymongo.asynchronous.collection import AsyncCollection
+from bson.objectid import ObjectId
+from utils.vectors import encode_embedding
+import numpy as np
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VectorBackend(ABC):
+    """
+    Interface for the component that ranks stored chunks against a query vector
+    """
+
+    #: Whether chunks must be added to the backend explicitly after being written to MongoDB
+    local = False
+
+    def add(self, ids, vectors, doc_ids):
+        """
+        Add vectors for chunks already stored in MongoDB
+        """
+
+    def remove(self, ids):
+        """
+        Remove vectors for the given chunk ids
+        """
+
+    def save(self):
+        """
+        Persist the index, if the backend keeps one
+        """
+
+    def ids(self):
+        """
+        Chunk ids held by the backend, if it keeps its own index
+        """
+        return []
+
+    def __len__(self):
+        return 0
+
+    @abstractmethod
+    async def search(self, query_vector, top_k: int, doc_ids: list = None):
+        """
+        Rank chunks by similarity to query_vector
+        Returns:
+            list: Chunk documents with a search_score field, best first
+        """
+
+    async def search_many(self, query_vectors, top_k: int, doc_ids: list = None, max_concurrency: int = 16):
+        """
+        Rank chunks for several query vectors, running up to max_concurrency searches at once
+        Returns:
+            list: One result list per query vector, in the same order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(query_vector):
+            async with semaphore:
+                return await self.search(query_vector, top_k, doc_ids=doc_ids)
+
+        return await asyncio.gather(*(run(query_vector) for query_vector in query_vectors))
+
+
+class AtlasVectorBackend(VectorBackend):
+    """
+    Exact $vectorSearch against a MongoDB Atlas search index
+    """
+
+    def __init__(self, collection: AsyncCollection, index_name: str, path: str, exact: bool = True,
+                 storage: str = "array"):
+        """
+        :param storage: EMBEDDING_STORAGE of the indexed field; binary vector fields are queried with a vector of the same type.
+        """
+        self.collection = collection
+        self.index_name = index_name
+        self.path = path
+        self.exact = exact
+        self.storage = storage
+
+    async def search(self, query_vector, top_k: int, doc_ids: list = None):
+        vector_search = {
+            "index": self.index_name,
+            "queryVector": query_vector if self.storage == "array" else encode_embedding(query_vector, self.storage),
+            "path": self.path,
+            "exact": self.exact,
+            "limit": top_k
+        }
+        if not self.exact:
+            vector_search["numCandidates"] = top_k * 20
+        if doc_ids:
+            vector_search["filter"] = {"doc_id": {"$in": list(doc_ids)}}
+
+        pipeline = [
+            {
+                "$vectorSearch": vector_search
+            },
+            {"$addFields": {"chunk_id": {"$toString": "$_id"}}},
+            {"$project": {
+                "_id": 0, #Excluded
+                "document_embedding": 0, #Excluded
+                "timestamp": 0, #Excluded
+                "search_score": { "$meta": "vectorSearchScore"}
+            }}
+        ]
+        cursor = await self.collection.aggregate(pipeline)
+        return await cursor.to_list()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorIndex(ABC):
+    """
+    In-process index over chunk ids. Returns (id, score) pairs; VectorDB fetches the documents.
+    """
+
+    @abstractmethod
+    def add(self, ids, vectors, doc_ids): ...
+
+    @abstractmethod
+    def remove(self, ids): ...
+
+    @abstractmethod
+    def search(self, query_vector, top_k: int, doc_ids: list = None): ...
+
+    def search_many(self, query_vectors, top_k: int, doc_ids: list = None):
+        return [self.search(query_vector, top_k, doc_ids) for query_vector in query_vectors]
+
+    @abstractmethod
+    def save(self): ...
+
+    @abstractmethod
+    def ids(self):
+        """
+        Live chunk ids, used to check the index against the collection
+        """
+
+    @abstractmethod
+    def __len__(self): ...
+
+
+class NumpyVectorIndex(LocalVectorIndex):
+    """
+    Brute-force cosine index over a memory-mapped float32 or int8 matrix
+    """
+
+    def __init__(self, path: str, dtype: str = "float32", block_size: int = 65536):
+        """
+        :param path: Directory holding vectors.npy and meta.json.
+        :param dtype: "float32" for exact scores or "int8" for scalar-quantized storage at a quarter of the size.
+        :param block_size: Rows scored per matrix product, bounding temporary memory for int8 and memmaps.
+        """
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.block_size = block_size
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._pending = []
+        self._ids = []
+        self._doc_ids = []
+        self._live = np.zeros(0, dtype=bool)
+        self._positions = {}
+        self.load()
+
+    def _encode(self, vectors):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return vectors
+
+    def _merged(self):
+        """
+        Fold vectors added since the last search into the main matrix
+        """
+        if self._pending:
+            parts = ([self._matrix] if self._matrix is not None else []) + self._pending
+            self._matrix = np.concatenate(parts)
+            self._pending = []
+        return self._matrix
+
+    def add(self, ids, vectors, doc_ids):
+        if not len(ids):
+            return
+        encoded = self._encode(vectors)
+        with self._lock:
+            # Re-adding a chunk replaces its vector, so a sync racing an insert cannot duplicate it
+            self.remove(ids)
+            start = len(self._ids)
+            self._pending.append(encoded)
+            self._ids.extend(ids)
+            self._doc_ids.extend(doc_ids)
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            for offset, chunk_id in enumerate(ids):
+                self._positions[chunk_id] = start + offset
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                position = self._positions.pop(chunk_id, None)
+                if position is not None:
+                    self._live[position] = False
+
+    def ids(self):
+        with self._lock:
+            return list(self._positions)
+
+    def search(self, query_vector, top_k: int, doc_ids: list = None):
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        with self._lock:
+            matrix = self._merged()
+            if matrix is None or not len(self._positions):
+                return []
+            mask = self._live
+            if doc_ids:
+                mask = mask & np.isin(np.asarray(self._doc_ids, dtype=object), list(doc_ids))
+            ids = self._ids
+
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), self.block_size):
+            block = matrix[start:start + self.block_size]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        if self.dtype == np.int8:
+            scores /= 127.0
+        scores[~mask[:len(scores)]] = -np.inf
+
+        k = min(top_k, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top]
+
+    def search_many(self, query_vectors, top_k: int, doc_ids: list = None, max_scores: int = 1 << 24):
+        """
+        Score several queries with one matrix product per block of rows
+        :param max_scores: Most scores held at once; queries are taken in groups that stay under it.
+        """
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32))
+        with self._lock:
+            matrix = self._merged()
+            if matrix is None or not len(self._positions):
+                return [[] for _ in queries]
+            mask = self._live
+            if doc_ids:
+                mask = mask & np.isin(np.asarray(self._doc_ids, dtype=object), list(doc_ids))
+            ids = self._ids
+        k = min(top_k, int(mask.sum()))
+        if k <= 0:
+            return [[] for _ in queries]
+
+        results = []
+        group = max(1, max_scores // len(matrix))
+        for first in range(0, len(queries), group):
+            batch = queries[first:first + group]
+            scores = np.empty((len(batch), len(matrix)), dtype=np.float32)
+            for start in range(0, len(matrix), self.block_size):
+                block = matrix[start:start + self.block_size]
+                scores[:, start:start + len(block)] = batch @ block.astype(np.float32, copy=False).T
+            if self.dtype == np.int8:
+                scores /= 127.0
+            scores[:, ~mask[:scores.shape[1]]] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, candidates in zip(scores, top):
+                ordered = candidates[np.argsort(-row[candidates])]
+                results.append([(ids[i], float(row[i])) for i in ordered])
+        return results
+
+    def save(self):
+        """
+        Write live vectors to disk, compacting away removed rows
+        """
+        with self._lock:
+            matrix = self._merged()
+            if matrix is None:
+                return
+            keep = np.flatnonzero(self._live)
+            matrix = np.ascontiguousarray(matrix[keep])
+            ids = [self._ids[i] for i in keep]
+            doc_ids = [self._doc_ids[i] for i in keep]
+
+            os.makedirs(self.path, exist_ok=True)
+            tmp_vectors = os.path.join(self.path, "vectors.tmp.npy")
+            np.save(tmp_vectors, matrix)
+            tmp_meta = os.path.join(self.path, "meta.tmp.json")
+            with open(tmp_meta, "w") as f:
+                json.dump({"dtype": self.dtype.name, "ids": ids, "doc_ids": doc_ids}, f)
+            os.replace(tmp_vectors, os.path.join(self.path, "vectors.npy"))
+            os.replace(tmp_meta, os.path.join(self.path, "meta.json"))
+
+            self._matrix = matrix
+            self._ids, self._doc_ids = ids, doc_ids
+            self._live = np.ones(len(ids), dtype=bool)
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+    def load(self):
+        """
+        Memory-map a saved index, so loading costs a metadata read rather than a full copy
+        """
+        vectors_path = os.path.join(self.path, "vectors.npy")
+        meta_path = os.path.join(self.path, "meta.json")
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            return
+        start = time.perf_counter()
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["dtype"] != self.dtype.name:
+            logger.warning(f"Ignoring {self.path}: stored as {meta['dtype']}, configured as {self.dtype.name}")
+            return
+        with self._lock:
+            self._matrix = np.load(vectors_path, mmap_mode="r")
+            self._pending = []
+            self._ids, self._doc_ids = meta["ids"], meta["doc_ids"]
+            self._live = np.ones(len(self._ids), dtype=bool)
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        logger.info(f"Loaded {len(self._ids)} vectors from {self.path} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def __len__(self):
+        return len(self._positions)
+
+
+class HNSWVectorIndex(LocalVectorIndex):
+    """
+    Approximate cosine index backed by an hnswlib HNSW graph
+    """
+
+    def __init__(self, path: str, dimensions: int, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The hnswlib package is required for the hnsw vector backend") from e
+        self._hnswlib = hnswlib
+        self.path = path
+        self.dimensions = dimensions
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._lock = threading.RLock()
+        self._index = None
+        self._labels = {}
+        self._ids = []
+        self._doc_ids = []
+        self.load()
+
+    def _create(self, capacity: int):
+        index = self._hnswlib.Index(space="cosine", dim=self.dimensions)
+        index.init_index(max_elements=capacity, ef_construction=self.ef_construction, M=self.m)
+        index.set_ef(self.ef_search)
+        return index
+
+    def add(self, ids, vectors, doc_ids):
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._index is None:
+                self._index = self._create(max(1024, len(ids) * 2))
+            # Re-adding a chunk replaces its vector, so a sync racing an insert cannot duplicate it
+            self.remove(ids)
+            needed = len(self._ids) + len(ids)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+            labels = np.arange(len(self._ids), needed)
+            self._index.add_items(vectors, labels)
+            for label, chunk_id in zip(labels, ids):
+                self._labels[chunk_id] = int(label)
+            self._ids.extend(ids)
+            self._doc_ids.extend(doc_ids)
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                label = self._labels.pop(chunk_id, None)
+                if label is not None:
+                    self._index.mark_deleted(label)
+
+    def ids(self):
+        with self._lock:
+            return list(self._labels)
+
+    def search(self, query_vector, top_k: int, doc_ids: list = None):
+        with self._lock:
+            if self._index is None or not self._labels:
+                return []
+            k = min(top_k, len(self._labels))
+            allowed = None
+            if doc_ids:
+                wanted = set(doc_ids)
+                allowed = lambda label: self._doc_ids[label] in wanted
+                # hnswlib raises if fewer than k labels pass the filter
+                k = min(k, sum(1 for label in self._labels.values() if self._doc_ids[label] in wanted))
+                if k == 0:
+                    return []
+            labels, distances = self._index.knn_query(
+                np.asarray(query_vector, dtype=np.float32), k=k, filter=allowed
+            )
+        return [(self._ids[label], 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+    def search_many(self, query_vectors, top_k: int, doc_ids: list = None):
+        """
+        Query the graph for several vectors in one knn_query call, which hnswlib spreads over its threads
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        with self._lock:
+            if self._index is None or not self._labels:
+                return [[] for _ in query_vectors]
+            k = min(top_k, len(self._labels))
+            allowed = None
+            if doc_ids:
+                wanted = set(doc_ids)
+                allowed = lambda label: self._doc_ids[label] in wanted
+                k = min(k, sum(1 for label in self._labels.values() if self._doc_ids[label] in wanted))
+                if k == 0:
+                    return [[] for _ in query_vectors]
+            labels, distances = self._index.knn_query(query_vectors, k=k, filter=allowed)
+        return [
+            [(self._ids[label], 1.0 - float(distance)) for label, distance in zip(row_labels, row_distances)]
+            for row_labels, row_distances in zip(labels, distances)
+        ]
+
+    def save(self):
+        with self._lock:
+            if self._index is None:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            tmp_index = os.path.join(self.path, "hnsw.tmp.bin")
+            self._index.save_index(tmp_index)
+            tmp_meta = os.path.join(self.path, "hnsw.tmp.json")
+            with open(tmp_meta, "w") as f:
+                json.dump({"ids": self._ids, "doc_ids": self._doc_ids, "live": self._labels}, f)
+            os.replace(tmp_index, os.path.join(self.path, "hnsw.bin"))
+            os.replace(tmp_meta, os.path.join(self.path, "hnsw.json"))
+
+    def load(self):
+        index_path = os.path.join(self.path, "hnsw.bin")
+        meta_path = os.path.join(self.path, "hnsw.json")
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return
+        start = time.perf_counter()
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with self._lock:
+            self._index = self._hnswlib.Index(space="cosine", dim=self.dimensions)
+            self._index.load_index(index_path, max_elements=max(1024, len(meta["ids"]) * 2))
+            self._index.set_ef(self.ef_search)
+            self._ids, self._doc_ids, self._labels = meta["ids"], meta["doc_ids"], meta["live"]
+        logger.info(f"Loaded HNSW index with {len(self._labels)} vectors from {self.path} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def __len__(self):
+        return len(self._labels)
+
+
+async def fetch_ranked(collection: AsyncCollection, ranked):
+    """
+    Load the documents for (id, score) pairs from a local index, keeping the ranking order
+    """
+    return (await fetch_ranked_many(collection, [ranked]))[0]
+
+
+async def fetch_ranked_many(collection: AsyncCollection, ranked_lists):
+    """
+    Load the documents for several rankings with a single query, keeping each ranking's order
+    """
+    chunk_ids = {chunk_id for ranked in ranked_lists for chunk_id, _ in ranked}
+    if not chunk_ids:
+        return [[] for _ in ranked_lists]
+    cursor = collection.find(
+        {"_id": {"$in": [ObjectId(chunk_id) for chunk_id in chunk_ids]}},
+        {"document_embedding": 0, "timestamp": 0}
+    )
+    documents = {str(doc.pop("_id")): doc async for doc in cursor}
+    results = []
+    for ranked in ranked_lists:
+        found = []
+        for chunk_id, score in ranked:
+            doc = documents.get(chunk_id)
+            if doc is not None:
+                # A chunk can rank for several queries, each with its own score
+                found.append({**doc, "chunk_id": chunk_id, "search_score": score})
+        results.append(found)
+    return results
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    Rank chunks with an in-process index, then fetch the winning documents from MongoDB
+    """
+
+    local = True
+
+    def __init__(self, index: LocalVectorIndex, collection: AsyncCollection):
+        self.index = index
+        self.collection = collection
+
+    def add(self, ids, vectors, doc_ids):
+        self.index.add(ids, vectors, doc_ids)
+
+    def remove(self, ids):
+        self.index.remove(ids)
+
+    def save(self):
+        self.index.save()
+
+    def ids(self):
+        return self.index.ids()
+
+    def __len__(self):
+        return len(self.index)
+
+    async def search(self, query_vector, top_k: int, doc_ids: list = None):
+        ranked = await asyncio.to_thread(self.index.search, query_vector, top_k, doc_ids)
+        return await fetch_ranked(self.collection, ranked)
+
+    async def search_many(self, query_vectors, top_k: int, doc_ids: list = None, max_concurrency: int = 16):
+        ranked_lists = await asyncio.to_thread(self.index.search_many, query_vectors, top_k, doc_ids)
+        return await fetch_ranked_many(self.collection, ranked_lists)
+
+
+def make_local_index(kind: str, path: str, dimensions: int = None, dtype: str = "float32"):
+    """
+    Build the local index named by VECTOR_BACKEND
+    """
+    if kind == "numpy":
+        return NumpyVectorIndex(path, dtype=dtype)
+    if kind == "hnsw":
+        if not dimensions:
+            raise ValueError("EMBEDDINGS_SIZE must be set for the hnsw vector backend when the model's size is unknown")
+        return HNSWVectorIndex(path, dimensions)
+    raise ValueError(f"Unsupported local vector backend: {kind}")
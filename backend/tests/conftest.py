@@ -0,0 +1,68 @@
+"""
+Shared test setup: every test runs against the offline fake providers, with no API keys or network access
+"""
+import os
+
+os.environ.setdefault("PROVIDER_MODE", "fake")
+os.environ.setdefault("FAKE_EMBEDDING_LATENCY_MS", "0")
+os.environ.setdefault("EMBEDDING_MODEL", "text-embedding-004")
+os.environ.setdefault("EMBEDDINGS_SIZE", "768")
+
+import pytest
+
+
+class AsyncCursor:
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    async def to_list(self, length=None):
+        return self.documents
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+
+class AsyncCollection:
+    """
+    Await-able view of a mongomock collection, standing in for pymongo's AsyncCollection
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.database[name])
+
+
+class AsyncClient:
+    def __init__(self, client):
+        self.client = client
+
+    def __getitem__(self, name):
+        return AsyncDatabase(self.client[name])
+
+
+@pytest.fixture
+def mongo():
+    """
+    A mongomock client and an async client over the same data
+    """
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient()
+    return client, AsyncClient(client)
@@ -0,0 +1,59 @@
+import time
+
+from services.cache import LRUCache, ResponseCache, SQLiteCacheBackend
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+
+def test_sqlite_backend_round_trip(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), ttl=60)
+    backend.set("key", {"value": [1, 2]})
+    assert backend.get("key") == {"value": [1, 2]}
+    assert backend.get("missing") is None
+
+
+def test_sqlite_backend_purges_expired_rows_every_n_writes(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), ttl=0.01, purge_every=4)
+    for i in range(3):
+        backend.set(f"old-{i}", i)
+    time.sleep(0.05)
+    assert backend.get("old-0") is None
+
+    # The fourth write triggers a purge of the three expired rows
+    backend.set("new", 1)
+    rows = backend._connection.execute("SELECT key FROM cache").fetchall()
+    assert [key for (key,) in rows] == ["new"]
+
+
+def test_sqlite_backend_purges_on_open(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteCacheBackend(path, ttl=0.01, purge_every=0)
+    backend.set("old", 1)
+    time.sleep(0.05)
+    reopened = SQLiteCacheBackend(path, ttl=60)
+    assert reopened._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 0
+
+
+def test_response_cache_hits_near_duplicate_questions_under_the_same_key():
+    cache = ResponseCache(threshold=0.95)
+    key = ResponseCache.make_key("model", 512, ["c2", "c1"], [], budget=(6000, 3000))
+    cache.set(key, [1.0, 0.0, 0.1], {"response": "answer"}, {"d1"})
+
+    assert ResponseCache.make_key("model", 512, ["c1", "c2"], [], budget=(6000, 3000)) == key
+    assert cache.get(key, [1.0, 0.0, 0.12]) == {"response": "answer"}
+    assert cache.get(key, [0.0, 1.0, 0.0]) is None
+    assert ResponseCache.make_key("model", 512, ["c1", "c2"], [], budget=(6000, 2000)) != key
+    # Another conversation's remembered summary and chunks make a different prompt
+    assert ResponseCache.make_key("model", 512, ["c1", "c2"], [], budget=(6000, 3000), conversation_id="chat") != key
+
+    cache.invalidate_documents(["d1"])
+    assert cache.get(key, [1.0, 0.0, 0.1]) is None
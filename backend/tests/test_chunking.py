@@ -0,0 +1,71 @@
+from utils.chunking import chunk_page, split_blocks
+from utils.tokens import count_tokens
+
+
+def paragraph(words, word="lorem"):
+    return " ".join(f"{word}{i}" for i in range(words))
+
+
+def test_split_blocks_separates_headings_from_paragraphs():
+    text = "# Title\nFirst paragraph.\n\nSecond paragraph."
+    blocks = split_blocks(text)
+    assert [(text[start:end], heading) for start, end, heading in blocks] == [
+        ("# Title", True),
+        ("First paragraph.", False),
+        ("Second paragraph.", False),
+    ]
+
+
+def test_chunks_keep_offsets_into_the_page():
+    text = "# Title\n\n" + paragraph(200) + "\n\n" + paragraph(200, "ipsum")
+    chunks = chunk_page(text, page=3, max_tokens=120, overlap_tokens=20)
+    assert len(chunks) > 1
+    for index, chunk in enumerate(chunks):
+        assert chunk["page"] == 3
+        assert chunk["chunk_index"] == index
+        assert text[chunk["char_start"]:chunk["char_end"]] == chunk["text"]
+        assert count_tokens(chunk["text"]) <= 120
+
+
+def test_heading_stays_with_an_overflowing_paragraph():
+    text = "# Introduction\n\n" + paragraph(400)
+    chunks = chunk_page(text, page=1, max_tokens=100, overlap_tokens=10)
+    assert chunks[0]["text"].startswith("# Introduction\n\nlorem0 ")
+    assert all(count_tokens(chunk["text"]) <= 100 for chunk in chunks)
+
+
+def test_heading_stays_with_a_paragraph_that_only_fits_alone():
+    body = paragraph(60)
+    max_tokens = count_tokens(body) + 2
+    text = "# A rather long section heading\n\n" + body
+    chunks = chunk_page(text, page=1, max_tokens=max_tokens, overlap_tokens=10)
+    assert chunks[0]["text"].startswith("# A rather long section heading")
+    assert "lorem59" in " ".join(chunk["text"] for chunk in chunks)
+    assert all(count_tokens(chunk["text"]) <= max_tokens for chunk in chunks)
+
+
+def test_consecutive_headings_are_kept():
+    text = "# Part one\n\n## Chapter one\n\nShort paragraph."
+    chunks = chunk_page(text, page=1, max_tokens=100)
+    assert [chunk["text"] for chunk in chunks] == [text]
+
+
+def test_unbreakable_piece_is_hard_split():
+    url = "https://example.com/" + "a" * 5000
+    text = f"See {url} for details."
+    chunks = chunk_page(text, page=1, max_tokens=50, overlap_tokens=5)
+    assert all(count_tokens(chunk["text"]) <= 50 for chunk in chunks)
+    assert "a" * 5000 in "".join(text[start:end] for start, end in _merged_spans(chunks))
+
+
+def _merged_spans(chunks):
+    """
+    Union of the chunk spans, to check that hard splitting dropped no characters
+    """
+    spans = []
+    for chunk in sorted(chunks, key=lambda c: c["char_start"]):
+        if spans and chunk["char_start"] <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], chunk["char_end"]))
+        else:
+            spans.append((chunk["char_start"], chunk["char_end"]))
+    return spans
@@ -0,0 +1,197 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.jobs import DONE, FAILED, QUEUED, RUNNING, IngestionWorkerPool, JobLost, JobStore
+
+
+@pytest.fixture
+async def jobs(mongo):
+    _, async_client = mongo
+    store = JobStore(async_client["db"]["jobs"])
+    await store.ensure_indexes()
+    return store
+
+
+async def queue(jobs, doc_id="d1", mode="chunks"):
+    return await jobs.create(doc_id, f"{doc_id}.pdf", 10, f"hash-{doc_id}", mode)
+
+
+async def test_claim_takes_the_oldest_queued_job_once(jobs):
+    first = await queue(jobs, "d1")
+    await queue(jobs, "d2")
+
+    claimed = await jobs.claim("w1", stale_after=60)
+    assert str(claimed["_id"]) == first
+    assert (claimed["status"], claimed["worker_id"], claimed["attempts"]) == (RUNNING, "w1", 1)
+    assert (await jobs.claim("w2", stale_after=60))["doc_id"] == "d2"
+    assert await jobs.claim("w3", stale_after=60) is None
+
+
+async def test_stale_job_is_reclaimed_and_its_first_worker_locked_out(jobs):
+    await queue(jobs)
+    claimed = await jobs.claim("w1", stale_after=60)
+    assert await jobs.claim("w2", stale_after=60) is None
+
+    # w1 stops heartbeating
+    await jobs.collection.update_one({"_id": claimed["_id"]},
+                                     {"$set": {"heartbeat_at": datetime.now() - timedelta(seconds=120)}})
+    reclaimed = await jobs.claim("w2", stale_after=60)
+    assert (reclaimed["_id"], reclaimed["worker_id"], reclaimed["attempts"]) == (claimed["_id"], "w2", 2)
+
+    with pytest.raises(JobLost):
+        await jobs.update(claimed["_id"], owner="w1", chunks_done=5)
+    with pytest.raises(JobLost):
+        await jobs.complete(claimed["_id"], {}, owner="w1")
+    await jobs.update(claimed["_id"], owner="w2", chunks_done=3)
+    job = await jobs.get(str(claimed["_id"]))
+    assert (job["status"], job["chunks_done"]) == (RUNNING, 3)
+
+
+async def test_requeued_job_is_claimed_again(jobs):
+    job_id = await queue(jobs)
+    claimed = await jobs.claim("w1", stale_after=60)
+    await jobs.requeue(claimed["_id"], owner="w1")
+    job = await jobs.get(job_id)
+    assert (job["status"], job["worker_id"]) == (QUEUED, None)
+
+    again = await jobs.claim("w2", stale_after=60)
+    assert (str(again["_id"]), again["attempts"]) == (job_id, 2)
+
+
+async def test_one_job_is_queued_per_document_and_mode(jobs):
+    # Concurrent uploads of one file both reach job creation
+    first, second = await asyncio.gather(queue(jobs, "d1"), queue(jobs, "d1"))
+    assert first == second
+    verses = await queue(jobs, "d1", mode="verses")
+    assert verses != first
+
+    claimed = await jobs.claim("w1", stale_after=60)
+    await jobs.complete(claimed["_id"], {}, owner="w1")
+    # Once the job is finished the document can be indexed again
+    assert await queue(jobs, "d1") not in (first, verses)
+
+
+async def test_find_active_is_per_ingestion_mode(jobs):
+    chunks = await queue(jobs, "d1")
+    assert await jobs.find_active("d1", "verses") is None
+    verses = await queue(jobs, "d1", mode="verses")
+    assert str((await jobs.find_active("d1"))["_id"]) == chunks
+    assert str((await jobs.find_active("d1", "verses"))["_id"]) == verses
+    # Jobs queued before ingestion modes existed indexed chunks
+    await jobs.collection.insert_one({"doc_id": "d2", "status": QUEUED, "created_at": datetime.now()})
+    assert await jobs.find_active("d2") is not None
+    assert await jobs.find_active("d2", "verses") is None
+
+
+class Pipeline:
+    def __init__(self, run):
+        self.run = run
+
+
+async def run_one(jobs, pipeline, stale_after=0.2, timeout=2.0):
+    pool = IngestionWorkerPool(jobs, pipeline, concurrency=1, poll_interval=0.01, stale_after=stale_after)
+    pool.start()
+    try:
+        for _ in range(int(timeout / 0.01)):
+            job = await jobs.collection.find_one({})
+            if job["status"] in (DONE, FAILED) or job.get("lost"):
+                return job
+            await asyncio.sleep(0.01)
+    finally:
+        await pool.stop()
+
+
+async def test_failed_heartbeat_does_not_stop_the_job(jobs, monkeypatch):
+    await queue(jobs)
+    heartbeat = jobs.heartbeat
+    failures = []
+
+    async def flaky_heartbeat(job_id, owner=None):
+        if not failures:
+            failures.append(job_id)
+            raise ConnectionError("primary stepped down")
+        await heartbeat(job_id, owner)
+
+    monkeypatch.setattr(jobs, "heartbeat", flaky_heartbeat)
+
+    async def run(job):
+        await asyncio.sleep(0.2)
+        return {"chunk_count": 1}
+
+    job = await run_one(jobs, Pipeline(run), stale_after=0.08)
+    assert failures
+    assert (job["status"], job["result"]) == (DONE, {"chunk_count": 1})
+
+
+async def test_worker_that_lost_its_claim_stops(jobs):
+    await queue(jobs)
+    stopped = []
+
+    async def run(job):
+        # Another worker reclaims the job while this one is still working on it
+        await jobs.collection.update_one({"_id": job["_id"]}, {"$set": {"worker_id": "elsewhere"}})
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            stopped.append(job["_id"])
+            await jobs.collection.update_one({"_id": job["_id"]}, {"$set": {"lost": True}})
+            raise
+        return {}
+
+    job = await run_one(jobs, Pipeline(run), stale_after=0.08)
+    assert stopped == [job["_id"]]
+    # Left to the worker that holds it now
+    assert (job["status"], job["worker_id"]) == (RUNNING, "elsewhere")
+
+
+async def test_cancel_stops_queued_and_running_jobs_of_a_document(jobs):
+    await queue(jobs, "d1")
+    claimed = await jobs.claim("w1", stale_after=60)
+    await queue(jobs, "d1", mode="verses")
+    other = await queue(jobs, "d2")
+
+    assert await jobs.cancel("d1") == 2
+    with pytest.raises(JobLost):
+        await jobs.update(claimed["_id"], owner="w1", chunks_done=1)
+    assert await jobs.find_active("d1") is None
+    assert str((await jobs.claim("w2", stale_after=60))["_id"]) == other
+
+
+async def test_pipeline_checks_for_cancellation_before_each_insert(jobs, monkeypatch):
+    import services.ingestion as ingestion
+
+    class VectorDB:
+        inserted = []
+
+        def get_indexed_chunks(self, *args):
+            return set()
+
+        def get_embeddings_by_hash(self, *args):
+            return {}
+
+        def insert_many(self, documents):
+            self.inserted += documents
+            return {"inserted": len(documents), "failed": 0}
+
+    chunks = [{"text": f"chunk {i}", "page": 1, "chunk_index": i, "char_start": 0, "char_end": 7} for i in range(4)]
+
+    async def embedding_batches(texts):
+        yield 0, [[1.0, 0.0]] * 2
+        # The document is deleted while the next batch is being embedded
+        await jobs.cancel("d1")
+        yield 2, [[1.0, 0.0]] * 2
+
+    monkeypatch.setattr(ingestion, "iter_embedding_batches", embedding_batches)
+    pipeline = ingestion.IngestionPipeline(VectorDB(), None, None, jobs)
+
+    async def page_chunks(job):
+        return chunks, 1
+
+    monkeypatch.setattr(pipeline, "_page_chunks", page_chunks)
+    await queue(jobs, "d1")
+    job = await jobs.claim("w1", stale_after=60)
+    with pytest.raises(JobLost):
+        await pipeline.run(job)
+    assert [document["chunk_index"] for document in VectorDB.inserted] == [0, 1]
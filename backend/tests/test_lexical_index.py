@@ -0,0 +1,68 @@
+import pytest
+
+from services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(
+        ["c1", "c2", "c3", "c4"],
+        [
+            "2:255 Allah there is no deity except Him",
+            "the throne extends over the heavens and the earth",
+            "the cow and the people of the book",
+            "a page about the weather and the earth",
+        ],
+        ["d1", "d1", "d2", "d2"],
+    )
+    return index
+
+
+def test_tokenize_keeps_verse_references_whole():
+    assert tokenize("See 2:255, The Throne") == ["see", "2:255", "the", "throne"]
+
+
+def test_search_ranks_rare_terms_above_common_ones(index):
+    results = index.search("throne earth", top_k=4)
+    assert [chunk_id for chunk_id, _ in results][:2] == ["c2", "c4"]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_search_matches_a_reference_exactly(index):
+    assert [chunk_id for chunk_id, _ in index.search("2:255", top_k=3)] == ["c1"]
+
+
+def test_search_filters_by_document(index):
+    assert {chunk_id for chunk_id, _ in index.search("earth", top_k=4, doc_ids=["d2"])} == {"c4"}
+
+
+def test_search_without_known_terms_is_empty(index):
+    assert index.search("zebra", top_k=3) == []
+    assert index.search("", top_k=3) == []
+
+
+def test_add_replaces_and_remove_forgets(index):
+    index.add(["c2"], ["nothing in common"], ["d1"])
+    assert "c2" not in {chunk_id for chunk_id, _ in index.search("throne", top_k=4)}
+    index.remove(["c2", "missing"])
+    assert len(index) == 3
+    assert sorted(index.ids()) == ["c1", "c3", "c4"]
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.save()
+    loaded = BM25Index(str(tmp_path))
+    assert len(loaded) == len(index)
+    assert loaded.search("throne earth", top_k=4) == pytest.approx(index.search("throne earth", top_k=4))
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=60)
+    assert [item for item, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_reciprocal_rank_fusion_of_one_ranking_keeps_its_order():
+    assert [item for item, _ in reciprocal_rank_fusion([["x", "y", "z"]])] == ["x", "y", "z"]
+    assert reciprocal_rank_fusion([]) == []
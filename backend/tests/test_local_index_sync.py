@@ -0,0 +1,55 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from services.lexical_index import BM25Index, LocalLexicalBackend
+from services.vector_db import VectorDB
+from services.vector_index import LocalVectorBackend, NumpyVectorIndex
+from utils.vectors import encode_embedding
+
+
+def chunk(i):
+    return {"doc_id": f"d{i % 2}", "text": f"chunk number {i}", "reference": f"Page {i}",
+            "document_embedding": encode_embedding([float(i + 1), 1.0, 0.0, 0.0], "float32", 4)}
+
+
+def make_db(client, tmp_path):
+    collection = client["db"]["chunks"]
+    return VectorDB(database="db", collection="chunks", mongodb_client=client, async_mongodb_client=client,
+                    backend=LocalVectorBackend(NumpyVectorIndex(str(tmp_path / "vectors")), collection),
+                    lexical_backend=LocalLexicalBackend(BM25Index(str(tmp_path / "bm25")), collection))
+
+
+def test_saved_index_older_than_the_collection_is_brought_up_to_date(tmp_path):
+    client = mongomock.MongoClient()
+    collection = client["db"]["chunks"]
+    collection.insert_many([chunk(i) for i in range(5)])
+    first = make_db(client, tmp_path)
+    assert len(first.backend) == 5
+    first.save_index()
+
+    # Another worker adds and deletes chunks while this index file sits on disk
+    collection.insert_many([chunk(i) for i in range(5, 8)])
+    removed = collection.find_one({"reference": "Page 0"})["_id"]
+    collection.delete_one({"_id": removed})
+
+    second = make_db(client, tmp_path)
+    stored = {str(doc["_id"]) for doc in collection.find({}, {"_id": 1})}
+    assert set(second.backend.ids()) == stored
+    assert set(second.lexical_backend.ids()) == stored
+
+
+def test_sync_picks_up_other_workers_writes_and_notifies_listeners(tmp_path):
+    client = mongomock.MongoClient()
+    collection = client["db"]["chunks"]
+    collection.insert_many([chunk(i) for i in range(3)])
+    db = make_db(client, tmp_path)
+    changes = []
+    db.add_change_listener(changes.append)
+    assert db.sync_local_index() is False
+
+    collection.insert_one(chunk(3))
+    assert db.sync_local_index() is True
+    assert len(db.backend) == 4
+    assert changes == [None]
+    assert db.sync_local_index() is False
@@ -0,0 +1,55 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from services.metrics import record_ocr_page, timed
+
+
+def sample(name, engine):
+    return REGISTRY.get_sample_value(name, {"engine": engine}) or 0
+
+
+def test_record_ocr_page_counts_and_times_pages_by_engine():
+    pages_before = sample("rag_pages_processed_total", "test_engine")
+    count_before = sample("rag_ocr_page_duration_seconds_count", "test_engine")
+    sum_before = sample("rag_ocr_page_duration_seconds_sum", "test_engine")
+
+    record_ocr_page("test_engine", 250)
+    record_ocr_page("test_engine", 750)
+
+    assert sample("rag_pages_processed_total", "test_engine") == pages_before + 2
+    assert sample("rag_ocr_page_duration_seconds_count", "test_engine") == count_before + 2
+    assert sample("rag_ocr_page_duration_seconds_sum", "test_engine") == sum_before + 1.0
+
+
+def stage_count(stage):
+    return REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"stage": stage}) or 0
+
+
+async def test_timed_handler_returning_a_stream_ends_when_the_body_is_sent():
+    class StreamingBody:
+        def __init__(self):
+            async def body():
+                yield b"one"
+                yield b"two"
+            self.body_iterator = body()
+
+    @timed("test_stream")
+    async def handler():
+        return StreamingBody()
+
+    before = stage_count("test_stream")
+    response = await handler()
+    assert stage_count("test_stream") == before
+    assert [item async for item in response.body_iterator] == [b"one", b"two"]
+    assert stage_count("test_stream") == before + 1
+
+
+async def test_timed_handler_counts_server_errors():
+    @timed("test_failing")
+    async def handler():
+        raise RuntimeError("boom")
+
+    before = REGISTRY.get_sample_value("rag_stage_errors_total", {"stage": "test_failing"}) or 0
+    with pytest.raises(RuntimeError):
+        await handler()
+    assert REGISTRY.get_sample_value("rag_stage_errors_total", {"stage": "test_failing"}) == before + 1
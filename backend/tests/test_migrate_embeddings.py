@@ -0,0 +1,50 @@
+import pytest
+
+from services.migrate_embeddings import migrate, migrated_key
+from utils.vectors import decode_embedding, embedding_storage_of, encode_embedding
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def test_migrated_key_records_new_dimensions_and_storage():
+    assert migrated_key("text-embedding-004/float32", "int8", 768, 256) == "text-embedding-004@256/int8"
+    assert migrated_key("text-embedding-004@256/float32", "int8", 256, 256) == "text-embedding-004@256/int8"
+    # Bare model names predate the key; a vector shorter than the model's output was truncated
+    assert migrated_key("text-embedding-004", "float32", 256, 256) == "text-embedding-004@256/float32"
+    assert migrated_key("text-embedding-004", "float32", 768, 768) == "text-embedding-004/float32"
+    assert migrated_key(None, "int8", 768, 768) is None
+
+
+class Collection:
+    """
+    mongomock collection whose bulk_write applies pymongo UpdateOne operations one at a time,
+    since mongomock does not accept the operations of recent pymongo versions
+    """
+
+    def __init__(self):
+        self.collection = mongomock.MongoClient().db.chunks
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.collection.update_one(operation._filter, operation._doc)
+
+
+def test_migrate_converts_vectors_and_their_keys():
+    collection = Collection()
+    vector = [0.1] * 768
+    collection.insert_many([
+        {"document_embedding": vector, "embedding_model": "text-embedding-004"},
+        {"document_embedding": encode_embedding(vector, "int8", 256), "embedding_model": "text-embedding-004@256/int8"},
+    ])
+
+    stats = migrate(collection, "int8", 256)
+
+    assert (stats["converted"], stats["skipped"], stats["rekeyed"]) == (1, 1, 1)
+    for doc in collection.find():
+        assert embedding_storage_of(doc["document_embedding"]) == "int8"
+        assert len(decode_embedding(doc["document_embedding"])) == 256
+        assert doc["embedding_model"] == "text-embedding-004@256/int8"
+    assert migrate(collection, "int8", 256)["converted"] == 0
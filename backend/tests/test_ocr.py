@@ -0,0 +1,76 @@
+import unicodedata
+
+import pytest
+
+from services.ocr import HybridOCRProvider, OCRProvider, has_usable_text, is_garbled_arabic
+
+FATIHA = ("بِسْمِ ٱللَّهِ ٱلرَّحْمَٰنِ ٱلرَّحِيمِ ٱلْحَمْدُ لِلَّهِ رَبِّ ٱلْعَٰلَمِينَ ٱلرَّحْمَٰنِ ٱلرَّحِيمِ "
+          "مَٰلِكِ يَوْمِ ٱلدِّينِ إِيَّاكَ نَعْبُدُ وَإِيَّاكَ نَسْتَعِينُ ٱهْدِنَا ٱلصِّرَٰطَ ٱلْمُسْتَقِيمَ")
+ENGLISH = "In the name of God, the Most Gracious, the Most Merciful. Praise be to God, Lord of the worlds."
+
+
+def presentation_forms(text):
+    """
+    The same text as glyphs, the way PyPDF2 extracts many Arabic fonts
+    """
+    glyphs = []
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        try:
+            glyphs.append(unicodedata.lookup(f"{unicodedata.name(char)} ISOLATED FORM"))
+        except (KeyError, ValueError):
+            glyphs.append(char)
+    return "".join(glyphs)
+
+
+def test_clean_text_is_usable():
+    assert has_usable_text(ENGLISH)
+    assert has_usable_text(FATIHA)
+    assert not is_garbled_arabic(FATIHA)
+
+
+def test_short_or_symbol_text_is_not_usable():
+    assert not has_usable_text("Page 1")
+    assert not has_usable_text("-- . -- . -- " * 10)
+
+
+def test_unmapped_glyphs_are_not_usable():
+    assert not has_usable_text(ENGLISH + "\ufffd" * 5)
+    assert not has_usable_text(ENGLISH + "\ue000\ue001\ue002")
+
+
+@pytest.mark.parametrize("garbled", [
+    presentation_forms(FATIHA),
+    # Letters extracted one glyph at a time
+    " ".join(FATIHA.replace(" ", "")),
+    # Visual order: the whole line reversed
+    FATIHA[::-1],
+])
+def test_garbled_arabic_is_not_usable(garbled):
+    assert is_garbled_arabic(garbled)
+    assert not has_usable_text(garbled)
+
+
+def test_a_few_arabic_words_in_latin_text_are_not_judged():
+    assert has_usable_text(f"{ENGLISH} The basmala reads بسم الله.")
+
+
+class Provider(OCRProvider):
+    def __init__(self, name, texts):
+        self.name = name
+        self.texts = texts
+        self.requested = None
+
+    def process(self, source, filename, pages=None):
+        self.requested = pages
+        indexes = range(len(self.texts)) if pages is None else pages
+        return [{"index": i, "text": self.texts[i], "engine": self.name, "latency_ms": 1.0} for i in indexes]
+
+
+def test_hybrid_sends_garbled_pages_to_remote_ocr():
+    local = Provider("text_layer", [FATIHA, presentation_forms(FATIHA), ENGLISH])
+    remote = Provider("mistral", ["ocr 0", "ocr 1", "ocr 2"])
+    pages = HybridOCRProvider(local, remote).process("doc.pdf", "doc.pdf")
+    assert remote.requested == [1]
+    assert [page["engine"] for page in pages] == ["text_layer", "mistral", "text_layer"]
@@ -0,0 +1,133 @@
+import pytest
+
+from services.prompt import PromptAssembler, message_tokens
+
+
+def conversation(turns, words=40):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} " + "word " * words})
+        messages.append({"role": "assistant", "content": f"answer {turn} " + "word " * words})
+    messages.append({"role": "user", "content": "latest question"})
+    return messages
+
+
+def results(*ids):
+    return [{"chunk_id": chunk_id, "doc_id": "d1", "reference": f"Page {chunk_id}", "text": f"text of {chunk_id}"}
+            for chunk_id in ids]
+
+
+def prompt_size(prompt):
+    return sum(map(message_tokens, prompt["messages"]))
+
+
+class Summarizer:
+    def __init__(self, reply=None):
+        self.calls = []
+        self.reply = reply
+
+    def __call__(self, summary, messages):
+        self.calls.append(len(messages))
+        return self.reply or f"{summary} {len(messages)} more messages".strip()
+
+
+def test_prompt_ends_with_the_context_and_reports_its_size():
+    prompt = PromptAssembler().assemble(conversation(0), results("c1", "c2"), max_tokens=2000)
+    assert prompt["messages"][-2] == {"role": "user", "content": "latest question"}
+    assert "text of c1" in prompt["messages"][-1]["content"]
+    assert prompt["chunk_ids"] == ["c1", "c2"]
+    assert prompt["usage"]["prompt_tokens"] == prompt_size(prompt)
+
+
+def test_old_messages_are_dropped_without_a_conversation_id():
+    prompt = PromptAssembler(summarize=Summarizer()).assemble(conversation(6), results("c1"), max_tokens=500)
+    usage = prompt["usage"]
+    assert usage["messages_kept"] >= 4
+    assert usage["messages_dropped"] == 13 - usage["messages_kept"]
+    assert usage["messages_summarized"] == 0
+    assert usage["prompt_tokens"] <= 500
+
+
+def test_summary_counts_only_newly_folded_messages_per_turn():
+    summarizer = Summarizer()
+    assembler = PromptAssembler(summarize=summarizer, recent_messages=2, summary_tokens=50)
+    messages = conversation(3, words=100)
+
+    first = assembler.assemble(messages, results("c1"), conversation_id="chat", max_tokens=600)["usage"]
+    messages = messages + [{"role": "assistant", "content": "answer " + "word " * 100},
+                           {"role": "user", "content": "next question"}]
+    second = assembler.assemble(messages, results("c2"), conversation_id="chat", max_tokens=600)["usage"]
+
+    assert first["messages_summarized"] == first["messages_in_summary"] > 0
+    assert second["messages_summarized"] == second["messages_in_summary"] - first["messages_in_summary"] > 0
+    assert summarizer.calls == [first["messages_summarized"], second["messages_summarized"]]
+
+
+def test_a_summary_longer_than_its_allowance_is_cut_to_the_budget():
+    assembler = PromptAssembler(summarize=Summarizer(reply="summary " * 400), recent_messages=2, summary_tokens=64)
+    prompt = assembler.assemble(conversation(4, words=150), results("c1", "c2"), conversation_id="chat", max_tokens=700)
+    assert prompt["messages"][0]["content"].startswith("Summary of the earlier conversation:")
+    assert prompt_size(prompt) == prompt["usage"]["prompt_tokens"] <= 700
+
+
+@pytest.mark.parametrize("max_tokens", [300, 700])
+def test_recent_messages_that_overflow_still_fit_the_budget(max_tokens):
+    messages = conversation(2, words=400)
+    prompt = PromptAssembler(recent_messages=4).assemble(messages, results("c1", "c2", "c3"), max_tokens=max_tokens)
+    assert prompt_size(prompt) <= max_tokens
+    assert prompt["messages"][-2]["content"] == "latest question"
+
+
+def test_latest_message_is_truncated_as_a_last_resort():
+    messages = [{"role": "user", "content": "word " * 2000}]
+    prompt = PromptAssembler().assemble(messages, results("c1"), max_tokens=400)
+    assert prompt_size(prompt) <= 400
+    assert messages[0]["content"].startswith(prompt["messages"][-2]["content"])
+
+
+def test_chunks_from_earlier_turns_are_reused_once():
+    assembler = PromptAssembler(summarize=Summarizer())
+    messages = conversation(0)
+    assembler.assemble(messages, results("c1", "c2"), conversation_id="chat", max_tokens=4000)
+    messages = messages + [{"role": "assistant", "content": "an answer"}, {"role": "user", "content": "follow-up"}]
+    prompt = assembler.assemble(messages, results("c2", "c3"), conversation_id="chat", max_tokens=4000)
+    assert prompt["chunk_ids"] == ["c2", "c3", "c1"]
+    assert prompt["usage"]["chunks_from_earlier_turns"] == 1
+
+
+def test_references_give_the_source_page_of_each_chunk_in_the_context():
+    found = [{**result, "page": page} for page, result in enumerate(results("c1", "c2"), start=3)]
+    prompt = PromptAssembler().assemble(conversation(0), found, max_tokens=2000)
+    assert prompt["references"] == [
+        {"reference": "Page c1", "content": "text of c1", "doc_id": "d1", "page": 3},
+        {"reference": "Page c2", "content": "text of c2", "doc_id": "d1", "page": 4},
+    ]
+    # Only chunks that fit the context budget are referenced
+    prompt = PromptAssembler().assemble(conversation(0), found, max_tokens=2000, context_tokens=10)
+    assert [reference["page"] for reference in prompt["references"]] == [3]
+
+
+def test_a_turn_answered_from_the_cache_is_still_remembered():
+    summarizer = Summarizer()
+    messages = conversation(3, words=100)
+    answered = PromptAssembler(summarize=summarizer, recent_messages=2, summary_tokens=50).assemble(
+        messages, results("c1"), conversation_id="chat", max_tokens=600)
+
+    # Another worker answers the same turn from its response cache, without assembling a prompt
+    assembler = PromptAssembler(summarize=summarizer, recent_messages=2, summary_tokens=50)
+    usage = answered["usage"]
+    assembler.record_turn(messages, results("c1"), conversation_id="chat", summary=answered["summary"],
+                          summarized=usage["messages_in_summary"], messages_kept=usage["messages_kept"])
+
+    messages = messages + [{"role": "assistant", "content": "short answer"}, {"role": "user", "content": "follow-up"}]
+    prompt = assembler.assemble(messages, results("c2"), conversation_id="chat", max_tokens=4000)
+    assert summarizer.calls == [usage["messages_in_summary"]]
+    assert prompt["usage"]["messages_in_summary"] == usage["messages_in_summary"]
+    assert prompt["messages"][0]["content"].endswith(answered["summary"])
+    assert prompt["chunk_ids"] == ["c2", "c1"]
+
+
+def test_record_turn_without_a_conversation_id_remembers_nothing():
+    assembler = PromptAssembler()
+    assembler.record_turn(conversation(0), results("c1"))
+    assert len(assembler.conversations) == 0
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.ranges import RangeNotSatisfiable, etag_matches, file_etag, parse_range_header
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-499", (0, 499)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=-200", (800, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("BYTES = 10-19", (10, 19)),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=abc", "bytes=a-b", "bytes=50-10"])
+def test_parse_range_header_serves_the_whole_file_for_other_values(header):
+    assert parse_range_header(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_parse_range_header_rejects_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, 1000)
+
+
+def test_parse_range_header_of_an_empty_file_is_whole_file():
+    assert parse_range_header("bytes=0-10", 0) is None
+
+
+def test_file_etag_prefers_md5():
+    assert file_etag("id", md5="abc") == '"abc"'
+    uploaded = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert file_etag("id", upload_date=uploaded, length=10) == f'"id-{int(uploaded.timestamp() * 1000)}-10"'
+    assert file_etag("id", length=10) == '"id-0-10"'
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+    assert not etag_matches(None, '"abc"')
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.cache import SingleFlight
+from services.rate_limit import LocalTokenBucket, RateLimitExceeded, RateLimiter
+
+
+class FailingBucket:
+    def try_acquire(self, cost=1):
+        raise ConnectionError("bucket unreachable")
+
+
+def test_local_bucket_allows_a_burst_then_reports_the_wait():
+    bucket = LocalTokenBucket(rate=10, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 0.1
+
+
+def test_local_bucket_refills_over_time():
+    bucket = LocalTokenBucket(rate=100, capacity=1)
+    assert bucket.try_acquire() == 0.0
+    time.sleep(0.02)
+    assert bucket.try_acquire() == 0.0
+
+
+def test_acquire_waits_for_a_token():
+    limiter = RateLimiter("test", "wait", LocalTokenBucket(rate=50, capacity=1), max_wait=1)
+    limiter.acquire()
+    start = time.perf_counter()
+    limiter.acquire()
+    assert time.perf_counter() - start >= 0.015
+
+
+def test_acquire_gives_up_past_max_wait():
+    limiter = RateLimiter("test", "reject", LocalTokenBucket(rate=1, capacity=1), max_wait=0.1)
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded) as info:
+        limiter.acquire()
+    assert info.value.status_code == 429
+    assert info.value.retry_after > 0.1
+
+
+async def test_acquire_async_waits_on_the_event_loop():
+    limiter = RateLimiter("test", "async", LocalTokenBucket(rate=50, capacity=1), max_wait=1)
+    await limiter.acquire_async()
+    start = time.perf_counter()
+    await limiter.acquire_async()
+    assert time.perf_counter() - start >= 0.015
+
+
+def test_unreachable_shared_bucket_falls_back_to_the_local_one():
+    limiter = RateLimiter("test", "fallback", FailingBucket(), max_wait=0.1,
+                          fallback=LocalTokenBucket(rate=1, capacity=1))
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire()
+    with pytest.raises(ConnectionError):
+        RateLimiter("test", "no_fallback", FailingBucket()).acquire()
+
+
+def test_no_bucket_means_no_limit():
+    limiter = RateLimiter("test", "unlimited")
+    for _ in range(100):
+        limiter.acquire()
+
+
+def test_single_flight_shares_one_call_between_threads():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+    results = []
+
+    def work():
+        calls.append(1)
+        release.wait(1)
+        return "value"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [("value", False)] + [("value", True)] * 4
+    assert flight.shared == 4
+
+
+def test_single_flight_shares_errors_and_forgets_finished_calls():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("upstream failed")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: 1) == (1, False)
+
+
+async def test_single_flight_async_coalesces_concurrent_callers():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*(flight.do_async("key", work) for _ in range(4)))
+    assert len(calls) == 1
+    assert sorted(results) == [("value", False)] + [("value", True)] * 3
+    assert await flight.do_async("key", work) == ("value", False)
+    assert len(calls) == 2
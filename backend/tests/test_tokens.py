@@ -0,0 +1,64 @@
+import logging
+import sys
+import types
+
+import pytest
+
+from services.metrics import render_metrics
+from utils import tokens
+from utils.tokens import count_tokens, truncate_tokens
+
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens(None) == 0
+    assert 0 < count_tokens("hello world") < count_tokens("hello world " * 20)
+
+
+def test_truncate_tokens_keeps_a_prefix_within_the_budget():
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+    truncated = truncate_tokens(text, 10)
+    assert text.startswith(truncated)
+    assert 0 < count_tokens(truncated) <= 10
+    assert truncate_tokens("short", 100) == "short"
+    assert truncate_tokens(text, 0) == ""
+
+
+@pytest.fixture
+def unloaded(monkeypatch):
+    """
+    Forget the loaded encoding for the duration of a test
+    """
+    monkeypatch.setattr(tokens, "_loaded", None)
+    monkeypatch.setattr(tokens, "_failed_at", None)
+
+
+def test_missing_tiktoken_falls_back_with_a_warning(unloaded, monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    with caplog.at_level(logging.WARNING, logger="utils.tokens"):
+        assert count_tokens("abcdefgh") == 2
+    assert "tiktoken unavailable" in caplog.text
+    assert truncate_tokens("abcdefghij", 2) == "abcdefgh"
+    assert tokens.tokenizer_is_approximate()
+    assert "rag_tokenizer_approximate 1.0" in render_metrics()[0].decode()
+
+
+class Encoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def test_a_failed_load_is_retried_after_the_interval(unloaded, monkeypatch):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    assert not tokens.load_tokenizer()
+
+    # The BPE file becomes reachable again
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=lambda name: Encoding()))
+    assert count_tokens("one two three") == 4
+    monkeypatch.setattr(tokens, "TOKENIZER_RETRY_INTERVAL", 0)
+    assert count_tokens("one two three") == 3
+    assert not tokens.tokenizer_is_approximate()
+    assert "rag_tokenizer_approximate 0.0" in render_metrics()[0].decode()
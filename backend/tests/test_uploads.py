@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from services.uploads import UploadTooLarge, store_upload
+from services.vector_db import VectorDB
+from services.vector_index import LocalVectorBackend, NumpyVectorIndex
+
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 40
+
+
+class GridIn:
+    """
+    AsyncGridIn over a synchronous GridIn
+    """
+
+    def __init__(self, grid_in):
+        self.grid_in = grid_in
+        self._id = grid_in._id
+
+    async def write(self, data):
+        self.grid_in.write(data)
+
+    async def set(self, name, value):
+        setattr(self.grid_in, name, value)
+
+    async def close(self):
+        self.grid_in.close()
+
+    async def abort(self):
+        self.grid_in.abort()
+
+
+class Bucket:
+    """
+    AsyncGridFSBucket over a synchronous GridFS
+    """
+
+    def __init__(self, fs):
+        self.fs = fs
+
+    def open_upload_stream(self, filename, metadata=None):
+        return GridIn(self.fs.new_file(filename=filename, metadata=metadata))
+
+    async def delete(self, file_id):
+        self.fs.delete(file_id)
+
+
+class Upload:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self, size):
+        # Let concurrent uploads interleave between pieces
+        await asyncio.sleep(0)
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+@pytest.fixture
+def store(mongo, tmp_path):
+    client, async_client = mongo
+    from gridfs import GridFS
+    import mongomock.gridfs
+    mongomock.gridfs.enable_gridfs_integration()
+    backend = LocalVectorBackend(NumpyVectorIndex(str(tmp_path / "vectors")), async_client["db"]["chunks"])
+    VectorDB(database="db", collection="chunks", mongodb_client=client, async_mongodb_client=async_client,
+             backend=backend).ensure_indexes()
+    db = client["db"]
+
+    async def upload(data=PDF, filename="a.pdf", max_bytes=1 << 20):
+        return await store_upload(Bucket(GridFS(db)), async_client["db"]["fs.files"], Upload(data), filename,
+                                  "application/pdf", max_bytes, 1000)
+
+    upload.db = db
+    return upload
+
+
+async def test_upload_is_stored_with_its_hash_and_content_type(store):
+    file_id, size, file_hash, existing = await store()
+    assert (size, existing) == (len(PDF), None)
+    stored = store.db["fs.files"].find_one({"_id": file_id})
+    assert stored["metadata"] == {"content_type": "application/pdf", "sha256": file_hash}
+    assert store.db["fs.chunks"].count_documents({"files_id": file_id}) == 1
+
+
+async def test_a_second_upload_of_the_same_bytes_reuses_the_first(store):
+    first_id, _, _, _ = await store()
+    file_id, _, _, existing = await store(filename="copy.pdf")
+    assert file_id == existing["_id"] == first_id
+    assert existing["filename"] == "a.pdf"
+    assert store.db["fs.files"].count_documents({}) == 1
+    assert store.db["fs.chunks"].count_documents({}) == 1
+
+
+async def test_concurrent_uploads_of_the_same_bytes_store_one_copy(store):
+    results = await asyncio.gather(store(filename="a.pdf"), store(filename="b.pdf"), store(data=PDF[:-1]))
+    (first_id, _, first_hash, first), (second_id, _, second_hash, second), (other_id, _, _, other) = results
+    assert first_hash == second_hash and first_id == second_id
+    assert [first is None, second is None].count(True) == 1
+    assert other is None and other_id != first_id
+    assert store.db["fs.files"].count_documents({}) == 2
+    # The chunks written by the upload that lost the race are removed
+    assert store.db["fs.chunks"].count_documents({"files_id": first_id}) == 1
+    assert store.db["fs.chunks"].count_documents({}) == 2
+
+
+async def test_an_upload_over_the_limit_leaves_nothing_stored(store):
+    with pytest.raises(UploadTooLarge):
+        await store(max_bytes=5000)
+    assert store.db["fs.files"].count_documents({}) == 0
+    assert store.db["fs.chunks"].count_documents({}) == 0
@@ -0,0 +1,105 @@
+import services.vector_db
+from services.lexical_index import BM25Index, LocalLexicalBackend
+from services.vector_db import VectorDB
+from services.vector_index import LocalVectorBackend, NumpyVectorIndex, VectorBackend
+
+
+def make_db(mongo, tmp_path):
+    client, async_client = mongo
+    collection = async_client["db"]["chunks"]
+    return VectorDB(database="db", collection="chunks", mongodb_client=client, async_mongodb_client=async_client,
+                    backend=LocalVectorBackend(NumpyVectorIndex(str(tmp_path / "vectors")), collection),
+                    lexical_backend=LocalLexicalBackend(BM25Index(str(tmp_path / "bm25")), collection))
+
+
+async def test_insert_async_stores_indexes_and_notifies(mongo, tmp_path):
+    db = make_db(mongo, tmp_path)
+    changes = []
+    db.add_change_listener(changes.append)
+
+    assert await db.insert_async({"doc_id": "d1", "content": "the throne verse", "reference": "2:255",
+                                  "document_embedding": [1.0, 0.0, 0.0, 0.0]})
+    stored = db.collection.find_one({"doc_id": "d1"})
+    assert stored["text"] == "the throne verse"
+    assert set(db.backend.ids()) == set(db.lexical_backend.ids()) == {str(stored["_id"])}
+    assert changes == [["d1"]]
+
+
+def test_chunk_positions_are_unique_per_document_and_model(mongo, tmp_path):
+    db = make_db(mongo, tmp_path)
+    # Created by older versions without the unique constraint
+    db.collection.create_index([("doc_id", 1), ("embedding_model", 1), ("page", 1), ("chunk_index", 1)])
+    db.ensure_indexes()
+
+    def chunk(index, text):
+        return {"doc_id": "d1", "content": text, "reference": "Page 1", "page": 1, "chunk_index": index,
+                "embedding_model": "m", "document_embedding": [1.0, 0.0, 0.0, 0.0]}
+
+    assert db.insert_many([chunk(0, "first"), chunk(1, "second")])["inserted"] == 2
+    # A second worker inserting the same chunks only adds the missing one
+    report = db.insert_many([chunk(0, "first"), chunk(1, "second"), chunk(2, "third")])
+    assert (report["inserted"], report["failed"]) == (1, 2)
+    assert db.collection.count_documents({"doc_id": "d1"}) == 3
+    assert len(db.backend) == 3
+    assert db.get_indexed_chunks("d1", "m") == {(1, 0), (1, 1), (1, 2)}
+
+    # Documents without a position are not constrained
+    for _ in range(2):
+        db.insert({"doc_id": "d1", "content": "loose", "reference": "x", "embedding_model": "m",
+                   "document_embedding": [0.0, 1.0, 0.0, 0.0]})
+    assert db.collection.count_documents({"doc_id": "d1"}) == 5
+
+
+QUERY_VECTORS = {"light": [1.0, 0.0, 0.0, 0.0], "night": [0.0, 1.0, 0.0, 0.0], "mercy": [0.0, 0.0, 1.0, 0.0]}
+
+
+async def indexed_db(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(services.vector_db, "embed_queries", lambda texts: [QUERY_VECTORS[text] for text in texts])
+    db = make_db(mongo, tmp_path)
+    for text, vector in QUERY_VECTORS.items():
+        await db.insert_async({"doc_id": "d1", "content": f"a verse about {text}", "reference": text,
+                               "document_embedding": vector})
+    return db
+
+
+class RemoteBackend(VectorBackend):
+    """
+    A backend searched one query per call, like Atlas $vectorSearch
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.searched = []
+
+    async def search(self, query_vector, top_k: int, doc_ids: list = None):
+        self.searched.append(query_vector)
+        return await self.inner.search(query_vector, top_k, doc_ids=doc_ids)
+
+
+async def test_find_many_on_a_local_index_reports_only_the_batch_time(mongo, tmp_path, monkeypatch):
+    db = await indexed_db(mongo, tmp_path, monkeypatch)
+
+    found = await db.find_many(["night", "light"], top_searches=1, mode="vector")
+    assert [(entry["query"], entry["results"][0]["text"]) for entry in found["results"]] == \
+           [("night", "a verse about night"), ("light", "a verse about light")]
+    assert [entry["search_ms"] for entry in found["results"]] == [None, None]
+    assert set(found["timings_ms"]) == {"embedding", "search", "total"}
+
+
+async def test_find_many_times_each_query_on_a_remote_backend(mongo, tmp_path, monkeypatch):
+    db = await indexed_db(mongo, tmp_path, monkeypatch)
+    db.backend = RemoteBackend(db.backend)
+
+    found = await db.find_many(["mercy", "light", "night"], top_searches=1, mode="vector")
+    assert [entry["results"][0]["text"] for entry in found["results"]] == \
+           ["a verse about mercy", "a verse about light", "a verse about night"]
+    assert len(db.backend.searched) == 3
+    assert all(isinstance(entry["search_ms"], float) for entry in found["results"])
+
+
+async def test_find_many_times_each_hybrid_query(mongo, tmp_path, monkeypatch):
+    db = await indexed_db(mongo, tmp_path, monkeypatch)
+
+    found = await db.find_many(["mercy", "night"], top_searches=2, mode="hybrid")
+    assert [entry["results"][0]["text"] for entry in found["results"]] == ["a verse about mercy", "a verse about night"]
+    assert all(isinstance(entry["search_ms"], float) for entry in found["results"])
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from services.vector_index import NumpyVectorIndex, HNSWVectorIndex
+
+
+def random_vectors(count, dimensions=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimensions)).astype(np.float32)
+
+
+def make_numpy(path, dtype="float32"):
+    return NumpyVectorIndex(str(path), dtype=dtype)
+
+
+def make_hnsw(path):
+    pytest.importorskip("hnswlib")
+    return HNSWVectorIndex(str(path), dimensions=16)
+
+
+@pytest.fixture(params=["numpy", "int8", "hnsw"])
+def make_index(request, tmp_path):
+    if request.param == "numpy":
+        return lambda: make_numpy(tmp_path)
+    if request.param == "int8":
+        return lambda: make_numpy(tmp_path, dtype="int8")
+    return lambda: make_hnsw(tmp_path)
+
+
+def test_search_ranks_the_query_vector_first(make_index):
+    index = make_index()
+    vectors = random_vectors(50)
+    index.add([f"c{i}" for i in range(50)], vectors, [f"d{i % 5}" for i in range(50)])
+    results = index.search(vectors[7], top_k=3)
+    assert results[0][0] == "c7"
+    assert results[0][1] == pytest.approx(1.0, abs=0.02)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_filters_by_document(make_index):
+    index = make_index()
+    vectors = random_vectors(20)
+    index.add([f"c{i}" for i in range(20)], vectors, [f"d{i % 4}" for i in range(20)])
+    results = index.search(vectors[0], top_k=10, doc_ids=["d1"])
+    assert len(results) == 5
+    assert {chunk_id for chunk_id, _ in results} == {f"c{i}" for i in range(1, 20, 4)}
+
+
+def test_removed_and_readded_chunks(make_index):
+    index = make_index()
+    vectors = random_vectors(10)
+    ids = [f"c{i}" for i in range(10)]
+    index.add(ids, vectors, ["d"] * 10)
+    index.remove(["c3"])
+    assert "c3" not in {chunk_id for chunk_id, _ in index.search(vectors[3], top_k=10)}
+    assert len(index) == 9
+
+    # Adding a chunk that is already indexed replaces it rather than duplicating it
+    index.add(["c4"], vectors[4:5], ["d"])
+    results = index.search(vectors[4], top_k=10)
+    assert [chunk_id for chunk_id, _ in results].count("c4") == 1
+    assert len(index) == 9
+    assert sorted(index.ids()) == sorted(set(ids) - {"c3"})
+
+
+def test_search_many_matches_search(make_index):
+    index = make_index()
+    vectors = random_vectors(30)
+    index.add([f"c{i}" for i in range(30)], vectors, ["d"] * 30)
+    queries = random_vectors(4, seed=1)
+    assert [[chunk_id for chunk_id, _ in ranked] for ranked in index.search_many(queries, 5)] == \
+           [[chunk_id for chunk_id, _ in index.search(query, 5)] for query in queries]
+
+
+def test_save_and_load_round_trip(make_index):
+    index = make_index()
+    vectors = random_vectors(10)
+    index.add([f"c{i}" for i in range(10)], vectors, ["d"] * 10)
+    index.remove(["c0"])
+    index.save()
+    loaded = make_index()
+    assert sorted(loaded.ids()) == [f"c{i}" for i in range(1, 10)]
+    assert loaded.search(vectors[5], top_k=1)[0][0] == "c5"
+
+
+def test_numpy_search_many_bounds_scores_per_group(tmp_path):
+    index = make_numpy(tmp_path)
+    vectors = random_vectors(40)
+    index.add([f"c{i}" for i in range(40)], vectors, ["d"] * 40)
+    grouped = index.search_many(vectors[:6], 3, max_scores=40 * 2)
+    assert [ranked[0][0] for ranked in grouped] == [f"c{i}" for i in range(6)]
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from bson.binary import Binary
+
+from utils.vectors import decode_embedding, embedding_key, embedding_storage_of, encode_embedding, \
+    parse_embedding_key, quantize_int8, truncate_embedding
+
+
+def cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def embedding(dimensions=64, seed=0):
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_truncate_embedding_keeps_the_first_dimensions_at_unit_length():
+    truncated = truncate_embedding(embedding(), 16)
+    assert len(truncated) == 16
+    assert np.linalg.norm(truncated) == pytest.approx(1.0)
+    assert truncate_embedding([1.0, 2.0], 0) == [1.0, 2.0]
+    assert truncate_embedding([1.0, 2.0], 8) == [1.0, 2.0]
+
+
+def test_quantize_int8_maps_the_largest_component_to_127():
+    assert quantize_int8([0.5, -1.0, 0.25]) == [64, -127, 32]
+    assert quantize_int8([0.0, 0.0]) == [0, 0]
+
+
+@pytest.mark.parametrize("storage", ["array", "float32", "int8"])
+def test_encode_decode_round_trip(storage):
+    original = embedding()
+    stored = encode_embedding(original, storage)
+    assert embedding_storage_of(stored) == storage
+    assert isinstance(stored, list) == (storage == "array")
+    decoded = decode_embedding(stored)
+    assert len(decoded) == len(original)
+    assert cosine(decoded, original) > (0.999 if storage == "int8" else 0.999999)
+
+
+def test_encode_truncates_and_reencodes_stored_values():
+    stored = encode_embedding(embedding(), "float32")
+    reencoded = encode_embedding(stored, "int8", dimensions=32)
+    assert embedding_storage_of(reencoded) == "int8"
+    assert len(decode_embedding(reencoded)) == 32
+
+
+def test_encode_rejects_unknown_storage():
+    with pytest.raises(ValueError):
+        encode_embedding([1.0], "float16")
+
+
+def test_storage_of_a_non_vector_binary_is_array():
+    assert embedding_storage_of(Binary(b"\x01\x02")) == "array"
+
+
+def test_encode_copies_a_vector_already_in_the_target_format():
+    stored = encode_embedding(embedding(), "int8", dimensions=32)
+    assert encode_embedding(stored, "int8", dimensions=32) is stored
+    assert encode_embedding(stored, "int8") is stored
+
+
+def test_embedding_key_round_trip():
+    assert embedding_key("text-embedding-004", 256, "int8") == "text-embedding-004@256/int8"
+    assert embedding_key("text-embedding-004", None, "float32") == "text-embedding-004/float32"
+    assert parse_embedding_key("text-embedding-004@256/int8") == ("text-embedding-004", 256, "int8")
+    assert parse_embedding_key("models/text-embedding-004/array") == ("models/text-embedding-004", None, "array")
+    assert parse_embedding_key("text-embedding-004") == ("text-embedding-004", None, None)
@@ -0,0 +1,51 @@
+import pytest
+
+from utils.verses import merge_verses, parse_reference, verse_records
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2:255", (2, 255, 255)),
+    (" 2 : 255 - 257 ", (2, 255, 257)),
+    ("114:1-6", (114, 1, 6)),
+])
+def test_parse_reference(value, expected):
+    assert parse_reference(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", None, "2", "0:1", "2:0", "2:257-255", "2:1-3:4", "chapter 2"])
+def test_parse_reference_rejects_non_references(value):
+    assert parse_reference(value) is None
+
+
+def test_verse_records_validate_and_count_rejected_items():
+    items = [
+        {"reference": "1:1", "text": " In the name of God "},
+        {"reference": "1", "text": "no verse"},
+        {"reference": "1:2", "text": "   "},
+        {"text": "no reference"},
+        "not an object",
+    ]
+    records, rejected = verse_records(items, 3)
+    assert records == [{"chapter": 1, "verse": 1, "reference": "1:1", "text": "In the name of God", "page": 3}]
+    assert rejected == 4
+
+
+def test_verse_records_accept_a_single_object_and_nothing():
+    records, rejected = verse_records({"reference": "2:3", "text": "Who believe"}, 1)
+    assert [record["reference"] for record in records] == ["2:3"]
+    assert rejected == 0
+    assert verse_records(None, 1) == ([], 0)
+
+
+def test_merge_verses_joins_continuations_and_keeps_the_first_page():
+    records = [
+        {"chapter": 2, "verse": 1, "reference": "2:1", "text": "Alif", "page": 1},
+        {"chapter": 2, "verse": 2, "reference": "2:2", "text": "This is the Book", "page": 1},
+        {"chapter": 2, "verse": 2, "reference": "2:2", "text": "without doubt", "page": 2},
+        {"chapter": 2, "verse": 3, "reference": "2:3", "text": "Who believe", "page": 2},
+    ]
+    merged = merge_verses(records)
+    assert [record["reference"] for record in merged] == ["2:1", "2:2", "2:3"]
+    assert merged[1]["text"] == "This is the Book without doubt"
+    assert merged[1]["page"] == 1
+    assert records[1]["text"] == "This is the Book"
@@ -0,0 +1,170 @@
+"""
+Split OCR markdown into retrieval-sized chunks that keep their page and character offsets
+"""
+import re
+from utils.tokens import count_tokens
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+BLOCK_SEPARATOR = re.compile(r"\n\s*\n")
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def split_blocks(text: str):
+    """
+    Split markdown into paragraph blocks, with each heading line starting its own block
+
+    Returns:
+        list: (start, end, is_heading) character spans into text
+    """
+    blocks = []
+    position = 0
+    for separator in list(BLOCK_SEPARATOR.finditer(text)) + [None]:
+        end = separator.start() if separator else len(text)
+        paragraph_start = position
+        # A heading glued to the paragraph below it still opens a new section
+        for line in re.finditer(r"[^\n]+", text[paragraph_start:end]):
+            if HEADING_PATTERN.match(line.group()):
+                line_start = paragraph_start + line.start()
+                if line_start > position and text[position:line_start].strip():
+                    blocks.append((position, line_start, False))
+                blocks.append((line_start, paragraph_start + line.end(), True))
+                position = paragraph_start + line.end()
+        if text[position:end].strip():
+            blocks.append((position, end, False))
+        position = separator.end() if separator else len(text)
+    return [(start + _leading_space(text, start, end), end, heading) for start, end, heading in blocks]
+
+
+def _leading_space(text, start, end):
+    stripped = text[start:end]
+    return len(stripped) - len(stripped.lstrip())
+
+
+def _hard_split(text: str, start: int, end: int, max_tokens: int):
+    """
+    Cut an unbreakable span, such as a long URL or token, into consecutive pieces of at most max_tokens
+    """
+    spans = []
+    while start < end:
+        # Longest prefix within the budget, at least one character
+        low, high = start + 1, end
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[start:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        spans.append((start, low))
+        start = low
+    return spans
+
+
+def _split_long_block(text: str, start: int, end: int, max_tokens: int, overlap_tokens: int,
+                      first_max_tokens: int = None):
+    """
+    Cut a block that alone exceeds the budget into overlapping windows of words
+    :param first_max_tokens: Budget of the first window, when part of its chunk is taken by a heading.
+    """
+    budget = max_tokens if first_max_tokens is None else max(1, min(first_max_tokens, max_tokens))
+    words = []
+    for m in WORD_PATTERN.finditer(text[start:end]):
+        word_start, word_end = start + m.start(), start + m.end()
+        if count_tokens(text[word_start:word_end]) > budget:
+            words.extend(_hard_split(text, word_start, word_end, budget))
+        else:
+            words.append((word_start, word_end))
+    spans = []
+    first = 0
+    while first < len(words):
+        last = first
+        while last + 1 < len(words) and count_tokens(text[words[first][0]:words[last + 1][1]]) <= budget:
+            last += 1
+        spans.append((words[first][0], words[last][1]))
+        budget = max_tokens
+        if last + 1 >= len(words):
+            break
+        # Step back so the next window repeats roughly overlap_tokens of this one
+        next_first = last + 1
+        while next_first - 1 > first and count_tokens(text[words[next_first - 1][0]:words[last][1]]) <= overlap_tokens:
+            next_first -= 1
+        first = next_first
+    return spans
+
+
+def chunk_page(text: str, page: int, max_tokens: int = 300, overlap_tokens: int = 50):
+    """
+    Chunk one OCR page by headings and paragraphs within a token budget
+
+    Args:
+        text (str): Markdown text of the page
+        page (int): 1-based page number
+        max_tokens (int): Maximum tokens per chunk
+        overlap_tokens (int): Tokens of trailing context repeated at the start of the next chunk in a section
+
+    Returns:
+        list: Chunks with text, page, chunk_index, char_start and char_end
+    """
+    pieces = []
+    for start, end, heading in split_blocks(text):
+        if heading and count_tokens(text[start:end]) <= max_tokens:
+            pieces.append((start, end, True))
+            continue
+        # The headings right above a block must fit in its first chunk, so their tokens are reserved
+        lead = start
+        for previous_start, _, previous_heading in reversed(pieces):
+            if not previous_heading:
+                break
+            lead = previous_start
+        if count_tokens(text[lead:end]) > max_tokens:
+            # One token of slack for merges across the heading boundary
+            reserved = count_tokens(text[lead:start]) + 1 if lead < start else 0
+            pieces.extend((s, e, False) for s, e in _split_long_block(text, start, end, max_tokens, overlap_tokens,
+                                                                      first_max_tokens=max_tokens - reserved))
+        else:
+            pieces.append((start, end, False))
+
+    spans = []
+    current = []
+
+    def flush():
+        if current and not all(heading for _, _, heading in current):
+            spans.append((current[0][0], current[-1][1]))
+
+    for piece in pieces:
+        start, end, heading = piece
+        if heading:
+            # A heading opens a new section: no overlap is carried across it
+            if current and all(previous[2] for previous in current):
+                current.append(piece)
+            else:
+                flush()
+                current = [piece]
+            continue
+        if current and count_tokens(text[current[0][0]:end]) > max_tokens:
+            flush()
+            # Carry trailing paragraphs of the previous chunk as overlap, keeping the section heading
+            carried = []
+            for previous in reversed(current):
+                if previous[2] or count_tokens(text[previous[0]:current[-1][1]]) > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+            if current[0][2] and count_tokens(text[current[0][0]:current[0][1]]) < max_tokens // 4:
+                carried.insert(0, current[0])
+            current = carried
+            while len(current) > 1 and count_tokens(text[current[0][0]:end]) > max_tokens:
+                current.pop(0 if not current[0][2] else 1)
+            if current and count_tokens(text[current[0][0]:end]) > max_tokens:
+                current = []
+        current.append(piece)
+    flush()
+
+    return [
+        {
+            "text": text[start:end],
+            "page": page,
+            "chunk_index": index,
+            "char_start": start,
+            "char_end": end,
+        }
+        for index, (start, end) in enumerate(spans)
+    ]
@@ -3,39 +3,81 @@
 Format the queries to fit the request format for endpoints
 """
 from datetime import datetime
+from core.config import EMBEDDING_STORAGE, EMBEDDINGS_SIZE
+from utils.tokens import count_tokens
+from utils.vectors import encode_embedding
 
 def format_inserts(data):
     """
-    Format the query to insert into MongoDB
+    Format the query to insert into MongoDB, storing the embedding in the EMBEDDING_STORAGE format
     """
-    return {
+    document = {
+        "doc_id": data.get("doc_id"),
         "text": data["content"],
         "reference": data["reference"],
+        "page": data.get("page"),
+        "chunk_index": data.get("chunk_index"),
+        "char_start": data.get("char_start"),
+        "char_end": data.get("char_end"),
         "timestamp": datetime.now(),
-        "document_embedding": data["document_embedding"],
+        "document_embedding": encode_embedding(data["document_embedding"], EMBEDDING_STORAGE, EMBEDDINGS_SIZE),
+        "embedding_model": data.get("embedding_model"),
+        "content_hash": data.get("content_hash"),
+        "file_hash": data.get("file_hash"),
     }
+    # Verse records carry their position for the (chapter, verse) index; chunk records leave it out of the index
+    if data.get("verse") is not None:
+        document["chapter"] = data["chapter"]
+        document["verse"] = data["verse"]
+    return document
 
-def format_context_list(search_results):
+def format_context_list(search_results, max_tokens: int = None, return_used: bool = False):
     """
     Format search results into a markdown-friendly context string
     
     Args:
-        search_results (list): List of search results
+        search_results (list): List of search results, best first
+        max_tokens (int): Token budget for the context; the best chunks that fit are kept
+        return_used (bool): Also return the results that made it into the context
         
     Returns:
-        str: Formatted context string
+        str: Formatted context string, or (context, used results) with return_used
     """
     if not search_results:
-        return "No relevant information found."
+        return ("No relevant information found.", []) if return_used else "No relevant information found."
     
-    # Format each result into clean markdown
+    # Format each result into clean markdown, skipping repeated text and chunks that overflow the budget
     formatted_results = []
+    used = []
+    seen = set()
+    used_tokens = 0
     for result in search_results:
         if "text" in result and "reference" in result:
-            # Clean up the markdown text by removing the technical dimensions part
-            content = result['text'].split("mensions")[0] if "mensions" in result['text'] else result['text']
-            formatted_results.append(f"### {result['reference']}\n\n{content.strip()}\n")
+            content = result['text'].strip()
+            if content in seen:
+                continue
+            formatted = f"### {result['reference']}\n\n{content}\n"
+            tokens = count_tokens(formatted)
+            if max_tokens is not None and used_tokens + tokens > max_tokens:
+                continue
+            seen.add(content)
+            used_tokens += tokens
+            formatted_results.append(formatted)
+            used.append(result)
     
     # Join all formatted results
     context = "\n".join(formatted_results)
-    return context
+    return (context, used) if return_used else context
+
+
+def format_references(search_results):
+    """
+    Describe the chunks a context was built from, with the document and page each came from so clients can
+    show and link to its source
+    """
+    return [{
+        "reference": result["reference"],
+        "content": result["text"].strip(),
+        "doc_id": result.get("doc_id"),
+        "page": result.get("page"),
+    } for result in search_results]
@@ -2,11 +2,190 @@
 This file contains the utility functions to read the pdf file and get the response from the google client.
 """
 
-from google.genai import types
-from google.genai import Client as GoogleClient
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from core.config import PDF_SPLIT_WORKERS, PDF_PAGES_PER_TASK, PDF_READ_CONCURRENCY, GEMINI_MODEL
+from typing import TYPE_CHECKING
+from functools import partial
 import PyPDF2
+import asyncio
 import io
 import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# The Gemini SDK is slow to import, so it is only loaded when a page is actually sent to Gemini
+if TYPE_CHECKING:
+    from google.genai import Client as GoogleClient
+
+def _open_pdf(source):
+    """
+    Open a PDF from a file path or from bytes
+    """
+    return PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+
+def count_pdf_pages(source):
+    """
+    Count the pages of a PDF given as a file path or bytes.
+    """
+    return len(_open_pdf(source).pages)
+
+def _split_page_range(path, start, stop):
+    """
+    Write pages [start, stop) of the PDF at path as single-page PDFs. Runs in a worker process.
+    """
+    pdf_reader = _open_pdf(path)
+    pages = []
+    for index in range(start, stop):
+        output = io.BytesIO()
+        pdf_writer = PyPDF2.PdfWriter()
+        pdf_writer.add_page(pdf_reader.pages[index])
+        pdf_writer.write(output)
+        pages.append(output.getvalue())
+    return pages
+
+def _render_thumbnail_range(path, start, stop, width, image_format):
+    """
+    Render pages [start, stop) of the PDF at path as images width pixels wide, or None per page
+    when pypdfium2 is not installed. Runs in a worker process.
+    """
+    try:
+        import pypdfium2
+    except ImportError:
+        return [None] * (stop - start)
+    pdf = pypdfium2.PdfDocument(path)
+    thumbnails = []
+    try:
+        for index in range(start, stop):
+            page = pdf[index]
+            try:
+                image = page.render(scale=width / page.get_width()).to_pil()
+                output = io.BytesIO()
+                image.save(output, format=image_format)
+                thumbnails.append(output.getvalue())
+            except Exception:
+                thumbnails.append(None)
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+    return thumbnails
+
+def _page_preview_range(path, start, stop, width, image_format):
+    """
+    Single-page PDF and thumbnail of pages [start, stop) of the PDF at path. Runs in a worker process.
+    """
+    return list(zip(_split_page_range(path, start, stop),
+                    _render_thumbnail_range(path, start, stop, width, image_format)))
+
+def _extract_text_range(path, start, stop):
+    """
+    Extract the text layer of pages [start, stop) of the PDF at path. Runs in a worker process.
+
+    Returns:
+        list: (text, latency_ms) for each page
+    """
+    pdf_reader = _open_pdf(path)
+    results = []
+    for index in range(start, stop):
+        page_start = time.perf_counter()
+        try:
+            text = pdf_reader.pages[index].extract_text() or ""
+        except Exception:
+            text = ""
+        results.append((text, (time.perf_counter() - page_start) * 1000))
+    return results
+
+def _map_page_ranges(source, worker, max_workers: int, pages_per_task: int, max_pending_tasks: int = None):
+    """
+    Run worker(path, start, stop) over page ranges in a process pool, yielding per-page results in order.
+
+    Bytes are spooled once to a temporary file so each task only pickles a path.
+    """
+    temp_path = None
+    if not isinstance(source, str):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+            temp_file.write(source)
+            temp_path = source = temp_file.name
+    try:
+        page_count = count_pdf_pages(source)
+        ranges = deque((start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task))
+        max_pending_tasks = max_pending_tasks or 2 * max_workers
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            while ranges or pending:
+                while ranges and len(pending) < max_pending_tasks:
+                    start, stop = ranges.popleft()
+                    pending.append((start, executor.submit(worker, source, start, stop)))
+                start, future = pending.popleft()
+                for offset, result in enumerate(future.result()):
+                    yield start + offset, result
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+def iter_pdf_pages(source, max_workers: int = PDF_SPLIT_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK,
+                   max_pending_tasks: int = None):
+    """
+    Split a PDF into single-page PDFs in a process pool, yielding pages lazily and in page order.
+
+    Only a bounded window of page ranges is in flight at once, so memory stays flat for large files.
+
+    Args:
+        source (str | bytes): Path to the PDF, or its bytes (spooled to a temporary file for the workers)
+        max_workers (int): Worker processes used for splitting
+        pages_per_task (int): Pages each worker writes per task
+        max_pending_tasks (int): Tasks submitted ahead of the consumer, defaults to twice the workers
+
+    Yields:
+        tuple: (page_index, page_bytes)
+    """
+    yield from _map_page_ranges(source, _split_page_range, max_workers, pages_per_task, max_pending_tasks)
+
+def iter_pdf_text(source, max_workers: int = PDF_SPLIT_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+    """
+    Extract each page's embedded text layer in a process pool, in page order.
+
+    Args:
+        source (str | bytes): Path to the PDF, or its bytes
+
+    Yields:
+        tuple: (page_index, (text, latency_ms))
+    """
+    yield from _map_page_ranges(source, _extract_text_range, max_workers, pages_per_task)
+
+def iter_page_previews(source, width: int = 320, image_format: str = "webp",
+                       max_workers: int = PDF_SPLIT_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+    """
+    Split a PDF into single-page PDFs and render a thumbnail of each page in a process pool, in page order.
+    Thumbnails need the optional pypdfium2 package and are None without it.
+
+    Args:
+        source (str | bytes): Path to the PDF, or its bytes
+        width (int): Thumbnail width in pixels; the height follows the page's aspect ratio
+        image_format (str): Pillow image format of the thumbnails
+
+    Yields:
+        tuple: (page_index, (page_bytes, thumbnail_bytes or None))
+    """
+    worker = partial(_page_preview_range, width=width, image_format=image_format)
+    yield from _map_page_ranges(source, worker, max_workers, pages_per_task)
+
+def extract_pages(source, indexes):
+    """
+    Build a PDF holding only the given 0-based pages of source, in the order given.
+    """
+    pdf_reader = _open_pdf(source)
+    pdf_writer = PyPDF2.PdfWriter()
+    for index in indexes:
+        pdf_writer.add_page(pdf_reader.pages[index])
+    output = io.BytesIO()
+    pdf_writer.write(output)
+    return output.getvalue()
 
 def get_pdf_in_bytes(pdf_bytes):
     """
@@ -18,18 +197,7 @@ def get_pdf_in_bytes(pdf_bytes):
     Returns:
         list: PDF file pages in bytes
     """
-    
-    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-    # Get individual pages as bytes
-    pdf_bytes_pages = []
-    for page in pdf_reader.pages:
-        output = io.BytesIO()
-        pdf_writer = PyPDF2.PdfWriter()
-        pdf_writer.add_page(page)
-        pdf_writer.write(output)
-        pdf_bytes_pages.append(output.getvalue())
-
-    return pdf_bytes_pages
+    return [page for _, page in iter_pdf_pages(pdf_bytes)]
 
 
 from pydantic import BaseModel, field_validator
@@ -58,7 +226,7 @@ class DocumentParser(BaseModel):
         return value
 
 
-def read_from_pdf_in_bytes(page, google_client: GoogleClient, system_prompt):
+def read_from_pdf_in_bytes(page, google_client: "GoogleClient", system_prompt, model: str = GEMINI_MODEL):
     """
     Read the content of the pdf in bytes and return the response from the google client.
 
@@ -66,11 +234,13 @@ def read_from_pdf_in_bytes(page, google_client: GoogleClient, system_prompt):
     param google_client: genai.Client
     param system_prompt: str
     param pages: list
+    param model: str
 
     return: genai.Response
     """
+    from google.genai import types
     response = google_client.models.generate_content(
-        model="gemini-2.0-flash",
+        model=model,
         contents=[
             types.Part.from_bytes(
                 data=page,
@@ -85,7 +255,51 @@ def read_from_pdf_in_bytes(page, google_client: GoogleClient, system_prompt):
         json_obj = json.loads(response.text)
         return json_obj
     except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {str(e)}")
+        logger.warning(f"Error decoding JSON from {model}: {e}")
         return {"reference": "", "text": ""}
 
-    
+
+async def read_pdf_pages(pages, google_client: "GoogleClient", system_prompt, max_concurrency: int = PDF_READ_CONCURRENCY,
+                         model: str = GEMINI_MODEL, read_page=None):
+    """
+    Run read_from_pdf_in_bytes over many pages concurrently, yielding results in page order.
+
+    Pages are pulled lazily from the iterable (e.g. iter_pdf_pages), so at most max_concurrency
+    pages are held in memory while their generate_content calls are in flight.
+
+    param pages: iterable of (page_index, page_bytes)
+    param google_client: genai.Client
+    param system_prompt: str
+    param max_concurrency: int
+    param model: str
+    param read_page: async function (page_index, page_bytes) -> parsed JSON wrapping the call, e.g. with retries;
+        defaults to read_from_pdf_in_bytes in a worker thread
+
+    return: async generator of (page_index, parsed JSON)
+    """
+    iterator = iter(pages)
+    exhausted = object()
+    in_flight = deque()
+
+    async def next_page():
+        return await asyncio.to_thread(next, iterator, exhausted)
+
+    async def read(index, page):
+        if read_page is not None:
+            return index, await read_page(index, page)
+        return index, await asyncio.to_thread(read_from_pdf_in_bytes, page, google_client, system_prompt, model)
+
+    try:
+        while True:
+            while len(in_flight) < max_concurrency:
+                item = await next_page()
+                if item is exhausted:
+                    break
+                in_flight.append(asyncio.create_task(read(*item)))
+            if not in_flight:
+                break
+            yield await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
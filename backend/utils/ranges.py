@@ -0,0 +1,69 @@
+"""
+HTTP byte-range and ETag helpers for serving stored files
+"""
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    The requested byte range lies entirely outside the file
+    """
+
+
+def parse_range_header(header: str, length: int):
+    """
+    Parse a single-range Range header ("bytes=0-499", "bytes=500-", "bytes=-500")
+    Args:
+        header (str): Value of the Range header
+        length (int): Size of the file in bytes
+
+    Returns:
+        tuple: Inclusive (start, end) byte positions, or None to serve the whole file
+            (no header, another unit, several ranges or a malformed value)
+
+    Raises:
+        RangeNotSatisfiable: If the range starts past the end of the file
+    """
+    if not header or length <= 0:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, length - suffix), length - 1
+        start = int(first)
+        end = int(last) if last else length - 1
+    except ValueError:
+        return None
+    if start >= length:
+        raise RangeNotSatisfiable(header)
+    if start > end:
+        return None
+    return start, min(end, length - 1)
+
+
+def file_etag(file_id, md5: str = None, upload_date=None, length: int = None) -> str:
+    """
+    Strong ETag for a stored file: its md5 when GridFS recorded one, else its id, upload date and size
+    """
+    if md5:
+        return f'"{md5}"'
+    stamp = int(upload_date.timestamp() * 1000) if upload_date else 0
+    return f'"{file_id}-{stamp}-{length}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+    Check an If-None-Match or If-Range header against an ETag, ignoring weak validator prefixes
+    """
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
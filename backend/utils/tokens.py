@@ -0,0 +1,83 @@
+"""
+Token counting shared by chunking and prompt assembly
+
+Counts use tiktoken's cl100k_base, OpenAI's tokenizer. Gemini and Mistral tokenize differently, so for their models
+the counts are close estimates rather than exact, which is enough for budgeting chunks and prompts with some headroom.
+"""
+from core.config import TOKENIZER_RETRY_INTERVAL
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = "cl100k_base"
+
+_encoding_lock = threading.Lock()
+_loaded = None
+_failed_at = None
+
+
+def _encoding():
+    """
+    The tiktoken encoding, or None while tiktoken or its BPE file is unavailable. A failed load is retried after
+    TOKENIZER_RETRY_INTERVAL seconds, e.g. once the network is back, instead of estimating for the life of the process.
+    """
+    global _loaded, _failed_at
+    if _loaded is not None:
+        return _loaded
+    with _encoding_lock:
+        if _loaded is None and (_failed_at is None or time.monotonic() - _failed_at >= TOKENIZER_RETRY_INTERVAL):
+            try:
+                import tiktoken
+                _loaded = tiktoken.get_encoding(ENCODING_NAME)
+                if _failed_at is not None:
+                    logger.info(f"Loaded the {ENCODING_NAME} tokenizer, token counts are exact again")
+                _failed_at = None
+            except Exception as e:
+                _failed_at = time.monotonic()
+                logger.warning(f"tiktoken unavailable ({e}), estimating tokens as 4 characters each; "
+                               f"token budgets will be approximate. Retrying in {TOKENIZER_RETRY_INTERVAL:.0f}s")
+    return _loaded
+
+
+def load_tokenizer() -> bool:
+    """
+    Load the encoding ahead of the first count, e.g. at startup so a fallback is logged straight away
+    Returns:
+        bool: Whether token counts will be exact
+    """
+    return _encoding() is not None
+
+
+def tokenizer_is_approximate() -> bool:
+    """
+    Whether the last attempt to load the encoding failed, so counts are 4-characters-per-token estimates
+    """
+    return _loaded is None and _failed_at is not None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in text with cl100k_base, falling back to a 4-characters-per-token estimate
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keep the beginning of text that fits in max_tokens
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
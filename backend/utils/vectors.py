@@ -0,0 +1,106 @@
+"""
+Compact storage for chunk embeddings: Matryoshka truncation and BSON binary vectors
+"""
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+import numpy as np
+
+#: Storage formats for document_embedding: a BSON array of doubles, or a BSON binary vector
+EMBEDDING_STORAGE_FORMATS = ("array", "float32", "int8")
+
+
+def embedding_key(model: str, dimensions: int = None, storage: str = "array") -> str:
+    """
+    Name how stored vectors were produced, e.g. "text-embedding-004@256/int8", so only vectors of the same model,
+    truncation and storage format are reused; the model@dimensions part matches the embedding cache key
+    """
+    model_key = f"{model}@{dimensions}" if dimensions else f"{model}"
+    return f"{model_key}/{storage}"
+
+
+def parse_embedding_key(key: str):
+    """
+    Split an embedding_key into (model, dimensions, storage). Keys stored before storage was recorded are a
+    bare model name and give (model, None, None).
+    """
+    storage = None
+    base, _, suffix = (key or "").rpartition("/")
+    if base and suffix in EMBEDDING_STORAGE_FORMATS:
+        key, storage = base, suffix
+    model, _, dimensions = (key or "").partition("@")
+    return model, int(dimensions) if dimensions.isdigit() else None, storage
+
+
+def truncate_embedding(embedding, dimensions: int = None):
+    """
+    Keep the first dimensions of a Matryoshka embedding and scale it back to unit length
+    Args:
+        embedding (list): Embedding as returned by the model
+        dimensions (int): Dimensions to keep, or all when 0/None or not smaller than the embedding
+
+    Returns:
+        list: The embedding, truncated and renormalized when shortened
+    """
+    if not dimensions or len(embedding) <= dimensions:
+        return embedding
+    vector = np.asarray(embedding[:dimensions], dtype=np.float64)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def quantize_int8(embedding):
+    """
+    Scalar-quantize an embedding to int8, scaling each vector so its largest component maps to 127
+
+    The per-vector scale is dropped; cosine similarity does not depend on it.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    if peak:
+        vector = vector * (127 / peak)
+    return np.clip(np.rint(vector), -127, 127).astype(np.int8).tolist()
+
+
+def encode_embedding(embedding, storage: str = "float32", dimensions: int = None):
+    """
+    Convert an embedding to the value stored in document_embedding
+    Args:
+        embedding (list | Binary): Embedding from the model, or a value already read back from MongoDB
+        storage (str): "array" (BSON doubles), "float32" or "int8" (BSON binary vectors)
+        dimensions (int): Truncate to this many dimensions first, when set
+
+    Returns:
+        list | Binary: The value to store
+    """
+    if storage not in EMBEDDING_STORAGE_FORMATS:
+        raise ValueError(f"Unsupported embedding storage: {storage}")
+    if storage != "array" and embedding_storage_of(embedding) == storage \
+            and (not dimensions or len(decode_embedding(embedding)) <= dimensions):
+        # Already stored this way, e.g. a vector reused from another chunk: copy it unchanged
+        return embedding
+    embedding = truncate_embedding(decode_embedding(embedding), dimensions)
+    if storage == "float32":
+        return Binary.from_vector(np.asarray(embedding, dtype=np.float32).tolist(), BinaryVectorDtype.FLOAT32)
+    if storage == "int8":
+        return Binary.from_vector(quantize_int8(embedding), BinaryVectorDtype.INT8)
+    return [float(value) for value in embedding]
+
+
+def decode_embedding(value):
+    """
+    Read a stored document_embedding back as a list of numbers, whatever format it was stored in
+
+    int8 vectors come back as their quantized integers, which rank the same under cosine similarity.
+    """
+    if isinstance(value, Binary) and value.subtype == VECTOR_SUBTYPE:
+        return value.as_vector().data
+    return list(value)
+
+
+def embedding_storage_of(value) -> str:
+    """
+    Name the storage format of a stored document_embedding
+    """
+    if isinstance(value, Binary) and value.subtype == VECTOR_SUBTYPE:
+        dtype = BinaryVectorDtype(bytes(value[:1]))
+        return {BinaryVectorDtype.FLOAT32: "float32", BinaryVectorDtype.INT8: "int8"}.get(dtype, dtype.name.lower())
+    return "array"
@@ -0,0 +1,79 @@
+"""
+Chapter:verse references for structured (verse) ingestion and direct verse lookups
+"""
+import logging
+import re
+
+from pydantic import ValidationError
+
+from utils.pdf_reader import DocumentParser
+
+logger = logging.getLogger(__name__)
+
+# "2:255" or a range within one chapter, "2:255-257"
+REFERENCE_PATTERN = re.compile(r"^\s*([1-9]\d*)\s*:\s*([1-9]\d*)(?:\s*-\s*([1-9]\d*))?\s*$")
+
+
+def parse_reference(value: str):
+    """
+    Parse a verse reference
+    Args:
+        value (str): "chapter:verse" or "chapter:first-last"
+
+    Returns:
+        tuple: (chapter, first verse, last verse), or None when value is not a reference
+    """
+    match = REFERENCE_PATTERN.match(value or "")
+    if match is None:
+        return None
+    chapter, first = int(match.group(1)), int(match.group(2))
+    last = int(match.group(3)) if match.group(3) else first
+    if last < first:
+        return None
+    return chapter, first, last
+
+
+def verse_records(items, page: int):
+    """
+    Validate the verses Gemini extracted from one page with DocumentParser
+    Args:
+        items (list | dict): Parsed JSON returned by read_from_pdf_in_bytes for the page
+        page (int): 1-based page number
+
+    Returns:
+        tuple: (records with chapter, verse, reference, text and page; number of items rejected)
+    """
+    if isinstance(items, dict):
+        items = [items]
+    records = []
+    rejected = 0
+    for item in items or []:
+        try:
+            parsed = DocumentParser(**item)
+        except (TypeError, ValidationError) as e:
+            rejected += 1
+            logger.debug(f"Skipping verse on page {page}: {e}")
+            continue
+        if not parsed.text.strip():
+            rejected += 1
+            continue
+        chapter, verse = (int(part) for part in parsed.reference.split(":"))
+        records.append({"chapter": chapter, "verse": verse, "reference": parsed.reference,
+                        "text": parsed.text.strip(), "page": page})
+    return records, rejected
+
+
+def merge_verses(records):
+    """
+    Join the parts of verses that continue across pages, keeping the page each verse starts on
+    Returns:
+        list: One record per (chapter, verse), in reading order
+    """
+    merged = {}
+    for record in records:
+        key = (record["chapter"], record["verse"])
+        if key in merged:
+            merged[key]["text"] = f"{merged[key]['text']} {record['text']}"
+        else:
+            merged[key] = dict(record)
+    return list(merged.values())
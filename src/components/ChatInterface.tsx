@@ -21,6 +21,8 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ files }) => {
   const [isLoading, setIsLoading] = useState(false);
   const [references, setReferences] = useState<Reference[]>([]);
   const [showReferences, setShowReferences] = useState(false);
+  // Lets the backend summarize older turns once and reuse chunks across turns
+  const [conversationId, setConversationId] = useState(() => crypto.randomUUID());
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const { toast } = useToast();
   
@@ -70,6 +72,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ files }) => {
       const response = await api.generateResponse({
         messages: messageHistory,
         top_searches: 5,
+        conversation_id: conversationId,
       });
 
       const assistantMessage: ChatMessage = {
@@ -81,8 +84,8 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ files }) => {
 
       setMessages((prev) => [...prev, assistantMessage]);
       
-      if (response.retrievedVerses && response.retrievedVerses.length > 0) {
-        setReferences(response.retrievedVerses);
+      if (response.references && response.references.length > 0) {
+        setReferences(response.references);
       } else {
         setReferences([]);
       }
@@ -111,6 +114,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ files }) => {
     setMessages([]);
     setReferences([]);
     setShowReferences(false);
+    setConversationId(crypto.randomUUID());
     
     toast({
       title: "Chat cleared",
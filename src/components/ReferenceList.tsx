@@ -3,6 +3,7 @@ import React from "react";
 import { Reference } from "@/types";
 import { Separator } from "@/components/ui/separator";
 import { BookOpen, X } from "lucide-react";
+import { api } from "@/services/api";
 
 interface ReferenceListProps {
   references: Reference[];
@@ -44,6 +45,22 @@ const ReferenceList: React.FC<ReferenceListProps> = ({
               <div className="reference-tag mb-2">
                 {ref.reference}
               </div>
+              {ref.doc_id && ref.page && (
+                <a
+                  href={api.getPagePreviewUrl(ref.doc_id, ref.page)}
+                  target="_blank"
+                  rel="noopener noreferrer"
+                  className="block mb-2"
+                >
+                  <img
+                    src={api.getPageThumbnailUrl(ref.doc_id, ref.page)}
+                    alt={`${ref.reference} preview`}
+                    loading="lazy"
+                    className="max-h-40 rounded border border-border"
+                    onError={(event) => { event.currentTarget.style.display = "none"; }}
+                  />
+                </a>
+              )}
               <p className="text-sm text-foreground/80">{ref.content}</p>
             </li>
           ))}
@@ -99,6 +99,12 @@ export const api = {
       }
 
       const result = await response.json();
+
+      // Indexing runs as a background job; wait for it so callers get the final page count
+      if (result.job_id && result.status !== "indexed") {
+        const job = await api.waitForJob(result.job_id);
+        return { ...result, ...job.result, status: "indexed" };
+      }
       return result;
     } catch (error) {
       console.error("Error uploading PDF:", error);
@@ -106,15 +112,55 @@ export const api = {
     }
   },
 
+  async waitForJob(jobId: string, intervalMs: number = 1000): Promise<any> {
+    const url = API_URL ? `${API_URL}/jobs/${jobId}` : `/jobs/${jobId}`;
+    while (true) {
+      const response = await fetch(url);
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Failed to fetch indexing job: ${errorText}`);
+      }
+
+      const job = await response.json();
+      if (job.status === "done") {
+        return job;
+      }
+      if (job.status === "failed") {
+        throw new Error(`Indexing failed: ${job.error}`);
+      }
+      if (job.status === "cancelled") {
+        throw new Error("Indexing was cancelled because the document was deleted");
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  },
+
   getPdfUrl: (fileId: string) => {
     const path = `/preview-pdf/${fileId}`;
     // Use full URL to ensure correct path resolution
     return API_URL ? `${API_URL}${path}` : new URL(path, window.location.origin).href;
   },
   
+  getPagePreviewUrl: (fileId: string, page: number) => {
+    const path = `/preview-pdf/${fileId}/page/${page}`;
+    return API_URL ? `${API_URL}${path}` : new URL(path, window.location.origin).href;
+  },
+
+  getPageThumbnailUrl: (fileId: string, page: number) => {
+    const path = `/preview-pdf/${fileId}/page/${page}/thumbnail`;
+    return API_URL ? `${API_URL}${path}` : new URL(path, window.location.origin).href;
+  },
+
   async deleteFile(fileId: string): Promise<boolean> {
     try {
-      console.log(`File ${fileId} would be deleted on the server`);
+      const url = API_URL ? `${API_URL}/documents/${fileId}` : `/documents/${fileId}`;
+      const response = await fetch(url, { method: "DELETE" });
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Failed to delete file: ${errorText}`);
+      }
+
       return true;
     } catch (error) {
       console.error("Error deleting file:", error);
@@ -12,12 +12,30 @@ export interface ChatMessage extends Message {
 export interface Reference {
   content: string;
   reference: string;
+  doc_id?: string | null;
+  page?: number | null;
+}
+
+export interface TurnUsage {
+  prompt_tokens: number;
+  completion_tokens: number;
+  context_tokens: number;
+  history_tokens: number;
+  messages_kept: number;
+  messages_summarized: number;
+  messages_in_summary: number;
+  messages_dropped: number;
+  chunks_from_earlier_turns: number;
+  latency_ms: Record<string, number>;
 }
 
 export interface APIResponse {
   response: string;
   context?: string;
-  retrievedVerses?: Reference[];
+  cached?: boolean;
+  usage?: TurnUsage;
+  // Chunks the answer's context was built from, with the document and page each came from
+  references?: Reference[];
 }
 
 export interface FileInfo {
@@ -37,4 +55,7 @@ export interface GenerateRequest {
   top_searches?: number;
   model?: string;
   max_tokens?: number;
+  doc_ids?: string[];
+  stream?: boolean;
+  conversation_id?: string;
 }